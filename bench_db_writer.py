@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import tempfile
+
+"""
+数据库写入性能测试脚本
+对比逐行 SELECT + UPDATE/INSERT（旧实现）与 FeatureWriter 的 executemany UPSERT（新实现）的写入速度（行/秒）
+每个规模测试两个阶段：首次扫描（全部插入）和再次扫描（90%的文件只更新检查时间，10%的文件全面更新）
+
+用法: python bench_db_writer.py [行数列表，逗号分隔] [批次大小]
+例如: python bench_db_writer.py 10000,1000000,10000000 1000
+"""
+
+from filedup.global_vars import set_log_level, LOG_LEVEL_WARN
+from filedup.file_duplicate_finder import FileDuplicateFinder
+from filedup.db_writer import is_writable, is_touch_only
+
+DEFAULT_SIZES = (10000, 1000000, 10000000)
+# 旧实现在千万行规模下耗时过长，超过该行数时只测试新实现
+LEGACY_MAX_ROWS = 1000000
+
+
+def make_attributes(index, rescan):
+    """生成第index个文件的属性；再次扫描时每10个文件中有1个内容变化"""
+    changed = rescan and index % 10 == 0
+    return {
+        'file_path': f"/bench/dir_{index // 1000}/file_{index}.dat",
+        'file_size': index * 7 + (1 if changed else 0),
+        'ctime_ns': 1704067200000000000,
+        'mtime_ns': 1717243200000000000 if changed else 1704067200000000000,
+        'atime_ns': 1704067200000000000,
+        'owner': 'bench',
+        'device': 2049,
+        'inode': index + 1,
+        'nlink': 1,
+        'file_hash': f"md5:{index:032x}",
+        'last_checked': 1717286400000000000 if rescan else 1704153600000000000,
+        'needs_update': not rescan or changed,
+        'hash_deferred': False,
+        'extra_hashes': {},
+    }
+
+
+def legacy_save(finder, attributes_list):
+    """旧实现：事务内逐行SELECT判断记录是否存在，再执行单行UPDATE或INSERT"""
+    cursor = finder.cursor
+    columns = finder.writer.columns[1:]
+    cursor.execute('BEGIN TRANSACTION')
+    for attributes in attributes_list:
+        if not is_writable(attributes):
+            continue
+        path = os.path.normpath(attributes['file_path'])
+        cursor.execute("SELECT id FROM file_features WHERE file_path = ?", (path,))
+        values = list(finder.writer.feature_row(attributes)[1:])
+        if cursor.fetchone():
+            if is_touch_only(attributes):
+                cursor.execute("UPDATE file_features SET last_checked = ? WHERE file_path = ?",
+                               (attributes['last_checked'], path))
+                continue
+            cursor.execute(f"UPDATE file_features SET {', '.join(f'{c} = ?' for c in columns)} WHERE file_path = ?",
+                           values + [path])
+        else:
+            cursor.execute(f"INSERT INTO file_features (file_path, {', '.join(columns)}) "
+                           f"VALUES ({', '.join('?' * (len(columns) + 1))})", [path] + values)
+    finder.conn.commit()
+
+
+def run_phase(finder, save, total_rows, batch_size, rescan):
+    """按批次生成并写入total_rows行，返回写入耗时（不含生成属性的时间）"""
+    elapsed = 0.0
+    for start in range(0, total_rows, batch_size):
+        batch = [make_attributes(i, rescan) for i in range(start, min(start + batch_size, total_rows))]
+        begin = time.perf_counter()
+        save(batch)
+        elapsed += time.perf_counter() - begin
+    return max(elapsed, 1e-9)
+
+
+def run_bench(name, save_factory, total_rows, batch_size):
+    db_path = os.path.join(tempfile.gettempdir(), f"bench_db_writer_{name}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    finder = FileDuplicateFinder(db_path=db_path, batch_size=batch_size)
+    try:
+        save = save_factory(finder)
+        insert_time = run_phase(finder, save, total_rows, batch_size, rescan=False)
+        rescan_time = run_phase(finder, save, total_rows, batch_size, rescan=True)
+        stored = finder.cursor.execute("SELECT COUNT(*) FROM file_features").fetchone()[0]
+    finally:
+        finder.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    assert stored == total_rows, f"{name}: 写入 {stored} 行，应为 {total_rows} 行"
+    print(f"{name:<8} 行数: {total_rows:>9}  首次扫描: {insert_time:8.2f}s {total_rows / insert_time:10.0f} 行/s  "
+          f"再次扫描: {rescan_time:8.2f}s {total_rows / rescan_time:10.0f} 行/s")
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1].split(',')] if len(sys.argv) > 1 else DEFAULT_SIZES
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    set_log_level(LOG_LEVEL_WARN)
+    print(f"批次大小: {batch_size}")
+    for total_rows in sizes:
+        run_bench('upsert', lambda finder: finder.batch_save_file_attributes, total_rows, batch_size)
+        if total_rows <= LEGACY_MAX_ROWS:
+            run_bench('legacy', lambda finder: (lambda batch: legacy_save(finder, batch)), total_rows, batch_size)
+        else:
+            print(f"legacy   行数: {total_rows:>9}  跳过（超过 {LEGACY_MAX_ROWS} 行）")
+
+
+if __name__ == "__main__":
+    main()
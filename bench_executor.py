@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import shutil
+import random
+import tempfile
+
+"""
+扫描执行器性能测试脚本
+对比线程流水线（--executor thread）与多进程（--executor process）在不同文件大小分布下的扫描耗时
+
+用法: python bench_executor.py [文件数] [线程/进程数]
+"""
+
+from filedup.global_vars import set_log_level, LOG_LEVEL_WARN
+from filedup.file_duplicate_finder import FileDuplicateFinder
+
+# 文件大小分布：名称 -> 生成单个文件大小的函数
+DISTRIBUTIONS = {
+    '小文件(0~4KB)': lambda rng: rng.randint(0, 4 * 1024),
+    '混合(4KB~1MB)': lambda rng: int(rng.lognormvariate(10, 1.5)) % (1024 * 1024) + 4 * 1024,
+    '大文件(1~8MB)': lambda rng: rng.randint(1024 * 1024, 8 * 1024 * 1024),
+}
+
+
+def create_files(base_path, total_files, size_func):
+    """按大小分布生成测试文件，每100个文件一个子目录，返回总字节数"""
+    rng = random.Random(42)
+    total_size = 0
+    for i in range(total_files):
+        dir_path = os.path.join(base_path, f"dir_{i // 100}")
+        os.makedirs(dir_path, exist_ok=True)
+        size = size_func(rng)
+        with open(os.path.join(dir_path, f"file_{i}.dat"), "wb") as f:
+            f.write(os.urandom(size))
+        total_size += size
+    return total_size
+
+
+def run_bench(name, executor, directory_path, threads, total_size):
+    db_path = os.path.join(tempfile.gettempdir(), f"bench_executor_{executor}.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    finder = FileDuplicateFinder(db_path=db_path, max_threads=threads, executor=executor)
+    try:
+        start = time.perf_counter()
+        count = finder.scan_directory(directory_path)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+    finally:
+        finder.close()
+        os.remove(db_path)
+    print(f"{name:<16} {executor:<8} 文件数: {count:>8}  耗时: {elapsed:8.3f}s  "
+          f"{count / elapsed:10.1f} 文件/s  {total_size / elapsed / (1024 * 1024):8.1f} MB/s")
+    return count
+
+
+def main():
+    total_files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 4
+    set_log_level(LOG_LEVEL_WARN)
+    for name, size_func in DISTRIBUTIONS.items():
+        # 大文件分布只生成少量文件，避免占用过多磁盘空间
+        count = total_files if size_func(random.Random(0)) < 1024 * 1024 else max(threads * 4, total_files // 100)
+        base_path = tempfile.mkdtemp(prefix="bench_executor_")
+        try:
+            total_size = create_files(base_path, count, size_func)
+            thread_count = run_bench(name, 'thread', base_path, threads, total_size)
+            process_count = run_bench(name, 'process', base_path, threads, total_size)
+            assert thread_count == process_count, "两种执行器保存的文件数不一致！"
+        finally:
+            shutil.rmtree(base_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import threading
+import tracemalloc
+
+"""
+哈希读取性能测试脚本
+对比 file.read(block_size) 循环（旧实现）、hash_io.hash_file 的 readinto + 复用缓冲区（新实现）和 mmap 映射读取
+统计旧实现读取一个文件的read调用次数、各实现单文件读取的内存峰值（tracemalloc）和吞吐量（MB/s）
+
+用法: python bench_hash_io.py [文件大小MB] [文件数] [线程数]
+"""
+
+from filedup.hash_io import hash_file, DEFAULT_BLOCK_SIZE
+
+
+def hash_old(file_path):
+    """旧实现：每次read返回新分配的bytes对象"""
+    hasher = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        buf = file.read(DEFAULT_BLOCK_SIZE)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = file.read(DEFAULT_BLOCK_SIZE)
+    return hasher.hexdigest()
+
+
+def hash_new(file_path):
+    """新实现：readinto到线程复用的缓冲区，memoryview切片交给哈希对象"""
+    hasher = hashlib.md5()
+    hash_file(file_path, [hasher])
+    return hasher.hexdigest()
+
+
+def hash_mmap(file_path):
+    """mmap实现：映射文件后直接把映射区切片交给哈希对象"""
+    hasher = hashlib.md5()
+    hash_file(file_path, [hasher], mmap_threshold=1)
+    return hasher.hexdigest()
+
+
+def traced_peak(func, file_path):
+    """用tracemalloc统计处理单个文件期间新增内存的峰值"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func(file_path)
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return peak
+
+
+def run_bench(name, func, file_paths, threads):
+    # 预热一次，使新实现的线程缓冲区与页缓存状态一致
+    func(file_paths[0])
+    digests = {}
+    lock = threading.Lock()
+
+    def worker(paths):
+        for file_path in paths:
+            digest = func(file_path)
+            with lock:
+                digests[file_path] = digest
+
+    chunks = [file_paths[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    total_size = sum(os.path.getsize(p) for p in file_paths)
+    peak = traced_peak(func, file_paths[0])
+    print(f"{name:<26} 吞吐量: {total_size / elapsed / (1024 * 1024):9.1f} MB/s  "
+          f"单文件读取内存峰值: {peak / 1024:8.1f} KiB")
+    return digests
+
+
+def count_read_calls(file_path):
+    """统计旧实现读取一个文件时返回数据的read调用次数（只计调用次数，内存占用由traced_peak测量）"""
+    read_count = 0
+    with open(file_path, 'rb') as file:
+        while file.read(DEFAULT_BLOCK_SIZE):
+            read_count += 1
+    return read_count
+
+
+def main():
+    file_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    file_count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    base_path = tempfile.mkdtemp(prefix="bench_hash_io_")
+    file_paths = []
+    try:
+        for i in range(file_count):
+            file_path = os.path.join(base_path, f"file_{i}.dat")
+            with open(file_path, "wb") as f:
+                f.write(os.urandom(file_mb * 1024 * 1024))
+            file_paths.append(file_path)
+        print(f"测试目录: {base_path}，文件数: {file_count}，文件大小: {file_mb} MB，线程数: {threads}")
+        print(f"旧实现读取每个文件调用 {count_read_calls(file_paths[0])} 次 read({DEFAULT_BLOCK_SIZE})")
+        old = run_bench("read(block_size)", hash_old, file_paths, threads)
+        new = run_bench("hash_io.hash_file", hash_new, file_paths, threads)
+        mapped = run_bench("hash_io.hash_file(mmap)", hash_mmap, file_paths, threads)
+        assert old == new == mapped, "新旧实现的哈希值不一致！"
+        print("✓ 新旧实现的哈希值一致。")
+    finally:
+        for file_path in file_paths:
+            os.remove(file_path)
+        os.rmdir(base_path)
+
+
+if __name__ == "__main__":
+    main()
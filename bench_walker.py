@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+"""
+目录遍历性能测试脚本
+对比 os.walk + norm_exists_path（旧实现）与 dir_walker.iter_dir_files（新实现）
+统计每个文件平均触发的 stat 类系统调用次数和总耗时
+
+系统中有strace时，在子进程中用 strace -f -c -e trace=%stat 统计真实的系统调用
+（包括DirEntry.stat()/is_dir()在不支持d_type的文件系统上的内部调用），并减去只导入模块、不遍历时的基线；
+没有strace时只能统计Python层的os.stat/os.lstat调用次数，DirEntry内部的调用不计入
+
+用法: python bench_walker.py [文件数] [目录深度]
+"""
+
+from filedup.global_vars import norm_exists_path
+from filedup.dir_walker import iter_dir_files
+
+
+class StatCounter:
+    """替换os.stat/os.lstat以统计Python层的调用次数（os.path.exists/islink/realpath均经由这两个函数）"""
+    def __init__(self):
+        self.counts = {'stat': 0, 'lstat': 0}
+        self._stat = os.stat
+        self._lstat = os.lstat
+
+    def __enter__(self):
+        def stat(*args, **kwargs):
+            self.counts['stat'] += 1
+            return self._stat(*args, **kwargs)
+
+        def lstat(*args, **kwargs):
+            self.counts['lstat'] += 1
+            return self._lstat(*args, **kwargs)
+        os.stat = stat
+        os.lstat = lstat
+        return self
+
+    def __exit__(self, *exc):
+        os.stat = self._stat
+        os.lstat = self._lstat
+
+
+def create_tree(base_path, total_files, depth):
+    """创建测试目录树：depth层嵌套目录，每层目录下平均分配文件"""
+    dir_path = base_path
+    dirs = []
+    for i in range(depth):
+        dir_path = os.path.join(dir_path, f"level_{i}")
+        os.makedirs(dir_path, exist_ok=True)
+        dirs.append(dir_path)
+    for i in range(total_files):
+        with open(os.path.join(dirs[i % depth], f"file_{i}.dat"), "wb") as f:
+            f.write(b"x")
+
+
+def walk_old(directory_path):
+    """旧实现：os.walk + 逐文件norm_exists_path"""
+    all_files = []
+    for root, dirs, files in os.walk(directory_path):
+        for file in files:
+            file_path = norm_exists_path(os.path.join(root, file), skip_link=True)
+            if file_path is not None:
+                all_files.append(file_path)
+    return all_files
+
+
+def walk_new(directory_path):
+    """新实现：基于os.scandir的流式遍历"""
+    return list(iter_dir_files(directory_path, skip_link=True))
+
+
+WALKERS = {'old': walk_old, 'new': walk_new, 'none': lambda directory_path: []}
+
+
+def strace_calls(walker, directory_path):
+    """在strace下运行子进程中的遍历器，返回stat类系统调用的总次数"""
+    with tempfile.NamedTemporaryFile(suffix='.strace', delete=False) as f:
+        output = f.name
+    try:
+        subprocess.run(['strace', '-f', '-c', '-e', 'trace=%stat', '-o', output,
+                        sys.executable, os.path.abspath(__file__), '--child', walker, directory_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        calls = 0
+        with open(output, encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                # 各系统调用行: % time, seconds, usecs/call, calls, [errors], syscall
+                if len(fields) >= 5 and fields[-1] != 'total' and fields[0].replace('.', '').isdigit():
+                    calls += int(fields[3])
+        return calls
+    finally:
+        os.remove(output)
+
+
+def run_bench(name, walker, directory_path, baseline=0):
+    with StatCounter() as counter:
+        start = time.perf_counter()
+        files = WALKERS[walker](directory_path)
+        elapsed = time.perf_counter() - start
+    total = max(len(files), 1)
+    if baseline is None:
+        calls = counter.counts['stat'] + counter.counts['lstat']
+        label = "每文件Python层stat调用"
+    else:
+        calls = strace_calls(walker, directory_path) - baseline
+        label = "每文件stat系统调用"
+    print(f"{name:<28} 文件数: {len(files):>8}  耗时: {elapsed:8.3f}s  "
+          f"os.stat: {counter.counts['stat']:>8}  os.lstat: {counter.counts['lstat']:>8}  "
+          f"{label}: {calls / total:.2f}")
+    return files
+
+
+def main():
+    total_files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    base_path = tempfile.mkdtemp(prefix="bench_walker_")
+    try:
+        create_tree(base_path, total_files, depth)
+        print(f"测试目录: {base_path}，文件数: {total_files}，目录深度: {depth}")
+        if shutil.which('strace'):
+            baseline = strace_calls('none', base_path)
+        else:
+            baseline = None
+            print("未找到strace，只统计Python层的os.stat/os.lstat调用（不含DirEntry内部的系统调用）")
+        old_files = run_bench("os.walk + norm_exists_path", 'old', base_path, baseline)
+        new_files = run_bench("dir_walker.iter_dir_files", 'new', base_path, baseline)
+        assert sorted(old_files) == sorted(new_files), "新旧遍历结果不一致！"
+        print("✓ 新旧遍历结果一致。")
+    finally:
+        shutil.rmtree(base_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        # strace_calls启动的子进程：只运行指定的遍历器
+        WALKERS[sys.argv[2]](sys.argv[3])
+    else:
+        main()
@@ -26,6 +26,25 @@ if __name__ == '__main__':
         '--hidden-import', 'filedup.rw_img',
         '--hidden-import', 'filedup.rw_interface',
         '--hidden-import', 'filedup.rw_reg_handlers',
+        '--hidden-import', 'filedup.dir_walker',
+        '--hidden-import', 'filedup.scan_pipeline',
+        '--hidden-import', 'filedup.file_meta',
+        '--hidden-import', 'filedup.size_filter',
+        '--hidden-import', 'filedup.staged_hash',
+        '--hidden-import', 'filedup.verify_dupl',
+        '--hidden-import', 'filedup.hash_engines',
+        '--hidden-import', 'filedup.hash_io',
+        '--hidden-import', 'filedup.page_cache',
+        '--hidden-import', 'filedup.device_sched',
+        '--hidden-import', 'filedup.throttle',
+        '--hidden-import', 'filedup.autotune',
+        '--hidden-import', 'filedup.process_pool',
+        '--hidden-import', 'filedup.tree_hash',
+        '--hidden-import', 'filedup.hardlinks',
+        '--hidden-import', 'filedup.dir_state',
+        '--hidden-import', 'filedup.db_writer',
+        '--hidden-import', 'filedup.dup_groups',
+        '--hidden-import', 'filedup.db_schema',
         '--hidden-import', 'gui_dupl.handle_dupl',
     ]
     
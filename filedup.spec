@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('filedup', 'filedup'), ('gui_dupl', 'gui_dupl'), ('reg_handlers.json', '.')],
-    hiddenimports=['filedup', 'gui_dupl', 'filedup.file_duplicate_finder', 'filedup.global_vars', 'filedup.prograss', 'filedup.rw_video', 'filedup.rw_docx_wps', 'filedup.rw_img', 'filedup.rw_interface', 'filedup.rw_reg_handlers', 'gui_dupl.handle_dupl'],
+    hiddenimports=['filedup', 'gui_dupl', 'filedup.file_duplicate_finder', 'filedup.global_vars', 'filedup.prograss', 'filedup.rw_video', 'filedup.rw_docx_wps', 'filedup.rw_img', 'filedup.rw_interface', 'filedup.rw_reg_handlers', 'filedup.dir_walker', 'filedup.scan_pipeline', 'filedup.file_meta', 'filedup.size_filter', 'filedup.staged_hash', 'filedup.verify_dupl', 'filedup.hash_engines', 'filedup.hash_io', 'filedup.page_cache', 'filedup.device_sched', 'filedup.throttle', 'filedup.autotune', 'filedup.process_pool', 'filedup.tree_hash', 'filedup.hardlinks', 'filedup.dir_state', 'filedup.db_writer', 'filedup.dup_groups', 'filedup.db_schema', 'gui_dupl.handle_dupl'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
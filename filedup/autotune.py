@@ -0,0 +1,122 @@
+#自动调整哈希线程数：按短时间窗口测量吞吐量，AIMD方式（加性增加、乘性减少）在上下限之间调整并发数
+import threading
+from filedup.global_vars import log_print, LOG_LEVEL_INFO, LOG_LEVEL_DEBUG
+
+# 测量窗口（秒）
+DEFAULT_WINDOW = 2.0
+# 吞吐量提升超过该比例才继续增加线程
+GROWTH_THRESHOLD = 0.05
+# 吞吐量下降超过该比例时减少线程
+DECLINE_THRESHOLD = 0.10
+# 乘性减少的系数
+DECREASE_FACTOR = 0.75
+# 每个文件的固定开销折算的字节数（stat/open/数据库写入等），使小文件为主的目录也能体现并发的收益
+FILE_COST_BYTES = 64 * 1024
+
+
+class WorkerController:
+    """哈希线程数控制器
+
+    流水线启动max_workers个工作线程，编号不小于target的线程暂停取任务；
+    控制线程每个窗口计算一次吞吐量（读取字节数 + 文件数 × FILE_COST_BYTES）/秒：
+        吞吐量提升 -> target加1（加性增加）
+        吞吐量明显下降 -> target乘以DECREASE_FACTOR（乘性减少）
+        其他情况 -> 保持
+    文件队列为空（遍历跟不上）的窗口不做调整，因为此时吞吐量与线程数无关。
+    """
+    def __init__(self, min_workers=1, max_workers=32, window=DEFAULT_WINDOW):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.window = window
+        self.target = self.min_workers
+        self.files_done = 0
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.released = False
+        self.last_score = None
+        self.best = (0.0, self.target)
+        self.history = []
+
+    def task_done(self):
+        """工作线程每处理完一个文件调用一次"""
+        with self.cond:
+            self.files_done += 1
+
+    def wait_turn(self, index):
+        """编号为index的工作线程在取任务前调用：超出当前并发数时暂停，直到控制器放开或全部释放"""
+        with self.cond:
+            while index >= self.target and not self.released:
+                self.cond.wait()
+
+    def release_all(self):
+        """遍历结束或流水线中止时放开所有线程，让暂停的线程取到结束标记后退出"""
+        with self.cond:
+            self.released = True
+            self.cond.notify_all()
+
+    def _set_target(self, target, score):
+        target = max(self.min_workers, min(self.max_workers, target))
+        if target != self.target:
+            log_print(f"自动调整哈希线程数: {self.target} -> {target}（吞吐量 {score / (1024 * 1024):.1f} MB/s 等效）",
+                      log_level=LOG_LEVEL_DEBUG)
+        with self.cond:
+            self.target = target
+            self.cond.notify_all()
+
+    def adjust(self, score):
+        """根据本窗口的吞吐量调整并发数（AIMD）"""
+        self.history.append((self.target, score))
+        if score > self.best[0]:
+            self.best = (score, self.target)
+        if self.last_score is None or score > self.last_score * (1 + GROWTH_THRESHOLD):
+            self._set_target(self.target + 1, score)
+        elif score < self.last_score * (1 - DECLINE_THRESHOLD):
+            self._set_target(int(self.target * DECREASE_FACTOR), score)
+        self.last_score = score
+
+    def run(self, io_stats, file_queue):
+        """
+        控制线程主循环，直到stop()
+
+        参数:
+            io_stats: filedup.page_cache.IOStats，提供读取字节数
+            file_queue: 文件队列，用于判断工作线程是否有任务可做
+        """
+        last_bytes = io_stats.bytes_read
+        last_files = self.files_done
+        while not self.stop_event.wait(self.window):
+            bytes_read, files_done = io_stats.bytes_read, self.files_done
+            score = ((bytes_read - last_bytes) + (files_done - last_files) * FILE_COST_BYTES) / self.window
+            last_bytes, last_files = bytes_read, files_done
+            if file_queue.qsize() == 0:
+                continue
+            self.adjust(score)
+
+    def stop(self):
+        self.stop_event.set()
+        self.release_all()
+
+    def report(self):
+        """记录最终稳定的线程数"""
+        if not self.history:
+            log_print(f"自动调整哈希线程数: 扫描时间不足一个测量窗口，使用 {self.target} 个线程", log_level=LOG_LEVEL_INFO)
+            return
+        best_score, best_target = self.best
+        log_print(f"自动调整哈希线程数: 最终 {self.target} 个线程，吞吐量最高时 {best_target} 个线程"
+                  f"（{best_score / (1024 * 1024):.1f} MB/s 等效），共调整 {len(self.history)} 个窗口", log_level=LOG_LEVEL_INFO)
+
+
+class GatedQueue:
+    """包装文件队列：每次取任务前先经过控制器的并发限制，并在任务完成时通知控制器"""
+    def __init__(self, file_queue, controller, index):
+        self.file_queue = file_queue
+        self.controller = controller
+        self.index = index
+
+    def get(self):
+        self.controller.wait_turn(self.index)
+        return self.file_queue.get()
+
+    def task_done(self):
+        self.controller.task_done()
+        self.file_queue.task_done()
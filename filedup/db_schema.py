@@ -0,0 +1,227 @@
+#数据库结构（第2版）：时间戳保存为整数纳秒，主哈希保存为二进制摘要加算法编号，所有者名称保存在查找表中；
+#提供由第1版（ISO时间字符串、"算法:十六进制"文本哈希、重复的所有者字符串）原地升级的迁移。
+#扫描过程中只处理整数和摘要，时间和哈希值的字符串格式只在输出（命令行、JSON、GUI）时生成
+import datetime
+from filedup.hash_engines import hash_tag, HASH_COLUMN_PREFIX
+from filedup.global_vars import log_print, LOG_LEVEL_INFO
+
+# 当前数据库结构版本，保存在PRAGMA user_version中；第1版数据库的user_version为0
+SCHEMA_VERSION = 2
+
+OWNERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS owners (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+'''
+
+HASH_ALGORITHMS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS hash_algorithms (
+        id INTEGER PRIMARY KEY,
+        tag TEXT UNIQUE NOT NULL
+    )
+'''
+
+# file_features的列（不含附加哈希列）；alg_id和file_hash都为NULL表示"未计算哈希"
+FILE_FEATURES_COLUMNS = '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT UNIQUE NOT NULL,
+        file_size INTEGER,
+        ctime_ns INTEGER,
+        mtime_ns INTEGER,
+        atime_ns INTEGER,
+        owner_id INTEGER REFERENCES owners (id),
+        alg_id INTEGER REFERENCES hash_algorithms (id),
+        file_hash BLOB,
+        last_checked INTEGER,
+        stage1_hash TEXT,
+        stage2_hash TEXT,
+        device INTEGER,
+        inode INTEGER,
+        nlink INTEGER,
+        mtime_coarse INTEGER'''
+
+
+def hash_text_sql(alias=''):
+    """在SQL中由算法编号和二进制摘要还原"算法:十六进制"文本哈希的表达式（用于与文本哈希列比较）"""
+    return f"((SELECT tag FROM hash_algorithms WHERE id = {alias}alg_id) || ':' || lower(hex({alias}file_hash)))"
+
+
+def file_features_table(name='file_features', extra_hash_columns=()):
+    """file_features（或迁移用的临时表）的建表语句"""
+    extra = ''.join(f",\n        {column} TEXT" for column in extra_hash_columns)
+    return f"CREATE TABLE IF NOT EXISTS {name} ({FILE_FEATURES_COLUMNS}{extra}\n    )"
+
+
+def split_hash(file_hash):
+    """把"算法:十六进制"文本哈希拆分为(算法标签, 二进制摘要)；没有标签或不是十六进制时返回(None, None)"""
+    tag = hash_tag(file_hash)
+    if tag is None:
+        return None, None
+    try:
+        return tag, bytes.fromhex(file_hash.split(':', 1)[1])
+    except ValueError:
+        return None, None
+
+
+def iso_to_ns(value):
+    """把第1版数据库中的ISO时间字符串转换为整数纳秒（精确到微秒），无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        timestamp = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return int(round(timestamp.timestamp() * 1000000)) * 1000
+
+
+def mtime_matches(stored_ns, mtime_ns, coarse=False):
+    """
+    数据库中的修改时间与stat结果是否一致
+
+    coarse为真表示stored_ns由第1版的ISO时间转换（mtime_coarse列）：ISO时间由浮点秒数四舍五入到微秒，
+    与纳秒修改时间相差不到1微秒即视为一致
+    """
+    if stored_ns is None or mtime_ns is None:
+        return False
+    if coarse:
+        return abs(stored_ns - mtime_ns) < 1000
+    return stored_ns == mtime_ns
+
+
+class LookupTable:
+    """名称与整数编号的查找表（owners、hash_algorithms），两个方向都在内存中缓存"""
+    def __init__(self, cursor, table, column):
+        self.cursor = cursor
+        self.table = table
+        self.column = column
+        self.reload()
+
+    def reload(self):
+        """从数据库重新加载（事务回滚后，缓存中可能有未提交的编号）"""
+        self.cursor.execute(f"SELECT id, {self.column} FROM {self.table}")
+        self.names = dict(self.cursor.fetchall())
+        self.ids = {name: ident for ident, name in self.names.items()}
+
+    def id_of(self, name):
+        """名称对应的编号，不存在时插入（不提交）"""
+        if name is None:
+            return None
+        ident = self.ids.get(name)
+        if ident is None:
+            self.cursor.execute(f"INSERT OR IGNORE INTO {self.table} ({self.column}) VALUES (?)", (name,))
+            self.cursor.execute(f"SELECT id FROM {self.table} WHERE {self.column} = ?", (name,))
+            ident = self.cursor.fetchone()[0]
+            self.ids[name] = ident
+            self.names[ident] = name
+        return ident
+
+    def name_of(self, ident):
+        """编号对应的名称"""
+        return self.names.get(ident)
+
+
+class FeatureCodec:
+    """file_features的值与内存中属性字典之间的转换：文本哈希 <-> (算法编号, 摘要)，所有者名称 <-> 编号"""
+    def __init__(self, cursor):
+        self.owners = LookupTable(cursor, 'owners', 'name')
+        self.algorithms = LookupTable(cursor, 'hash_algorithms', 'tag')
+
+    def reload(self):
+        self.owners.reload()
+        self.algorithms.reload()
+
+    def encode_hash(self, file_hash):
+        """文本哈希 -> (算法编号, 二进制摘要)"""
+        tag, digest = split_hash(file_hash)
+        if digest is None:
+            return None, None
+        return self.algorithms.id_of(tag), digest
+
+    def decode_hash(self, alg_id, digest):
+        """(算法编号, 二进制摘要) -> 文本哈希"""
+        if digest is None or alg_id is None:
+            return None
+        return f"{self.algorithms.name_of(alg_id)}:{digest.hex()}"
+
+    def owner_id(self, name):
+        return self.owners.id_of(name)
+
+    def owner_name(self, owner_id):
+        return self.owners.name_of(owner_id)
+
+
+def schema_version(cursor):
+    """数据库结构版本：没有file_features表的新数据库返回None"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_features'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0] or 1
+
+
+def migrate_v1(conn):
+    """
+    把第1版的file_features原地迁移为第2版结构（在一个事务中完成并提交）
+
+    时间字符串转换为纳秒（已记录的mtime_ns优先；由ISO时间转换的只精确到微秒，设置mtime_coarse，
+    下次扫描时按微秒比较，一致时写入精确的纳秒修改时间，不重新计算哈希值），文本哈希拆分为算法编号和摘要（没有算法标签的旧哈希值
+    视为未计算，下次扫描时重新计算），所有者名称移入owners表，inode为0的记录不保存设备号、inode和链接数。依赖file_features的重复文件组汇总表随之删除，
+    由调用方重新创建。
+
+    返回:
+        int: 迁移的记录数
+    """
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(file_features)")
+    columns = {row[1] for row in cursor.fetchall()}
+    extra_hash_columns = sorted(column for column in columns if column.startswith(HASH_COLUMN_PREFIX))
+
+    def column(name):
+        """旧版本数据库可能缺少后来添加的列"""
+        return f"f.{name}" if name in columns else "NULL"
+
+    def known_inode(value):
+        """inode为0（Windows上没有inode信息）时设备号和链接数同样无效，与filedup.file_meta.inode_fields一致"""
+        return f"CASE WHEN NULLIF({column('inode')}, 0) IS NULL THEN NULL ELSE {value} END"
+
+    conn.create_function('iso_to_ns', 1, iso_to_ns)
+    conn.create_function('hash_tag', 1, lambda value: split_hash(value)[0])
+    conn.create_function('hash_digest', 1, lambda value: split_hash(value)[1])
+    try:
+        cursor.execute("BEGIN")
+        cursor.execute(OWNERS_TABLE)
+        cursor.execute(HASH_ALGORITHMS_TABLE)
+        cursor.execute("INSERT OR IGNORE INTO owners (name) SELECT DISTINCT owner FROM file_features WHERE owner IS NOT NULL")
+        cursor.execute("INSERT OR IGNORE INTO hash_algorithms (tag) "
+                       "SELECT DISTINCT hash_tag(file_hash) FROM file_features WHERE hash_tag(file_hash) IS NOT NULL")
+        cursor.execute("DROP TABLE IF EXISTS dup_groups")
+        cursor.execute("DROP TABLE IF EXISTS file_features_v2")
+        cursor.execute(file_features_table('file_features_v2', extra_hash_columns))
+        extra = ''.join(f", {name}" for name in extra_hash_columns)
+        select_extra = ''.join(f", f.{name}" for name in extra_hash_columns)
+        cursor.execute(f'''
+            INSERT INTO file_features_v2 (id, file_path, file_size, ctime_ns, mtime_ns, atime_ns, owner_id, alg_id,
+                                          file_hash, last_checked, stage1_hash, stage2_hash, device, inode, nlink,
+                                          mtime_coarse{extra})
+            SELECT f.id, f.file_path, f.file_size, iso_to_ns({column('created_time')}),
+                   COALESCE({column('mtime_ns')}, iso_to_ns({column('modified_time')})), iso_to_ns({column('accessed_time')}),
+                   o.id, a.id, CASE WHEN a.id IS NULL THEN NULL ELSE hash_digest(f.file_hash) END,
+                   iso_to_ns({column('last_checked')}), {column('stage1_hash')}, {column('stage2_hash')},
+                   {known_inode(column('device'))}, NULLIF({column('inode')}, 0), {known_inode(column('nlink'))},
+                   CASE WHEN {column('mtime_ns')} IS NULL AND iso_to_ns({column('modified_time')}) IS NOT NULL THEN 1 END
+                   {select_extra}
+            FROM file_features f
+            LEFT JOIN owners o ON o.name = {column('owner')}
+            LEFT JOIN hash_algorithms a ON a.tag = hash_tag(f.file_hash)
+        ''')
+        migrated = cursor.rowcount
+        cursor.execute("DROP TABLE file_features")
+        cursor.execute("ALTER TABLE file_features_v2 RENAME TO file_features")
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    log_print(f"升级数据库：已将 {migrated} 条文件记录迁移到第{SCHEMA_VERSION}版结构", log_level=LOG_LEVEL_INFO)
+    return migrated
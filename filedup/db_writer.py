@@ -0,0 +1,125 @@
+#file_features批量写入层：按批次用executemany执行UPSERT，只需更新检查时间的记录单独批量更新
+import os
+from filedup.hash_engines import hash_column
+
+# 全面更新时直接写入属性值的列（file_path之外），顺序与feature_row一致；
+# 扫描结果中没有mtime_coarse，全面更新写入精确的纳秒修改时间时随之清除
+FEATURE_COLUMNS = ('file_size', 'ctime_ns', 'mtime_ns', 'atime_ns', 'last_checked', 'stage1_hash', 'stage2_hash',
+                   'device', 'inode', 'nlink', 'mtime_coarse')
+# 由FeatureCodec转换后写入的列：所有者名称 -> owner_id，文本哈希 -> (alg_id, file_hash)
+ENCODED_COLUMNS = ('owner_id', 'alg_id', 'file_hash')
+
+
+def is_writable(attributes):
+    """有哈希值，或哈希计算被推迟（以"未计算哈希"状态入库）的记录才写入数据库"""
+    return bool(attributes) and 'file_hash' in attributes and \
+        (attributes['file_hash'] is not None or bool(attributes.get('hash_deferred')))
+
+
+def is_touch_only(attributes):
+    """文件未变化，只需要更新last_checked"""
+    return 'needs_update' in attributes and not attributes['needs_update']
+
+
+def raw_row(attributes, extra_hash_columns):
+    """
+    属性字典 -> 按upsert_sql的列顺序排列、所有者名称和文本哈希尚未编码的元组
+
+    不需要数据库，多进程扫描时在工作进程中生成，主进程只需由FeatureWriter.encode_row编码两个字段
+    """
+    extra_hashes = {hash_column(name): value for name, value in attributes.get('extra_hashes', {}).items()}
+    return (os.path.normpath(attributes['file_path']),
+            *(attributes.get(column) for column in FEATURE_COLUMNS),
+            attributes.get('owner'),
+            attributes.get('file_hash'),
+            *(extra_hashes.get(column) for column in extra_hash_columns))
+
+
+def split_rows(attributes_list, extra_hash_columns):
+    """
+    把一批属性字典分为三组（不可写入的记录被忽略）
+
+    返回:
+        (list, list, list): 全面写入的raw_row元组，只更新检查时间的(last_checked, 文件路径)，
+                            被移动文件的(旧路径, 新路径, inode)
+    """
+    rows, touches, moves = [], [], []
+    for attributes in attributes_list:
+        if not is_writable(attributes):
+            continue
+        file_path = os.path.normpath(attributes['file_path'])
+        if attributes.get('moved_from'):
+            moves.append((attributes['moved_from'], file_path, attributes.get('inode')))
+        if is_touch_only(attributes):
+            touches.append((attributes['last_checked'], file_path))
+        else:
+            rows.append(raw_row(attributes, extra_hash_columns))
+    return rows, touches, moves
+
+
+class FeatureWriter:
+    """file_features的批量写入器
+
+    每个批次最多执行两条executemany：
+        1. UPDATE ... SET last_checked：未变化的文件
+        2. INSERT ... ON CONFLICT(file_path) DO UPDATE：新文件和有变化的文件
+    不再逐行SELECT判断记录是否存在。写入器不提交事务，由调用方控制事务边界。
+    """
+    def __init__(self, cursor, extra_hash_columns, codec):
+        """
+        参数:
+            cursor: 数据库游标
+            extra_hash_columns: 数据库中全部附加哈希列（如hash_sha256）。本次未计算的列在主哈希值不变时保留原值，
+                                主哈希值变化时写入NULL
+            codec: FeatureCodec，把所有者名称和文本哈希转换为数据库中的编号和二进制摘要
+        """
+        self.cursor = cursor
+        self.codec = codec
+        self.extra_hash_columns = list(extra_hash_columns)
+        self.columns = columns = ('file_path',) + FEATURE_COLUMNS + ENCODED_COLUMNS + tuple(self.extra_hash_columns)
+        self.upsert_sql = (
+            f"INSERT INTO file_features ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(file_path) DO UPDATE SET "
+            + ', '.join(f"{column} = excluded.{column}" for column in columns[1:-len(self.extra_hash_columns) or None])
+            + ''.join(f", {column} = CASE WHEN alg_id IS excluded.alg_id AND file_hash IS excluded.file_hash "
+                      f"THEN COALESCE(excluded.{column}, {column}) ELSE excluded.{column} END"
+                      for column in self.extra_hash_columns)
+        )
+        self.touch_sql = "UPDATE file_features SET last_checked = ? WHERE file_path = ?"
+
+    def encode_row(self, row):
+        """raw_row的结果 -> upsert_sql的参数元组：所有者名称和文本哈希转换为编号和(算法编号, 二进制摘要)"""
+        owner = len(FEATURE_COLUMNS) + 1
+        return (*row[:owner], self.codec.owner_id(row[owner]), *self.codec.encode_hash(row[owner + 1]), *row[owner + 2:])
+
+    def feature_row(self, attributes):
+        """把属性字典转换为upsert_sql的参数元组"""
+        return self.encode_row(raw_row(attributes, self.extra_hash_columns))
+
+    def write_rows(self, rows, touches):
+        """
+        写入已按列顺序排列的元组（不提交）
+
+        参数:
+            rows: raw_row的结果列表，全面写入
+            touches: (last_checked, 文件路径)列表，只更新检查时间
+        返回:
+            (int, int): 全面写入的记录数，只更新检查时间的记录数
+        """
+        if touches:
+            self.cursor.executemany(self.touch_sql, touches)
+        if rows:
+            self.cursor.executemany(self.upsert_sql, [self.encode_row(row) for row in rows])
+        return len(rows), len(touches)
+
+    def write(self, attributes_list):
+        """
+        写入一批文件属性（不提交）
+
+        参数:
+            attributes_list: 属性字典列表，不可写入的记录被忽略
+        返回:
+            (int, int): 全面写入的记录数，只更新检查时间的记录数
+        """
+        rows, touches, _ = split_rows(attributes_list, self.extra_hash_columns)
+        return self.write_rows(rows, touches)
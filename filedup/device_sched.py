@@ -0,0 +1,133 @@
+#按设备调度哈希任务：每个设备（st_dev）使用独立的工作线程池，设备内按inode顺序处理以减少磁头寻道
+import os
+import sys
+import heapq
+import threading
+from filedup.global_vars import log_print, LOG_LEVEL_WARN
+
+# 每个设备待处理队列的容量（按inode排序的窗口大小）
+DEFAULT_DEVICE_WINDOW = 1024
+# 机械硬盘默认的线程数：多线程并发读取会导致磁头来回寻道
+ROTATIONAL_THREADS = 1
+# 无法获取stat结果的文件归入的虚拟设备
+UNKNOWN_DEVICE = -1
+
+
+def device_is_rotational(st_dev):
+    """
+    检测设备是否为机械硬盘（Linux上读取/sys/dev/block/<主设备号>:<次设备号>/queue/rotational）
+
+    返回:
+        bool: 是否为机械硬盘；无法检测（其他平台、网络文件系统、虚拟设备等）时返回None
+    """
+    if not sys.platform.startswith('linux') or st_dev == UNKNOWN_DEVICE:
+        return None
+    base = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+    # 分区没有queue目录，需要查看所属磁盘
+    for path in (os.path.join(base, 'queue', 'rotational'), os.path.join(base, '..', 'queue', 'rotational')):
+        try:
+            with open(path) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+
+def parse_device_threads(specs):
+    """
+    解析命令行的设备线程数设置
+
+    参数:
+        specs: ["路径=线程数", ...]，路径可以是设备上的任意文件或目录
+    返回:
+        dict: st_dev -> 线程数；格式错误或路径不存在的设置会被忽略并给出警告
+    """
+    overrides = {}
+    for spec in specs or []:
+        path, sep, count = spec.rpartition('=')
+        try:
+            if not sep or int(count) < 1:
+                raise ValueError(spec)
+            overrides[os.stat(path).st_dev] = int(count)
+        except (OSError, ValueError):
+            log_print(f"忽略无效的设备线程数设置: {spec}（格式：路径=线程数）", log_level=LOG_LEVEL_WARN)
+    return overrides
+
+
+class DeviceQueue:
+    """单个设备的待处理文件队列：按inode从小到大出队，提供与queue.Queue相同的get()/task_done()接口
+
+    队列满时put阻塞，形成与普通文件队列相同的反压；close()之后队列取空时get()返回None（结束标记）。
+    """
+    def __init__(self, capacity=DEFAULT_DEVICE_WINDOW):
+        self.capacity = capacity
+        self.heap = []
+        self.seq = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, item, inode, stop_event):
+        """按inode入队，队列满时阻塞；流水线中止时放弃入队并返回False"""
+        with self.cond:
+            while len(self.heap) >= self.capacity and not stop_event.is_set():
+                self.cond.wait(0.5)
+            if stop_event.is_set():
+                return False
+            # seq保证inode相同（不同设备合并到UNKNOWN_DEVICE时可能发生）时按到达顺序出队
+            heapq.heappush(self.heap, (inode, self.seq, item))
+            self.seq += 1
+            self.cond.notify_all()
+            return True
+
+    def get(self):
+        with self.cond:
+            while not self.heap and not self.closed:
+                self.cond.wait()
+            if not self.heap:
+                return None
+            item = heapq.heappop(self.heap)[2]
+            self.cond.notify_all()
+            return item
+
+    def task_done(self):
+        pass
+
+    def close(self):
+        """不再有新文件入队"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def drain(self):
+        """丢弃所有待处理文件并关闭队列（流水线中止时使用）"""
+        with self.cond:
+            self.heap.clear()
+            self.closed = True
+            self.cond.notify_all()
+
+
+class DeviceScheduler:
+    """为每个设备确定工作线程数
+
+    优先使用命令行指定的设备线程数；否则机械硬盘使用ROTATIONAL_THREADS个线程，
+    固态硬盘和无法识别的设备使用默认线程数（--threads）。
+    """
+    def __init__(self, default_threads, overrides=None, window=DEFAULT_DEVICE_WINDOW):
+        """
+        参数:
+            default_threads: 默认的每设备线程数
+            overrides: st_dev -> 线程数，见parse_device_threads
+            window: 每个设备按inode排序的待处理队列容量
+        """
+        self.default_threads = max(1, default_threads)
+        self.overrides = overrides or {}
+        self.window = window
+
+    def pool_size(self, st_dev):
+        """返回设备的工作线程数和说明"""
+        if st_dev in self.overrides:
+            return self.overrides[st_dev], "指定"
+        rotational = device_is_rotational(st_dev)
+        if rotational:
+            return min(ROTATIONAL_THREADS, self.default_threads), "机械硬盘"
+        return self.default_threads, "固态硬盘" if rotational is False else "未知设备类型"
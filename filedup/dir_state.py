@@ -0,0 +1,67 @@
+#目录状态：记录每个目录的修改时间、条目数和子项名称摘要，增量扫描时跳过列表未变化的目录中的文件
+import os
+import hashlib
+
+
+def names_digest(names):
+    """目录子项名称列表的摘要（与顺序无关）"""
+    return hashlib.sha1('\n'.join(sorted(names)).encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+class DirStateTracker:
+    """目录状态跟踪器，由遍历器在读取每个目录时调用
+
+    目录的修改时间（纳秒）、条目数和子项名称摘要都与上次扫描时一致，
+    并且目录中的每个文件在数据库中都有记录时，认为目录列表没有变化，
+    遍历器不再产出该目录中的文件（省去逐个文件的stat），但仍然进入其子目录。
+    目录列表不变并不代表文件内容不变：原地修改的文件需要使用完整stat扫描才能发现。
+    """
+    def __init__(self, stored_states, known_files, prune=True, collect_pruned=False):
+        """
+        参数:
+            stored_states: 上次扫描保存的目录状态 {目录路径: (修改时间ns, 条目数, 名称摘要)}
+            known_files: 数据库中已有记录的文件路径（支持in运算的容器）
+            prune: 是否跳过未变化目录中的文件；为False时只记录目录状态（完整stat扫描）
+            collect_pruned: 是否记录被跳过的文件路径
+        """
+        self.stored_states = stored_states
+        self.known_files = known_files
+        self.prune = prune
+        self.collect_pruned = collect_pruned
+        self.states = {}
+        self.pruned_dirs = 0
+        self.pruned_files = 0
+        self.pruned_paths = []
+
+    def dir_mtime(self, dir_path):
+        """在读取目录之前获取目录的修改时间，读取期间发生的修改一定会反映在下次扫描的修改时间上"""
+        try:
+            return os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def unchanged(self, dir_path, mtime_ns, entries, file_paths):
+        """
+        登记目录的当前状态，并判断目录中的文件能否跳过
+
+        参数:
+            dir_path: 目录路径
+            mtime_ns: 读取目录之前由dir_mtime获取的修改时间
+            entries: 目录中的全部DirEntry
+            file_paths: 遍历器将要产出的文件路径
+        返回:
+            bool: 目录列表未变化且所有文件都已在数据库中时返回True
+        """
+        if mtime_ns is None:
+            return False
+        state = (mtime_ns, len(entries), names_digest([entry.name for entry in entries]))
+        self.states[dir_path] = state
+        if not self.prune or self.stored_states.get(dir_path) != state:
+            return False
+        if not all(file_path in self.known_files for file_path in file_paths):
+            return False
+        self.pruned_dirs += 1
+        self.pruned_files += len(file_paths)
+        if self.collect_pruned:
+            self.pruned_paths.extend(file_paths)
+        return True
@@ -0,0 +1,62 @@
+#基于os.scandir的流式目录遍历器，替代os.walk+逐文件norm_exists_path的枚举方式
+import os
+from filedup.global_vars import log_print, LOG_LEVEL_WARN
+
+
+def norm_root_dir(directory_path):
+    """规范化根目录路径（只在遍历开始时解析一次真实路径）"""
+    return os.path.normpath(os.path.realpath(os.path.abspath(directory_path)))
+
+
+def _list_dir(dir_path):
+    """读取单个目录的所有条目，读取完成后立即关闭目录句柄"""
+    try:
+        with os.scandir(dir_path) as it:
+            return list(it)
+    except OSError as e:
+        log_print(f"无法读取目录 {dir_path}: {e}", log_level=LOG_LEVEL_WARN)
+        return []
+
+
+def iter_dir_entries(directory_path, skip_link=True, dir_state=None):
+    """流式遍历目录及其子目录中的所有普通文件
+
+    只在开始时对根目录做一次realpath规范化，由于不跟随目录符号链接，
+    子目录和文件的路径直接由父目录拼接得到即为真实路径。
+    文件分类使用DirEntry.is_file(follow_symlinks=False)，
+    在支持d_type的文件系统上不需要额外的stat系统调用。
+
+    参数:
+        directory_path: 要遍历的目录路径
+        skip_link: 是否跳过符号链接文件，默认跳过
+        dir_state: filedup.dir_state.DirStateTracker，列表未变化的目录不产出其中的文件，可为None
+    产出:
+        (文件路径, DirEntry) 元组；符号链接文件（skip_link=False时）产出其目标真实路径和None
+    """
+    stack = [norm_root_dir(directory_path)]
+    while stack:
+        dir_path = stack.pop()
+        mtime_ns = dir_state.dir_mtime(dir_path) if dir_state else None
+        entries = _list_dir(dir_path)
+        subdirs = []
+        files = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((entry.path, entry))
+                elif not skip_link and entry.is_symlink() and entry.is_file():
+                    files.append((os.path.normpath(os.path.realpath(entry.path)), None))
+            except OSError as e:
+                log_print(f"无法读取目录项 {entry.path}: {e}", log_level=LOG_LEVEL_WARN)
+        if not (dir_state and dir_state.unchanged(dir_path, mtime_ns, entries, [file_path for file_path, _ in files])):
+            yield from files
+        # 逆序压栈，保持与os.walk相近的深度优先顺序
+        stack.extend(reversed(subdirs))
+
+
+def iter_dir_files(directory_path, skip_link=True, dir_state=None):
+    """流式遍历目录及其子目录中的所有普通文件，只产出文件路径"""
+    for file_path, _ in iter_dir_entries(directory_path, skip_link=skip_link, dir_state=dir_state):
+        yield file_path
@@ -0,0 +1,122 @@
+#重复文件组汇总表：每个哈希值（算法编号和摘要）一行，记录成员数、副本数和可释放空间，由file_features上的触发器增量维护，
+#列出重复文件时只需读取成员数大于1的行，不再对整个file_features执行GROUP BY
+
+# 汇总表：copies为不同(device, inode)的数量（没有inode信息的记录按路径计，inode为0与NULL相同，
+# 见filedup.hardlinks.inode_key）；
+# 每个不同的哈希值都有一行，使用WITHOUT ROWID表，触发器每次写入只需更新一棵B树
+DUP_GROUPS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS dup_groups (
+        file_hash BLOB NOT NULL,
+        alg_id INTEGER NOT NULL,
+        member_count INTEGER NOT NULL,
+        copies INTEGER NOT NULL,
+        file_size INTEGER,
+        PRIMARY KEY (file_hash, alg_id)
+    ) WITHOUT ROWID
+'''
+
+# 占用一份磁盘空间的实体：(device, inode)，没有inode信息时为路径；副本数为组内不同实体的数量
+COPY_KEY = "COALESCE(device || ':' || NULLIF(inode, 0), file_path)"
+
+# 可释放空间不单独存储，查询时由副本数计算
+WASTED_BYTES = 'COALESCE(file_size, 0) * (copies - 1)'
+
+# 只包含重复文件组的部分覆盖索引：列出重复文件时只读取这个索引，再对组排序；
+# 大多数哈希值只有一个文件，写入这些行时不需要维护索引
+DUP_GROUPS_INDEXES = [
+    ('idx_dup_groups_count', 'member_count DESC, file_hash, alg_id, file_size, copies'),
+]
+
+# 行{row}是否为其(device, inode)在组内的唯一成员，即是否单独占用一份磁盘空间；
+# {exclude_self}在触发器所在行仍在表中时排除该行自身
+_OWN_COPY = '''({row}.inode IS NULL OR {row}.inode = 0 OR NOT EXISTS (
+            SELECT 1 FROM file_features
+            WHERE device = {row}.device AND inode = {row}.inode AND file_hash = {row}.file_hash
+              AND alg_id = {row}.alg_id{exclude_self}))'''
+
+# 插入和更新后触发器所在行的路径为NEW.file_path
+_EXCLUDE_SELF = ' AND file_path != NEW.file_path'
+
+# 把行{row}计入汇总表（没有哈希值的行不计入）
+_ADD_MEMBER = f'''
+        INSERT INTO dup_groups (file_hash, alg_id, member_count, copies, file_size)
+        SELECT {{row}}.file_hash, {{row}}.alg_id, 1, 1, {{row}}.file_size
+        WHERE {{row}}.file_hash IS NOT NULL AND {{row}}.alg_id IS NOT NULL
+        ON CONFLICT(file_hash, alg_id) DO UPDATE SET
+            member_count = member_count + 1,
+            copies = copies + {_OWN_COPY},
+            file_size = excluded.file_size;'''
+
+# 把行{row}从汇总表中减去，成员数为0的组随之删除（没有哈希值的行不匹配任何组）
+_REMOVE_MEMBER = f'''
+        UPDATE dup_groups SET
+            member_count = member_count - 1,
+            copies = copies - {_OWN_COPY}
+        WHERE file_hash = {{row}}.file_hash AND alg_id = {{row}}.alg_id;
+        DELETE FROM dup_groups WHERE file_hash = {{row}}.file_hash AND alg_id = {{row}}.alg_id AND member_count <= 0;'''
+
+# UPSERT、逐条DELETE、更新哈希值和移动路径等所有写入都经过这些触发器；
+# 只更新last_checked或file_path的写入不影响分组，不会执行触发器的语句
+DUP_GROUPS_TRIGGERS = [
+    ('trg_dup_groups_insert', f'''
+    CREATE TRIGGER IF NOT EXISTS trg_dup_groups_insert AFTER INSERT ON file_features
+    WHEN NEW.file_hash IS NOT NULL
+    BEGIN{_ADD_MEMBER.format(row='NEW', exclude_self=_EXCLUDE_SELF)}
+    END
+'''),
+    ('trg_dup_groups_delete', f'''
+    CREATE TRIGGER IF NOT EXISTS trg_dup_groups_delete AFTER DELETE ON file_features
+    WHEN OLD.file_hash IS NOT NULL
+    BEGIN{_REMOVE_MEMBER.format(row='OLD', exclude_self='')}
+    END
+'''),
+    # 更新后该行已经是新值：减去旧值和加入新值时都按该行当前的路径排除自身
+    ('trg_dup_groups_update', f'''
+    CREATE TRIGGER IF NOT EXISTS trg_dup_groups_update AFTER UPDATE OF file_hash, alg_id, file_size, device, inode ON file_features
+    WHEN OLD.file_hash IS NOT NEW.file_hash OR OLD.alg_id IS NOT NEW.alg_id OR OLD.file_size IS NOT NEW.file_size
+      OR OLD.device IS NOT NEW.device OR OLD.inode IS NOT NEW.inode
+    BEGIN{_REMOVE_MEMBER.format(row='OLD', exclude_self=_EXCLUDE_SELF)}{_ADD_MEMBER.format(row='NEW', exclude_self=_EXCLUDE_SELF)}
+    END
+'''),
+]
+
+# 由file_features重新计算整个汇总表
+REBUILD_SQL = f'''
+    INSERT INTO dup_groups (file_hash, alg_id, member_count, copies, file_size)
+    SELECT file_hash, alg_id, COUNT(*), COUNT(DISTINCT {COPY_KEY}), MAX(file_size)
+    FROM file_features
+    WHERE file_hash IS NOT NULL AND alg_id IS NOT NULL
+    GROUP BY file_hash, alg_id
+'''
+
+
+def rebuild_dup_groups(cursor):
+    """清空并由file_features重新计算汇总表（不提交）"""
+    cursor.execute("DELETE FROM dup_groups")
+    cursor.execute(REBUILD_SQL)
+
+
+def ensure_dup_groups(cursor):
+    """
+    创建汇总表、索引和触发器（不提交）；汇总表新建时由file_features中已有的记录计算初始内容
+
+    返回:
+        bool: 汇总表是否为新建
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dup_groups'")
+    created = cursor.fetchone() is None
+    cursor.execute(DUP_GROUPS_TABLE)
+    for name, columns in DUP_GROUPS_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON dup_groups ({columns}) WHERE member_count > 1")
+    # 定义已变化的旧触发器（SQLite保存的语句去掉了IF NOT EXISTS）先删除，汇总表随之重新计算
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'file_features'")
+    stored = dict(cursor.fetchall())
+    stale = False
+    for name, sql in DUP_GROUPS_TRIGGERS:
+        if name in stored and stored[name] != sql.strip().replace('IF NOT EXISTS ', '', 1):
+            cursor.execute(f"DROP TRIGGER {name}")
+            stale = True
+        cursor.execute(sql)
+    if created or stale:
+        rebuild_dup_groups(cursor)
+    return created
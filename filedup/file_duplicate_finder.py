@@ -1,53 +1,144 @@
 import os
 import sys
-import hashlib
 import sqlite3
 import datetime
+import time
 import json
 import argparse
-import getpass
 import os
 import threading
 import queue
+import itertools
 from pathlib import Path
 import json
 from tkinter import NO
 from filedup.prograss import ProgressBar
 # from itertools import batched
 # 注册的处理器文件名
-from filedup.global_vars import norm_exists_path, FILE_FEATURES_DB_FILENAME, FILE_DUMP_FILENAME, \
+from filedup.global_vars import FILE_FEATURES_DB_FILENAME, FILE_DUMP_FILENAME, \
     log_print,LOG_LEVEL_ERROR,LOG_LEVEL_WARN,LOG_LEVEL_INFO,LOG_LEVEL_DEBUG
 from filedup.rw_reg_handlers import RWRegHandlers, get_RWRegHandlers
+from filedup.dir_walker import iter_dir_files, norm_root_dir
+from filedup.dir_state import DirStateTracker
+from filedup.db_writer import FeatureWriter, is_writable, split_rows
+from filedup.dup_groups import ensure_dup_groups, WASTED_BYTES, COPY_KEY
+from filedup.db_schema import SCHEMA_VERSION, OWNERS_TABLE, HASH_ALGORITHMS_TABLE, FeatureCodec, file_features_table, \
+    hash_text_sql, schema_version, migrate_v1, mtime_matches
+from filedup.scan_pipeline import ScanPipeline
+from filedup.file_meta import stat_file, meta_from_stat, fill_inode, owner_name, format_ns
+from filedup.size_filter import SizeCollisionFilter
+from filedup.staged_hash import StagedHashConfirmer, sample_digest, stage_offsets
+from filedup.verify_dupl import DuplicateVerifier, members_digest, DEFAULT_MEMORY_BUDGET
+from filedup.hash_io import hash_file, DEFAULT_MMAP_THRESHOLD
+from filedup.page_cache import IOStats
+from filedup.device_sched import DeviceScheduler, parse_device_threads
+from filedup.throttle import ScanThrottle, parse_rate, parse_profile
+from filedup.autotune import WorkerController
+from filedup.process_pool import ProcessScanPipeline
+from filedup.tree_hash import TreeHasher, tree_tag, DEFAULT_SEGMENT_SIZE
+from filedup.hardlinks import InodeHashCache, inode_key, mark_hardlinks
+from filedup.hash_engines import new_hasher, resolve_engine_name, engine_names, hash_tag, hash_column, print_benchmark, \
+    DEFAULT_HASH_ENGINE, HASH_COLUMN_PREFIX
+
+# 重复文件组的排序方式 -> 排序列（均为降序）
+DUPLICATE_ORDERS = {'wasted_bytes': 'wasted_bytes', 'count': 'member_count', 'size': 'file_size'}
 
 class FileDuplicateFinder:
-    def __init__(self, db_path=FILE_FEATURES_DB_FILENAME, max_threads=4, hash_algorithm='md5', force_recalculate=False):
+    def __init__(self, db_path=FILE_FEATURES_DB_FILENAME, max_threads=4, hash_algorithm=DEFAULT_HASH_ENGINE, force_recalculate=False,
+                 batch_size=1000, size_prefilter=False, staged_hash=False, extra_hash_algorithms=None,
+                 mmap_threshold=DEFAULT_MMAP_THRESHOLD, cache_polite=False, direct_io=False,
+                 device_io=False, device_threads=None, throttle=None, auto_threads=False, min_threads=1,
+                 max_auto_threads=32, executor='thread', tree_hash_threshold=None, segment_size=DEFAULT_SEGMENT_SIZE,
+                 partial_rehash=False, verify_moves=False, prune_dirs=False, full_stat=False):
         self.db_path = db_path
         self.conn = None
         self.cursor = None
+        self.writer = None  # filedup.db_writer.FeatureWriter，初始化数据库时创建
         self.max_threads = max_threads
-        self.hash_algorithm = hash_algorithm
+        self.batch_size = batch_size  # 每批写入数据库的记录数
+        self.hash_algorithm = resolve_engine_name(hash_algorithm)  # 不可用的引擎在这里回退，保证入库的算法标签一致
+        # 附加哈希算法：与主哈希在同一次读取中计算，各自保存在独立的列中（如hash_sha256）
+        self.extra_hash_algorithms = []
+        for name in extra_hash_algorithms or []:
+            name = resolve_engine_name(name)
+            if name != self.hash_algorithm and name not in self.extra_hash_algorithms:
+                self.extra_hash_algorithms.append(name)
+        self.extra_hash_columns = []  # 数据库中所有的附加哈希列，初始化数据库时确定
         self.force_recalculate = force_recalculate
+        self.size_prefilter = size_prefilter  # 只对存在相同大小文件的文件计算哈希值
+        self.size_filter = None
+        self.staged_hash = staged_hash  # 分阶段哈希：首尾采样 -> 内部采样 -> 完整哈希
+        self.mmap_threshold = mmap_threshold  # 不小于该大小的文件通过mmap计算哈希，None表示不使用mmap
+        self.cache_polite = cache_polite  # 页缓存友好模式：计算哈希后丢弃本次读入的页缓存
+        self.direct_io = direct_io  # 页缓存友好模式下使用O_DIRECT读取
+        self.io_stats = IOStats()  # 哈希读取统计
+        self.device_io = device_io  # 按设备（st_dev）分配工作线程池，设备内按inode顺序处理
+        self.device_threads = device_threads or []  # 指定设备的线程数，["路径=线程数", ...]
+        self.throttle = throttle  # filedup.throttle.ScanThrottle，限制扫描的读取速率和文件速率，None表示不限速
+        self.auto_threads = auto_threads  # 按吞吐量自动调整哈希线程数（按设备调度时不使用）
+        self.min_threads = min_threads  # 自动调整的线程数下限
+        self.max_auto_threads = max_auto_threads  # 自动调整的线程数上限
+        self.executor = executor  # 扫描执行器：'thread'（线程流水线）或'process'（多进程，适合小文件为主的目录）
+        self.tree_hash_threshold = tree_hash_threshold  # 不小于该大小的文件使用分段树哈希，None表示不使用
+        self.segment_size = segment_size  # 树哈希的段大小
+        self.tree_hasher = TreeHasher(max_threads)
+        self.partial_rehash = partial_rehash  # 树哈希文件变化时按段清单只重新读取采样摘要变化的段
+        self.pending_segments = {}  # 文件路径 -> (根哈希, [(偏移量, 长度, 段摘要, 采样摘要), ...])，由写入阶段保存到file_segments表
+        self.segments_lock = threading.Lock()
+        self.inode_cache = InodeHashCache()  # 本次扫描中已计算的inode哈希，硬链接只计算一次
+        self.known_inodes = {}  # 数据库中有多个链接的inode -> (大小, 修改时间, 哈希值, 修改时间是否只精确到微秒)，由get_existing_file_info加载
+        self.inode_paths = {}  # 数据库中的(设备号, inode) -> 文件路径，用于识别被移动或重命名的文件
+        self.verify_moves = verify_moves  # 识别为移动的文件再比较首尾采样摘要确认
+        self.prune_dirs = prune_dirs  # 增量扫描时跳过列表未变化的目录中的文件（不逐个stat）
+        self.full_stat = full_stat  # 强制完整stat扫描，只更新目录状态
+        self.dir_tracker = None  # 本次扫描的filedup.dir_state.DirStateTracker，由遍历器使用
         # self.register_handlers=[] #[{"ext":None,"handler":rw_interface.RWInterface}]
         self.progress_bar=None
         self.rw_reg_handlers:RWRegHandlers = get_RWRegHandlers() # 注册文件处理器
         self.initialize_database()
         
         
+    def file_info_query(self):
+        """读取已有文件信息的查询语句（不含WHERE），查询结果的每一行由file_info_from_row转换"""
+        extra_columns = [hash_column(name) for name in self.extra_hash_algorithms]
+        return ("SELECT file_path, file_size, mtime_ns, alg_id, file_hash, ctime_ns, owner_id, "
+                "device, inode, nlink, stage1_hash, mtime_coarse"
+                + "".join(f", {column}" for column in extra_columns) + " FROM file_features")
+    
+    def file_info_from_row(self, row):
+        """file_info_query的一行 -> (文件路径, 文件信息字典, 链接数)"""
+        (file_path, file_size, mtime_ns, alg_id, digest, ctime_ns, owner_id,
+         device, inode, nlink, stage1_hash, mtime_coarse) = row[:12]
+        return file_path, {
+            'size': file_size,
+            'mtime_ns': mtime_ns,
+            'mtime_coarse': bool(mtime_coarse),
+            'hash': self.codec.decode_hash(alg_id, digest),
+            'ctime_ns': ctime_ns,
+            'owner': self.codec.owner_name(owner_id),
+            'device': device,
+            'inode': inode,
+            'stage1_hash': stage1_hash,
+            'extra_hashes': {name: value for name, value in zip(self.extra_hash_algorithms, row[12:]) if value}
+        }, nlink
+    
     def get_existing_file_info(self):
         """获取数据库中所有文件的信息，用于在多线程扫描前判断是否需要重新计算哈希值和保存文件属性"""
         file_info = {}
+        self.known_inodes = {}
+        self.inode_paths = {}
         try:
-            self.cursor.execute("SELECT file_path, file_size, modified_time, file_hash, created_time, accessed_time, owner FROM file_features")
+            self.cursor.execute(self.file_info_query())
             for row in self.cursor.fetchall():
-                file_path, file_size, modified_time, file_hash, created_time, accessed_time, owner = row
-                file_info[file_path] = {
-                    'size': file_size,
-                    'modified_time': modified_time,
-                    'hash': file_hash,
-                    'created_time': created_time,
-                    'accessed_time': accessed_time,
-                    'owner': owner
-                }
+                file_path, info, nlink = self.file_info_from_row(row)
+                file_info[file_path] = info
+                key = inode_key(info['device'], info['inode'])
+                if key and nlink and nlink > 1 and info['hash']:
+                    self.known_inodes[key] = (info['size'], info['mtime_ns'], info['hash'], info['mtime_coarse'])
+                if key and info['mtime_ns'] is not None:
+                    self.inode_paths[key] = file_path
+            if self.partial_rehash and self.tree_hash_threshold is not None:
+                self._load_segment_manifests(file_info)
         except sqlite3.Error as e:
             log_print(f"获取已有文件信息时出错: {e}",LOG_LEVEL_ERROR)
         return file_info
@@ -64,65 +155,156 @@ class FileDuplicateFinder:
             self.conn.execute('PRAGMA synchronous = NORMAL')
             
             self.cursor = self.conn.cursor()
-            # 创建文件特征表
+            # 第1版数据库（文本时间和哈希值）原地迁移到当前结构，迁移后回收空间
+            version = schema_version(self.cursor)
+            if version is not None and version < SCHEMA_VERSION:
+                log_print(f"升级数据库：正在迁移 {self.db_path} 到第{SCHEMA_VERSION}版结构...",log_level=LOG_LEVEL_INFO)
+                migrate_v1(self.conn)
+                self.conn.execute('VACUUM')
+            # 创建文件特征表及其查找表（时间为整数纳秒，主哈希为算法编号加二进制摘要，所有者为owners表的编号）
+            self.cursor.execute(OWNERS_TABLE)
+            self.cursor.execute(HASH_ALGORITHMS_TABLE)
+            self.cursor.execute(file_features_table())
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            # 硬链接和移动文件按inode查找，重复文件按哈希分组，大小碰撞按大小分组
+            self._ensure_indexes('file_features', [('idx_file_features_inode', 'device, inode'),
+                                                   ('idx_file_features_hash', 'file_hash'),
+                                                   ('idx_file_features_size', 'file_size')])
+            # 重复文件组汇总表，由file_features上的触发器维护
+            if ensure_dup_groups(self.cursor):
+                log_print("升级数据库：创建重复文件组汇总表 dup_groups",log_level=LOG_LEVEL_INFO)
+            # 为附加哈希算法添加列，并记录数据库中已有的全部附加哈希列
+            self._ensure_columns('file_features', [('mtime_coarse', 'INTEGER')] +
+                                 [(hash_column(name), 'TEXT') for name in self.extra_hash_algorithms])
+            self.cursor.execute("PRAGMA table_info(file_features)")
+            self.extra_hash_columns = [row[1] for row in self.cursor.fetchall() if row[1].startswith(HASH_COLUMN_PREFIX)]
+            self.codec = FeatureCodec(self.cursor)
+            self.writer = FeatureWriter(self.cursor, self.extra_hash_columns, self.codec)
+            # 树哈希的各段摘要，root_hash与file_features中的哈希值（文本形式）相同时有效
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS file_segments (
+                    file_path TEXT NOT NULL,
+                    segment_index INTEGER NOT NULL,
+                    segment_offset INTEGER NOT NULL,
+                    segment_length INTEGER NOT NULL,
+                    segment_hash TEXT NOT NULL,
+                    root_hash TEXT NOT NULL,
+                    sample_hash TEXT,
+                    PRIMARY KEY (file_path, segment_index)
+                )
+            ''')
+            self._ensure_columns('file_segments', [('sample_hash', 'TEXT')])
+            # 目录状态：上次扫描时目录的修改时间、条目数和子项名称摘要，用于增量扫描时跳过列表未变化的目录
             self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS file_features (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_path TEXT UNIQUE NOT NULL,
-                    file_size INTEGER,
-                    created_time TEXT,
-                    modified_time TEXT,
-                    accessed_time TEXT,
-                    owner TEXT,
-                    file_hash TEXT,
-                    last_checked TEXT
+                CREATE TABLE IF NOT EXISTS dir_state (
+                    dir_path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    entry_count INTEGER NOT NULL,
+                    names_digest TEXT NOT NULL,
+                    last_checked INTEGER
+                )
+            ''')
+            # 重复文件组逐字节校验结果，members_digest对应校验时的组成员及其修改时间，成员或修改时间变化后校验结果失效
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS verified_groups (
+                    file_hash TEXT PRIMARY KEY,
+                    members_digest TEXT NOT NULL,
+                    verified INTEGER NOT NULL,
+                    verified_time INTEGER
                 )
             ''')
             self.conn.commit()
         except sqlite3.Error as e:
             log_print(f"数据库初始化错误: {e}",LOG_LEVEL_ERROR)
     
-    def calculate_file_hash(self, file_path, block_size=1048576, hash_algorithm='md5'):
+    def _ensure_indexes(self, table, indexes):
+        """检查表中是否缺少指定的索引，缺少则创建（旧数据库较大时创建索引需要一些时间）"""
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,))
+        existing_indexes = {row[0] for row in self.cursor.fetchall()}
+        for name, columns in indexes:
+            if name not in existing_indexes:
+                log_print(f"升级数据库：为 {table} 创建索引 {name} ({columns})",log_level=LOG_LEVEL_INFO)
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    
+    def _ensure_columns(self, table, columns):
+        """检查表中是否缺少指定的列，缺少则添加（用于升级旧数据库）"""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        existing_columns = {row[1] for row in self.cursor.fetchall()}
+        for name, col_type in columns:
+            if name not in existing_columns:
+                log_print(f"升级数据库：为 {table} 添加列 {name}",log_level=LOG_LEVEL_INFO)
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+    
+    def calculate_file_hash(self, file_path, block_size=None, hash_algorithm=DEFAULT_HASH_ENGINE, file_size=None):
         """计算文件的哈希值
         
         Args:
             file_path: 文件路径
-            block_size: 读取块大小，默认1048576字节
-            hash_algorithm: 哈希算法，可选'md5'、'sha1'、'sha256'，默认'md5'
+            block_size: 读取块大小，默认None表示按文件大小和设备自动确定
+            hash_algorithm: 哈希引擎名称（见filedup.hash_engines），默认'md5'
+            file_size: 已知的文件大小（来自调用方的stat结果），为None时从打开的文件句柄获取
             
         Returns:
             哈希值字符串，如果出错则返回None
         """
-        # 验证哈希算法
-        if hash_algorithm not in hashlib.algorithms_available:
-            print(f"不支持的哈希算法: {hash_algorithm}，使用md5")
-            hash_algorithm = 'md5'
+        # 验证哈希引擎，不可用时回退
+        hash_algorithm = resolve_engine_name(hash_algorithm)
+        hashes = self.calculate_file_hashes(file_path, [hash_algorithm], block_size=block_size, file_size=file_size)
+        return hashes[hash_algorithm] if hashes else None
+    
+    def calculate_file_hashes(self, file_path, hash_algorithms, block_size=None, file_size=None):
+        """一次读取文件，把每个数据块同时交给多个哈希引擎，计算多个哈希值
         
+        读取使用每个线程复用的缓冲区（见filedup.hash_io），不为每个数据块分配新对象；
+        不小于mmap_threshold的文件通过mmap映射直接交给哈希对象，映射失败时回退到普通读取；
+        页缓存友好模式（cache_polite）下读取后丢弃本次读入的页缓存，或使用O_DIRECT读取。
+        
+        Args:
+            file_path: 文件路径
+            hash_algorithms: 哈希引擎名称列表
+            block_size: 读取块大小，默认None表示按文件大小和设备自动确定
+            file_size: 已知的文件大小（来自调用方的stat结果），为None时从打开的文件句柄获取
+            
+        Returns:
+            dict: 引擎名称 -> 带算法前缀的哈希值，如果出错则返回None
+        """
         try:
+            # 主哈希的标签只由文件大小和树哈希阈值决定（见expected_hash_tag），与是否同时计算附加哈希无关
+            if self.tree_hash_threshold is not None and self.hash_algorithm in hash_algorithms:
+                if file_size is None:
+                    file_size = os.stat(file_path).st_size
+                if file_size >= self.tree_hash_threshold:
+                    # 附加哈希在读取各段时同时计算
+                    extras = [(name, new_hasher(name)) for name in hash_algorithms if name != self.hash_algorithm]
+                    file_hash = self.calculate_tree_hash(file_path, file_size,
+                                                         extra_hashers=[hasher for _, hasher in extras])
+                    return {self.hash_algorithm: file_hash,
+                            **{name: f"{name}:{hasher.hexdigest()}" for name, hasher in extras}}
+            
             # 创建哈希对象
-            hasher = hashlib.new(hash_algorithm)
+            hashers = [(name, new_hasher(name)) for name in hash_algorithms]
             
-            # 获取文件大小用于进度显示
-            file_size = os.path.getsize(file_path)
-            processed_size = 0
+            state = {'step': 0, 'processed': 0}
+            
+            def on_block(processed_size, total_size):
+                # 限速：按本块读取的字节数消耗令牌
+                if self.throttle:
+                    self.throttle.limit_bytes(processed_size - state['processed'])
+                    state['processed'] = processed_size
+                # 对于大于100MB的文件，每10%进度显示一次
+                if total_size > 100 * 1024 * 1024:
+                    step = processed_size * 10 // total_size
+                    if step != state['step']:
+                        state['step'] = step
+                        print(f"\r计算文件哈希 {os.path.basename(file_path)}: {processed_size / total_size * 100:.1f}%",end='')
             
             # 读取整个文件计算哈希值
-            with open(file_path, 'rb') as file:
-                buf = file.read(block_size)
-                while len(buf) > 0:
-                    hasher.update(buf)
-                    processed_size += len(buf)
-                    buf = file.read(block_size)
-                    
-                    # 对于大文件显示进度
-                    if file_size > 100 * 1024 * 1024:  # 大于100MB的文件
-                        progress = (processed_size / file_size) * 100
-                        # 每10%进度显示一次
-                        if int(progress) % 10 == 0 and int((processed_size - len(buf)) / file_size * 100) % 10 != 0:
-                            print(f"\r计算文件哈希 {os.path.basename(file_path)}: {progress:.1f}%",end='')
+            hash_file(file_path, [hasher for _, hasher in hashers], block_size=block_size, file_size=file_size,
+                      progress=on_block, mmap_threshold=self.mmap_threshold,
+                      cache_polite=self.cache_polite, direct_io=self.direct_io, stats=self.io_stats)
             
             # 返回带算法前缀的哈希值，便于区分
-            return f"{hash_algorithm}:{hasher.hexdigest()}"
+            return {name: f"{name}:{hasher.hexdigest()}" for name, hasher in hashers}
             
         except (PermissionError, FileNotFoundError) as e:
             log_print(f"无法计算文件哈希 {file_path}: {e}",LOG_LEVEL_ERROR)
@@ -131,387 +313,741 @@ class FileDuplicateFinder:
             log_print(f"计算哈希时发生未知错误 {file_path}: {e}",LOG_LEVEL_ERROR)
             return None
             
+    def expected_hash_tag(self, file_size):
+        """指定大小的文件在当前设置下应有的哈希标签：超过树哈希阈值的文件使用树哈希标签"""
+        if self.tree_hash_threshold is not None and file_size is not None and file_size >= self.tree_hash_threshold:
+            return tree_tag(self.hash_algorithm, self.segment_size)
+        return self.hash_algorithm
+    
+    def calculate_tree_hash(self, file_path, file_size, manifest=None, extra_hashers=None):
+        """计算大文件的分段树哈希：各段由段线程池并行计算，段摘要暂存后由写入阶段保存
+        
+        Args:
+            manifest: 上次计算的段清单 {偏移量: (长度, 段摘要, 采样摘要)}；文件变大（追加写入）时原来最后一段之前、
+                      采样摘要未变的段直接复用，只需读取原来的最后一段和新增的段；大小未增加的文件重新读取所有段
+            extra_hashers: 整个文件的附加哈希对象，与各段摘要在同一次读取中计算（此时各段按顺序读取）
+        Returns:
+            带树哈希标签的根哈希值；文件读取失败时抛出OSError
+        """
+        def on_bytes(n):
+            if self.throttle:
+                self.throttle.limit_bytes(n)
+        
+        # 各段与整个文件使用同样的读取方式：页缓存友好模式下超大文件同样不占用页缓存，读取统计由各段计入
+        read_options = {'cache_polite': self.cache_polite, 'direct_io': self.direct_io, 'stats': self.io_stats}
+        log_print(f"分段计算文件哈希 {file_path}",log_level=LOG_LEVEL_DEBUG)
+        # 采样摘要只用于部分重算，未启用时不读取采样块
+        root, segments, reused = self.tree_hasher.hash_file(file_path, self.hash_algorithm, file_size,
+                                                            self.segment_size, on_bytes, manifest, read_options,
+                                                            samples=self.partial_rehash, extra_hashers=extra_hashers)
+        if manifest:
+            log_print(f"部分重算文件哈希 {file_path}：复用 {reused}/{len(segments)} 段",log_level=LOG_LEVEL_INFO)
+        file_hash = f"{tree_tag(self.hash_algorithm, self.segment_size)}:{root}"
+        with self.segments_lock:
+            self.pending_segments[os.path.normpath(file_path)] = (file_hash, segments)
+        return file_hash
+    
+    def _hash_inode_once(self, file_path, meta):
+        """计算文件哈希，多个硬链接指向同一inode时只读取一次
+        
+        链接数大于1的文件先查找数据库中同一inode其他路径的哈希值（大小和修改时间一致时直接复用），
+        再通过本次扫描的inode缓存，保证并发处理同一inode的多个路径时只有一个线程读取文件。
+        链接数未知（没有inode信息）的文件按单个链接处理。
+        """
+        file_size = meta['file_size']
+        compute = lambda: self.calculate_file_hash(file_path, hash_algorithm=self.hash_algorithm, file_size=file_size)
+        fill_inode(meta, file_path)
+        key = inode_key(meta['device'], meta['inode'])
+        if key is None or not meta['nlink'] or meta['nlink'] <= 1:
+            return compute()
+        known = None if self.force_recalculate else self.known_inodes.get(key)
+        if known and known[0] == file_size and mtime_matches(known[1], meta['mtime_ns'], known[3]) and \
+                hash_tag(known[2]) == self.expected_hash_tag(file_size):
+            log_print(f"跳过哈希计算 {file_path} (硬链接，复用同一inode的哈希值)",log_level=LOG_LEVEL_DEBUG)
+            return known[2]
+        return self.inode_cache.get_or_compute(key, compute)
+    
+    def move_candidate(self, key, existing_file_info):
+        """按(设备号, inode)查找数据库中可能是同一文件的旧记录，返回(旧路径, 旧记录)或None（确认由find_moved_from完成）"""
+        old_path = self.inode_paths.get(key)
+        if old_path is None or old_path not in existing_file_info:
+            return None
+        return old_path, existing_file_info[old_path]
+    
+    def find_moved_from(self, file_path, meta, existing_file_info):
+        """数据库中没有记录的新路径：按(设备号, inode, 大小, 纳秒修改时间)查找它被移动或重命名之前的路径
+        
+        只处理链接数为1的文件，此时旧路径不可能仍指向同一inode；有多个链接的文件由硬链接逻辑处理。
+        DirEntry的stat结果没有inode信息时（Windows）先用os.stat补齐。
+        
+        Returns:
+            旧路径，不是移动的文件时返回None
+        """
+        fill_inode(meta, file_path)
+        if meta['inode'] is None or meta['nlink'] != 1:
+            return None
+        candidate = self.move_candidate(inode_key(meta['device'], meta['inode']), existing_file_info)
+        if candidate is None:
+            return None
+        old_path, old_info = candidate
+        if old_path == file_path or (old_info['device'], old_info['size']) != (meta['device'], meta['file_size']) or \
+                not mtime_matches(old_info['mtime_ns'], meta['mtime_ns'], old_info.get('mtime_coarse')):
+            return None
+        if self.verify_moves and not self._move_sample_matches(file_path, old_info):
+            log_print(f"采样摘要不一致，不作为移动处理 {old_path} -> {file_path}",log_level=LOG_LEVEL_DEBUG)
+            return None
+        log_print(f"识别为移动的文件 {old_path} -> {file_path}",log_level=LOG_LEVEL_DEBUG)
+        return old_path
+    
+    def _move_sample_matches(self, file_path, old_info):
+        """比较新路径的首尾采样摘要与旧记录中保存的值；小文件直接比较完整哈希，没有保存采样摘要时无法确认"""
+        offsets = stage_offsets(old_info['size'], 1)
+        if not offsets:
+            return bool(old_info['hash']) and old_info['hash'] == self.calculate_file_hash(
+                file_path, hash_algorithm=self.hash_algorithm, file_size=old_info['size'])
+        stored = old_info.get('stage1_hash')
+        if not stored or hash_tag(stored) != self.hash_algorithm:
+            return False
+        return sample_digest(file_path, offsets, self.hash_algorithm) == stored
+    
+    def _rewrite_moved_path(self, old_path, new_path, inode=None):
+        """把数据库中旧路径的记录改为新路径（文件被移动或重命名），不提交事务
+        
+        inode不为None时只改写inode一致的记录：旧路径已被其他文件占用并先写入了新记录时不改写。
+        
+        Returns:
+            是否改写了记录
+        """
+        self.cursor.execute(
+            "UPDATE file_features SET file_path = ? WHERE file_path = ? AND (? IS NULL OR inode = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM file_features WHERE file_path = ?)",
+            (new_path, old_path, inode, inode, new_path)
+        )
+        if self.cursor.rowcount <= 0:
+            return False
+        self.cursor.execute("UPDATE file_segments SET file_path = ? WHERE file_path = ?", (new_path, old_path))
+        return True
+    
+    def _flush_segments(self):
+        """把暂存的段摘要写入file_segments表（在写入线程中调用，由调用方提交事务）"""
+        with self.segments_lock:
+            pending, self.pending_segments = self.pending_segments, {}
+        for file_path, (file_hash, segments) in pending.items():
+            self.cursor.execute("DELETE FROM file_segments WHERE file_path = ?", (file_path,))
+            self.cursor.executemany(
+                "INSERT INTO file_segments (file_path, segment_index, segment_offset, segment_length, segment_hash, "
+                "root_hash, sample_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(file_path, index, offset, length, digest, file_hash, sample)
+                 for index, (offset, length, digest, sample) in enumerate(segments)]
+            )
+    
+    def _load_segment_manifests(self, file_info):
+        """把有效的段清单（root_hash与当前file_hash一致）加入get_existing_file_info的结果，供部分重算使用"""
+        self.cursor.execute(f'''
+            SELECT s.file_path, s.segment_offset, s.segment_length, s.segment_hash, s.sample_hash
+            FROM file_segments s JOIN file_features f ON f.file_path = s.file_path
+            WHERE f.file_hash IS NOT NULL AND s.root_hash = {hash_text_sql('f.')}
+        ''')
+        for file_path, offset, length, digest, sample in self.cursor.fetchall():
+            if file_path in file_info:
+                file_info[file_path].setdefault('segments', {})[offset] = (length, digest, sample)
+    
+    def _process_file(self, file_path, existing_file_info, entry=None):
+        """处理单个文件：获取属性并按需计算哈希值（支持选择性哈希计算和属性保存）
+        
+        参数:
+            file_path: 文件路径
+            existing_file_info: 数据库中已有的文件信息
+            entry: 遍历器产出的DirEntry，用于复用其缓存的stat结果
+        返回:
+            dict: 需要写入数据库的文件属性，出错或无法计算哈希时返回None
+        """
+        # 获取文件属性（整个处理过程只stat一次；DirEntry没有inode信息时，只有需要inode的文件再补一次os.stat）
+        meta = meta_from_stat(stat_file(file_path, entry), from_entry=entry is not None)
+        ctime_ns = meta['ctime_ns']
+        mtime_ns = meta['mtime_ns']
+        file_size = meta['file_size']
+        file_owner = meta['owner']
+        current_time = time.time_ns()
+        
+        # 决定是否需要重新计算哈希值
+        need_recalculate = self.force_recalculate
+        file_hash = None
+        needs_update = self.force_recalculate  # 默认需要更新
+        
+        # 新路径可能是被移动或重命名的文件：按旧路径的记录判断是否需要重新计算，写入时改写旧记录的路径；
+        # 内容未变化的移动只改写路径并更新检查时间，不重写整行（保留本次未计算的附加哈希和采样摘要）
+        moved_from = None
+        if not self.force_recalculate and file_path not in existing_file_info:
+            moved_from = self.find_moved_from(file_path, meta, existing_file_info)
+            if moved_from:
+                existing_file_info = {file_path: existing_file_info[moved_from]}
+        
+        if not self.force_recalculate and file_path in existing_file_info:
+            # 检查文件大小和修改时间是否变化
+            existing_info = existing_file_info[file_path]
+            existing_key = inode_key(existing_info.get('device'), existing_info.get('inode'))
+            if existing_key is None:
+                # 旧记录缺少inode信息：补齐后写入，之后的扫描才能识别移动和硬链接
+                fill_inode(meta, file_path)
+            # DirEntry没有inode信息时不比较（不为此增加stat），文件被替换由大小和修改时间的变化发现
+            if not meta['inode_pending'] and existing_key != inode_key(meta['device'], meta['inode']):
+                # 旧记录缺少inode信息或inode已变化（文件被替换），需要写入新的inode
+                needs_update = True
+            if existing_info.get('mtime_coarse') and mtime_matches(existing_info['mtime_ns'], mtime_ns, coarse=True):
+                # 由第1版迁移的记录只有微秒精度的修改时间：微秒内一致视为未变化，写入精确的纳秒修改时间
+                existing_info = dict(existing_info, mtime_ns=mtime_ns)
+                needs_update = True
+            if existing_info['hash'] and hash_tag(existing_info['hash']) != self.expected_hash_tag(file_size):
+                # 使用其他哈希引擎（或其他树哈希设置）计算的哈希值不能与当前设置的结果比较，视为未计算
+                existing_info = dict(existing_info, hash=None)
+            
+            # 检查是否所有属性都相同
+            if (existing_info['size'] == file_size and 
+                existing_info['mtime_ns'] == mtime_ns and
+                existing_info['ctime_ns'] == ctime_ns and
+                 existing_info['owner'] == file_owner):
+               
+                # 所有属性都未变更，使用数据库中的哈希值
+                file_hash = existing_info['hash']
+                log_print(f"跳过哈希计算和数据库更新 {file_path} (所有属性未变更)",log_level=LOG_LEVEL_DEBUG)
+                need_recalculate = False
+            else:
+                # 属性有变更，但大小或修改时间未变，可能只需要更新其他属性
+                if existing_info['size'] == file_size and existing_info['mtime_ns'] == mtime_ns:
+                    file_hash = existing_info['hash']
+                    log_print(f"跳过哈希计算 {file_path} (大小和修改时间未变更)",log_level=LOG_LEVEL_DEBUG)
+                    need_recalculate = False
+                else:
+                    need_recalculate = True
+        else:
+            need_recalculate = True
+        
+        # 附加哈希：文件未变化时复用已有的值，缺少的与主哈希在同一次读取中计算
+        extra_hashes = {}
+        if not need_recalculate and file_path in existing_file_info:
+            extra_hashes = dict(existing_file_info[file_path].get('extra_hashes', {}))
+        missing_extras = [name for name in self.extra_hash_algorithms if name not in extra_hashes]
+        
+        # 树哈希文件有变化时，使用段清单只重新读取变化的段
+        manifest = None
+        if self.partial_rehash and need_recalculate and not self.force_recalculate and not missing_extras:
+            existing_info = existing_file_info.get(file_path, {})
+            if existing_info.get('segments') and hash_tag(existing_info['hash']) == self.expected_hash_tag(file_size):
+                manifest = existing_info['segments']
+        
+        # 哈希值可以复用时保留已保存的首尾采样摘要
+        stage1_hash = None
+        if not need_recalculate and file_hash:
+            stage1_hash = existing_file_info[file_path].get('stage1_hash')
+        
+        hash_deferred = False
+        if need_recalculate or not file_hash:
+            if manifest:
+                try:
+                    file_hash = self.calculate_tree_hash(file_path, file_size, manifest)
+                except Exception as e:
+                    log_print(f"部分重算文件哈希失败 {file_path}: {e}",LOG_LEVEL_ERROR)
+                    file_hash = None
+                needs_update = True
+            elif missing_extras:
+                # 需要读取整个文件计算附加哈希，主哈希顺带计算，不再推迟
+                hashes = self.calculate_file_hashes(file_path, [self.hash_algorithm] + missing_extras, file_size=file_size)
+                file_hash = hashes.pop(self.hash_algorithm) if hashes else None
+                extra_hashes.update(hashes or {})
+                needs_update = True
+            elif self.staged_hash:
+                # 分阶段哈希模式：扫描时不计算哈希，扫描结束后对同样大小的文件分阶段确认
+                file_hash = None
+                hash_deferred = True
+                needs_update = needs_update or need_recalculate
+            elif self.size_filter is not None and not self.size_filter.collides(file_size, existing_file_info.get(file_path)):
+                # 大小唯一，不可能有重复，以"未计算哈希"状态入库，出现同样大小的文件时再补算
+                log_print(f"跳过哈希计算 {file_path} (没有相同大小的文件)",log_level=LOG_LEVEL_DEBUG)
+                file_hash = None
+                hash_deferred = True
+                needs_update = needs_update or need_recalculate
+            else:
+                # 需要重新计算哈希值（硬链接只计算一次）
+                file_hash = self._hash_inode_once(file_path, meta)
+                needs_update = True  # 哈希值变化，需要更新数据库
+                if self.verify_moves and file_hash:
+                    # 记录首尾采样摘要，文件之后被移动时用于确认
+                    stage1_hash = sample_digest(file_path, stage_offsets(file_size, 1), self.hash_algorithm) \
+                        if stage_offsets(file_size, 1) else None
+        elif missing_extras:
+            # 主哈希可以复用，只补算缺少的附加哈希
+            hashes = self.calculate_file_hashes(file_path, missing_extras, file_size=file_size)
+            if not hashes:
+                return None
+            extra_hashes.update(hashes)
+            needs_update = True
+        
+        if not file_hash and not hash_deferred:
+            return None
+        needs_update = needs_update or file_path not in existing_file_info
+        if needs_update:
+            # 全面更新会写入设备号和inode，不能用DirEntry缺少的信息覆盖已有的值
+            fill_inode(meta, file_path)
+        # 只有在需要更新或文件是新的时才全面更新，否则只更新last_checked时间
+        return {
+            'file_path': file_path,
+            'file_size': file_size,
+            'ctime_ns': ctime_ns,
+            'mtime_ns': mtime_ns,
+            'atime_ns': meta['atime_ns'],
+            'owner': file_owner,
+            'device': meta['device'],
+            'inode': meta['inode'],
+            'nlink': meta['nlink'],
+            'file_hash': file_hash,
+            'stage1_hash': stage1_hash,
+            'moved_from': moved_from,
+            'last_checked': current_time,
+            'needs_update': needs_update,
+            'hash_deferred': hash_deferred,
+            'extra_hashes': extra_hashes
+        }
+            
     def _worker_thread(self, file_queue, result_queue, existing_file_info):
-        """工作线程函数，从队列获取文件并计算哈希值（支持选择性哈希计算和属性保存）"""
+        """工作线程函数，从队列获取(文件路径, DirEntry)并计算哈希值，遇到None表示队列结束"""
         while True:
+            item = file_queue.get()
+            file_path = None
             try:
-                file_path = file_queue.get(block=False)
+                if item is None:
+                    break
+                file_path, entry = item
                 if self.progress_bar:
                     self.progress_bar.update()
-                try:
-                    # 获取文件属性
-                    file_stats = os.stat(file_path)
-                    created_time = datetime.datetime.fromtimestamp(file_stats.st_ctime).isoformat()
-                    modified_time = datetime.datetime.fromtimestamp(file_stats.st_mtime).isoformat()
-                    accessed_time = datetime.datetime.fromtimestamp(file_stats.st_atime).isoformat()
-                    file_size = file_stats.st_size
-                    file_owner = self.get_file_owner(file_path)
-                    current_time = datetime.datetime.now().isoformat()
-                    
-                    # 决定是否需要重新计算哈希值
-                    need_recalculate = self.force_recalculate
-                    file_hash = None
-                    needs_update = self.force_recalculate  # 默认需要更新
-                    
-                    if not self.force_recalculate and file_path in existing_file_info:
-                        # 检查文件大小和修改时间是否变化
-                        existing_info = existing_file_info[file_path]
-                        
-                        # 检查是否所有属性都相同
-                        if (existing_info['size'] == file_size and 
-                            existing_info['modified_time'] == modified_time and
-                            existing_info['created_time'] == created_time and
-                             existing_info['owner'] == file_owner):
-                            # existing_info['accessed_time'] == accessed_time and
-                           
-                            # 所有属性都未变更，使用数据库中的哈希值
-                            file_hash = existing_info['hash']
-                            log_print(f"跳过哈希计算和数据库更新 {file_path} (所有属性未变更)",log_level=LOG_LEVEL_DEBUG)
-                            need_recalculate = False
-                            needs_update = False  # 不需要更新数据库
-                        else:
-                            # 属性有变更，但大小或修改时间未变，可能只需要更新其他属性
-                            if existing_info['size'] == file_size and existing_info['modified_time'] == modified_time:
-                                file_hash = existing_info['hash']
-                                log_print(f"跳过哈希计算 {file_path} (大小和修改时间未变更)",log_level=LOG_LEVEL_DEBUG)
-                                need_recalculate = False
-                            else:
-                                need_recalculate = True
-                    else:
-                        need_recalculate = True
-                    
-                    if need_recalculate or not file_hash:
-                        # 需要重新计算哈希值
-                        file_hash = self.calculate_file_hash(file_path, hash_algorithm=self.hash_algorithm)
-                        needs_update = True  # 哈希值变化，需要更新数据库
-                    
-                    if file_hash:
-                        # 只有在需要更新或文件是新的时才放入结果队列
-                        if needs_update or file_path not in existing_file_info:
-                            attributes = {
-                                'file_path': file_path,
-                                'file_size': file_size,
-                                'created_time': created_time,
-                                'modified_time': modified_time,
-                                'accessed_time': accessed_time,
-                                'owner': file_owner,
-                                'file_hash': file_hash,
-                                'last_checked': current_time,
-                                'needs_update': needs_update
-                            }
-                            result_queue.put(attributes)
-                        else:
-                            # 更新last_checked时间，但不做其他更改
-                            attributes = {
-                                'file_path': file_path,
-                                'file_size': file_size,
-                                'created_time': created_time,
-                                'modified_time': modified_time,
-                                'accessed_time': accessed_time,
-                                'owner': file_owner,
-                                'file_hash': file_hash,
-                                'last_checked': current_time,
-                                'needs_update': False
-                            }
-                            result_queue.put(attributes)
-                except Exception as e:
-                    log_print(f"处理文件时出错 {file_path}: {e}",log_level=LOG_LEVEL_ERROR)
-                finally:
-                    file_queue.task_done()
-            except queue.Empty:
-                break
+                attributes = self._process_file(file_path, existing_file_info, entry)
+                if attributes:
+                    result_queue.put(attributes)
             except Exception as e:
-                log_print(f"工作线程错误: {e}",log_level=LOG_LEVEL_ERROR)
-                break
+                log_print(f"处理文件时出错 {file_path}: {e}",log_level=LOG_LEVEL_ERROR)
+            finally:
+                file_queue.task_done()
     
-    def get_file_owner(self, file_path):
-        """获取文件所有者信息"""
+    def get_file_owner(self, file_path, stat_result=None):
+        """获取文件所有者信息（按uid缓存，已有stat结果时不再重复stat）"""
         try:
-            # 在Windows上使用getpass获取当前用户
-            if os.name == 'nt':
-                return getpass.getuser()
-            else:
-                # 在Unix/Linux系统上使用os.stat获取所有者
-                import pwd
-                stat_info = os.stat(file_path)
-                return pwd.getpwuid(stat_info.st_uid).pw_name
+            if stat_result is None:
+                stat_result = os.stat(file_path)
+            return owner_name(stat_result.st_uid)
         except Exception as e:
             log_print(f"无法获取文件所有者 {file_path}: {e}",LOG_LEVEL_ERROR)
             return "unknown"
     
-    def get_file_attributes(self, file_path,recalculate_hash=True):
-        """获取文件的属性信息"""
+    def get_file_attributes(self, file_path,recalculate_hash=True, stat_result=None):
+        """获取文件的属性信息（只stat一次，可传入已有的stat结果）"""
         try:
-            file_stats = os.stat(file_path)
-            # 转换时间戳为可读格式
-            created_time = datetime.datetime.fromtimestamp(file_stats.st_ctime).isoformat()
-            modified_time = datetime.datetime.fromtimestamp(file_stats.st_mtime).isoformat()
-            accessed_time = datetime.datetime.fromtimestamp(file_stats.st_atime).isoformat()
-            
-            file_size = file_stats.st_size
-            file_owner = self.get_file_owner(file_path)
-            # 计算哈希值
+            if stat_result is None:
+                stat_result = os.stat(file_path)
+            attributes = meta_from_stat(stat_result)
+            # 计算哈希值（附加哈希在同一次读取中计算）
+            attributes['file_hash'] = None
+            attributes['extra_hashes'] = {}
             if recalculate_hash:
-                file_hash = self.calculate_file_hash(file_path)
-            else:
-                file_hash = None
-            current_time = datetime.datetime.now().isoformat()
-            
-            return {
-                'file_path': file_path,
-                'file_size': file_size,
-                'created_time': created_time,
-                'modified_time': modified_time,
-                'accessed_time': accessed_time,
-                'owner': file_owner,
-                'file_hash': file_hash,
-                'last_checked': current_time
-            }
+                hashes = self.calculate_file_hashes(file_path, [self.hash_algorithm] + self.extra_hash_algorithms,
+                                                    file_size=stat_result.st_size)
+                if hashes:
+                    attributes['file_hash'] = hashes.pop(self.hash_algorithm)
+                    attributes['extra_hashes'] = hashes
+            attributes['file_path'] = file_path
+            attributes['last_checked'] = time.time_ns()
+            return attributes
         except Exception as e:
             log_print(f"无法获取文件属性 {file_path}: {e}",log_level=LOG_LEVEL_ERROR)
             return None
     
+    def _write_attributes(self, attributes_list, show_ditail=False):
+        """写入一批文件属性（不提交）"""
+        if show_ditail:
+            for attributes in attributes_list:
+                if attributes:
+                    log_print(f"处理文件: {attributes['file_path']}",log_level=LOG_LEVEL_INFO)
+        return self._write_rows(*split_rows(attributes_list, self.writer.extra_hash_columns))
+    
+    def _write_rows(self, rows, touches, moves):
+        """写入按列顺序排列的元组（不提交）：先改写被移动文件的旧记录路径，再交给批量写入器"""
+        for old_path, new_path, inode in moves:
+            self._rewrite_moved_path(old_path, new_path, inode)
+        return self.writer.write_rows(rows, touches)
+    
     def save_file_attributes(self, attributes):
         """保存文件属性到数据库，支持选择性更新（单文件版本）"""
-        if not attributes or 'file_hash' not in attributes or attributes['file_hash'] is None:
+        if not is_writable(attributes):
             return False
             
         try:
-            # 规范化文件路径，确保在数据库中存储一致的格式
-            normalized_path = os.path.normpath(attributes['file_path'])
-            
-            # 检查文件是否已存在于数据库中（使用规范化后的路径）
-            self.cursor.execute("SELECT id FROM file_features WHERE file_path = ?", (normalized_path,))
-            existing_file = self.cursor.fetchone()
-            
-            if existing_file:
-                # 检查是否需要全面更新
-                if 'needs_update' in attributes and not attributes['needs_update']:
-                    # 只更新last_checked时间
-                    self.cursor.execute(
-                        "UPDATE file_features SET last_checked = ? WHERE file_path = ?",
-                        (attributes['last_checked'], normalized_path)
-                    )
-                    return True
-                    
-                # 更新现有文件的所有属性
-                self.cursor.execute('''
-                    UPDATE file_features
-                    SET file_size = ?, created_time = ?, modified_time = ?, accessed_time = ?,
-                        owner = ?, file_hash = ?, last_checked = ?
-                    WHERE file_path = ?
-                ''', (
-                    attributes['file_size'], attributes['created_time'], attributes['modified_time'],
-                    attributes['accessed_time'], attributes['owner'], attributes['file_hash'],
-                    attributes['last_checked'], normalized_path
-                ))
-            else:
-                # 插入新文件（使用规范化后的路径）
-                self.cursor.execute('''
-                    INSERT INTO file_features (
-                        file_path, file_size, created_time, modified_time, accessed_time,
-                        owner, file_hash, last_checked
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    normalized_path, attributes['file_size'], attributes['created_time'],
-                    attributes['modified_time'], attributes['accessed_time'], attributes['owner'],
-                    attributes['file_hash'], attributes['last_checked']
-                ))
+            self._write_attributes([attributes])
+            self._flush_segments()
             self.conn.commit()
             return True
         except sqlite3.Error as e:
             log_print(f"保存文件属性错误: {e}",log_level=LOG_LEVEL_ERROR)
             self.conn.rollback()
+            # 回滚后查找表缓存中可能有未提交的编号
+            self.codec.reload()
             return False
             
     def batch_save_file_attributes(self, attributes_list,show_ditail=False):
-        """批量保存文件属性到数据库，使用事务提高性能"""
+        """批量保存文件属性到数据库：一个事务内用executemany执行UPSERT，未变化的文件只批量更新last_checked"""
         if not attributes_list:
             return False
-            
+        return self._save_batch(lambda: self._write_attributes(attributes_list, show_ditail))
+    
+    def batch_save_rows(self, rows, touches, moves):
+        """
+        批量保存多进程工作进程生成的元组，事务处理与batch_save_file_attributes相同
+        
+        参数:
+            rows: filedup.db_writer.raw_row的结果列表
+            touches: (last_checked, 文件路径)列表
+            moves: (旧路径, 新路径, inode)列表，先改写被移动文件的旧记录路径
+        """
+        if not (rows or touches):
+            return False
+        return self._save_batch(lambda: self._write_rows(rows, touches, moves))
+    
+    def _save_batch(self, write):
+        """在一个事务中执行write()并保存暂存的段摘要，出错时回滚"""
         try:
-            # 开始事务
-            self.cursor.execute('BEGIN TRANSACTION')
-            
-            for attributes in attributes_list:
-                if show_ditail:
-                    log_print(f"处理文件: {attributes['file_path']}",log_level=LOG_LEVEL_INFO)
-                if not attributes or 'file_hash' not in attributes or attributes['file_hash'] is None:
-                    continue
-                     
-                # 规范化文件路径，确保在数据库中存储一致的格式
-                normalized_path = os.path.normpath(attributes['file_path'])
-                
-                # 检查文件是否已存在于数据库中（使用规范化后的路径）
-                self.cursor.execute("SELECT id FROM file_features WHERE file_path = ?", (normalized_path,))
-                existing_file = self.cursor.fetchone()
-                
-                if existing_file:
-                    # 检查是否需要全面更新
-                    if 'needs_update' in attributes and not attributes['needs_update']:
-                        # 只更新last_checked时间
-                        self.cursor.execute(
-                            "UPDATE file_features SET last_checked = ? WHERE file_path = ?",
-                            (attributes['last_checked'], normalized_path)
-                        )
-                        continue
-                     
-                    # 更新现有文件的所有属性
-                    self.cursor.execute('''
-                        UPDATE file_features
-                        SET file_size = ?, created_time = ?, modified_time = ?, accessed_time = ?,
-                            owner = ?, file_hash = ?, last_checked = ?
-                        WHERE file_path = ?
-                    ''', (
-                        attributes['file_size'], attributes['created_time'], attributes['modified_time'],
-                        attributes['accessed_time'], attributes['owner'], attributes['file_hash'],
-                        attributes['last_checked'], normalized_path
-                    ))
-                else:
-                    # 插入新文件（使用规范化后的路径）
-                    self.cursor.execute('''
-                        INSERT INTO file_features (
-                            file_path, file_size, created_time, modified_time, accessed_time,
-                            owner, file_hash, last_checked
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        normalized_path, attributes['file_size'], attributes['created_time'],
-                        attributes['modified_time'], attributes['accessed_time'], attributes['owner'],
-                        attributes['file_hash'], attributes['last_checked']
-                    ))
-            
+            # 开始事务（调用方已有未提交的写入时并入该事务）
+            if not self.conn.in_transaction:
+                self.cursor.execute('BEGIN TRANSACTION')
+            write()
+            self._flush_segments()
             # 一次性提交所有更改
             self.conn.commit()
             return True
         except sqlite3.Error as e:
             log_print(f"批量保存文件属性错误: {e}",log_level=LOG_LEVEL_ERROR)
             self.conn.rollback()
+            self.codec.reload()
             return False
     
+    def _path_range(self, column, root_dir):
+        """根目录本身及其下所有路径的查询条件和参数（按路径范围比较，不受LIKE通配符影响，可以使用索引）"""
+        prefix = root_dir.rstrip(os.sep) + os.sep
+        return (f"({column} = ? OR ({column} >= ? AND {column} < ?))",
+                (root_dir, prefix, prefix[:-1] + chr(ord(os.sep) + 1)))
+    
+    def _dir_range(self, root_dir):
+        """根目录及其所有子目录在dir_state表中的查询条件和参数"""
+        return self._path_range('dir_path', root_dir)
+    
+    def create_dir_tracker(self, directory_path, known_files, collect_pruned=False):
+        """创建目录状态跟踪器：加载根目录下所有目录的已保存状态；未启用目录剪枝时返回None"""
+        if not (self.prune_dirs or self.full_stat):
+            return None
+        condition, params = self._dir_range(norm_root_dir(directory_path))
+        stored_states = {}
+        try:
+            self.cursor.execute(f"SELECT dir_path, mtime_ns, entry_count, names_digest FROM dir_state WHERE {condition}", params)
+            stored_states = {row[0]: tuple(row[1:]) for row in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            log_print(f"读取目录状态错误: {e}",log_level=LOG_LEVEL_ERROR)
+        return DirStateTracker(stored_states, known_files, prune=self.prune_dirs and not self.full_stat,
+                               collect_pruned=collect_pruned)
+    
+    def save_dir_states(self, directory_path, tracker):
+        """用本次遍历记录的目录状态替换根目录下的全部已保存状态（已删除的目录随之清除）"""
+        condition, params = self._dir_range(norm_root_dir(directory_path))
+        current_time = time.time_ns()
+        try:
+            self.cursor.execute(f"DELETE FROM dir_state WHERE {condition}", params)
+            self.cursor.executemany(
+                "INSERT INTO dir_state (dir_path, mtime_ns, entry_count, names_digest, last_checked) VALUES (?, ?, ?, ?, ?)",
+                [(dir_path, *state, current_time) for dir_path, state in tracker.states.items()]
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            log_print(f"保存目录状态错误: {e}",log_level=LOG_LEVEL_ERROR)
+            self.conn.rollback()
+    
     def scan_directory(self, directory_path):
-        """扫描目录及其子目录中的所有文件（多线程版本，支持批量处理）"""
+        """扫描目录及其子目录中的所有文件（流水线版本：遍历、哈希计算、批量写入并发执行）"""
         if not os.path.isdir(directory_path):
             log_print(f"目录不存在: {directory_path}",log_level=LOG_LEVEL_ERROR)
             return 0
             
-        # 收集所有文件路径
-        all_files = []
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_path = norm_exists_path(file_path,skip_link=True)  # 确保路径是真实路径名称,并跳过符号链接
-                if file_path is not None:
-                    all_files.append(file_path)
-        
-        total_files = len(all_files)
-        if total_files == 0:
-            log_print("未找到任何文件。",log_level=LOG_LEVEL_INFO)
-            return 0
-            
         # 在主线程中获取现有文件信息，避免在工作线程中访问数据库
         existing_file_info = {} if self.force_recalculate else self.get_existing_file_info()
         
-        log_print(f"找到 {total_files} 个文件，开始使用 {self.max_threads} 个线程并行处理...",log_level=LOG_LEVEL_INFO)
-        
-        # 创建队列
-        file_queue = queue.Queue()
-        result_queue = queue.Queue()
-        
-        # 填充文件队列
-        for file_path in all_files:
-            file_queue.put(file_path)
-        
-        self.progress_bar = ProgressBar(total_files)
-               
-        # 创建并启动工作线程
-        threads = []
-        for _ in range(min(self.max_threads, total_files)):
-            # 将现有文件信息传递给工作线程，避免工作线程直接访问数据库
-            thread = threading.Thread(target=self._worker_thread, args=(file_queue, result_queue, existing_file_info))
-            thread.daemon = True
-            thread.start()
-            threads.append(thread)
+        if self.executor == 'process':
+            log_print(f"开始使用 {self.max_threads} 个进程处理...",log_level=LOG_LEVEL_INFO)
+            if self.size_prefilter or self.device_io or self.auto_threads:
+                log_print("多进程执行器不支持大小预过滤、按设备调度和自动调整线程数，已忽略这些选项",log_level=LOG_LEVEL_WARN)
+            if self.throttle:
+                log_print("多进程执行器按批次限制读取速率：每个批次读取完成后才计入字节限速，瞬时速率可能超过上限",log_level=LOG_LEVEL_WARN)
+        elif self.device_io:
+            log_print("开始按设备分配线程池流水线处理...",log_level=LOG_LEVEL_INFO)
+        elif self.auto_threads:
+            log_print(f"开始流水线处理，哈希线程数在 {self.min_threads}~{self.max_auto_threads} 之间自动调整...",log_level=LOG_LEVEL_INFO)
+        else:
+            log_print(f"开始使用 {self.max_threads} 个线程流水线处理...",log_level=LOG_LEVEL_INFO)
         
-        # 等待所有工作线程完成
-        for thread in threads:
-            thread.join()
+        if self.size_prefilter and self.executor != 'process':
+            self.size_filter = SizeCollisionFilter.from_database(self.cursor)
         
-        # 关闭进度条
-        if self.progress_bar:
+        self.io_stats.reset()
+        self.inode_cache.clear()
+        self.dir_tracker = None if self.force_recalculate else self.create_dir_tracker(directory_path, existing_file_info)
+        if self.throttle:
+            self.throttle.throttled_time = 0.0
+        # 总文件数在遍历过程中逐步确定
+        self.progress_bar = ProgressBar(0)
+        device_scheduler = None
+        if self.device_io and self.executor != 'process':
+            device_scheduler = DeviceScheduler(self.max_threads, parse_device_threads(self.device_threads))
+        controller = None
+        if self.auto_threads and not self.device_io and self.executor != 'process':
+            controller = WorkerController(self.min_threads, self.max_auto_threads)
+        if self.executor == 'process':
+            pipeline = ProcessScanPipeline(self, batch_size=self.batch_size)
+        else:
+            pipeline = ScanPipeline(self, batch_size=self.batch_size, device_scheduler=device_scheduler, controller=controller)
+        try:
+            processed_count = pipeline.run(directory_path, existing_file_info, self.max_threads)
+            # 只有完整遍历之后保存的目录状态才可靠
+            if self.dir_tracker and not pipeline.stop_event.is_set():
+                self.save_dir_states(directory_path, self.dir_tracker)
+        finally:
             self.progress_bar.finish()
-
-        # 批量处理结果
-        batch_size = 1000  # 每批处理的文件数
-        attributes_batch = []
-        processed_count = 0
-        self.progress_bar.reset(total_files)
-        
-        log_print("开始批量保存文件属性...",LOG_LEVEL_INFO)
-        while not result_queue.empty():
-            attributes = result_queue.get()
-            if attributes:
-                attributes_batch.append(attributes)        
-                # processed_count += 1
-                
-                # 当达到批处理大小时，批量保存
-                if len(attributes_batch) >= batch_size:
-                    self.batch_save_file_attributes(attributes_batch)
-                    attributes_batch = []
-                    # 显示进度
-                    self.progress_bar.update(step=batch_size)
-                    # log_print(f"已保存 {processed_count}/{total_files} 个文件的属性",LOG_LEVEL_INFO)
-        
-        # 保存剩余的文件属性
-        if attributes_batch:
-            self.batch_save_file_attributes(attributes_batch)
-            self.progress_bar.update(step=len(attributes_batch))
-            # log_print(f"已保存 {processed_count}/{total_files} 个文件的属性",LOG_LEVEL_INFO)
+            self.progress_bar = None
+            self.size_filter = None
+            tracker, self.dir_tracker = self.dir_tracker, None
+        if controller:
+            controller.report()
+        if tracker and tracker.pruned_dirs:
+            log_print(f"跳过 {tracker.pruned_dirs} 个列表未变化的目录中的 {tracker.pruned_files} 个文件",log_level=LOG_LEVEL_INFO)
         
-        self.progress_bar.finish()
-        log_print(f"处理完成，共保存 {processed_count} 个文件的属性。",log_level=LOG_LEVEL_INFO)
+        if pipeline.total_files == 0 and not (tracker and tracker.pruned_files):
+            log_print("未找到任何文件。",log_level=LOG_LEVEL_INFO)
+            return 0
+        self.inode_cache.clear()
+        # 补算因出现同样大小的文件而需要比较的"未计算哈希"文件
+        self.hash_size_collisions()
+        log_print(f"处理完成，共扫描 {pipeline.total_files} 个文件，保存 {processed_count} 个文件的属性。",log_level=LOG_LEVEL_INFO)
+        log_print(self.io_stats.summary(),log_level=LOG_LEVEL_INFO)
+        if self.throttle:
+            log_print(f"限速等待共 {self.throttle.throttled_time:.1f} 秒（各线程累计）",log_level=LOG_LEVEL_INFO)
         return processed_count
     
-    def find_duplicate_files(self):
-        """查找数据库中的重复文件"""
+    def hash_size_collisions(self):
+        """
+        为"未计算哈希"的文件补算哈希值：只处理数据库中存在其他同样大小文件的记录。
+        分阶段哈希模式下依次比较首尾采样、内部采样和完整哈希，只有各阶段都相同的文件才计算完整哈希。
+        
+        返回:
+            int: 摘要有更新的文件数
+        """
         try:
-            # 查找具有相同哈希值的文件组
             self.cursor.execute('''
-                SELECT file_hash, GROUP_CONCAT(file_path, '|') as file_paths
+                SELECT file_path, file_size, stage1_hash, stage2_hash, alg_id, file_hash, device, inode FROM file_features
+                WHERE file_size IN (
+                    SELECT file_size FROM file_features GROUP BY file_size
+                    HAVING COUNT(*) > 1 AND SUM(file_hash IS NULL) > 0
+                )
+            ''')
+            rows = [
+                {'file_path': row[0], 'file_size': row[1], 'stage1_hash': row[2], 'stage2_hash': row[3],
+                 'file_hash': self.codec.decode_hash(row[4], row[5]), 'inode_key': inode_key(row[6], row[7])}
+                for row in self.cursor.fetchall()
+            ]
+        except sqlite3.Error as e:
+            log_print(f"查询未计算哈希的文件错误: {e}",log_level=LOG_LEVEL_ERROR)
+            return 0
+        if not rows:
+            return 0
+        
+        # 同一inode的多个硬链接只由一个路径（优先选择已有哈希值的）参与确认，结果复制给其他路径
+        representatives = {}
+        for row in rows:
+            key = row['inode_key'] or row['file_path']
+            if key not in representatives or (row['file_hash'] and not representatives[key]['file_hash']):
+                representatives[key] = row
+        links = [row for row in rows if representatives[row['inode_key'] or row['file_path']] is not row]
+        log_print(f"确认 {len(representatives)} 个存在相同大小的文件...",log_level=LOG_LEVEL_INFO)
+        confirmer = StagedHashConfirmer(self) if self.staged_hash else StagedHashConfirmer(self, stages=('file_hash',))
+        updated = confirmer.confirm(list(representatives.values()))
+        for row in links:
+            source = representatives[row['inode_key']]
+            if source['file_hash'] and source['file_hash'] != row['file_hash']:
+                row.update(stage1_hash=source['stage1_hash'], stage2_hash=source['stage2_hash'], file_hash=source['file_hash'])
+                updated.append(row)
+        try:
+            self.cursor.executemany(
+                "UPDATE file_features SET stage1_hash = ?, stage2_hash = ?, alg_id = ?, file_hash = ? WHERE file_path = ?",
+                [(row['stage1_hash'], row['stage2_hash'], *self.codec.encode_hash(row['file_hash']), row['file_path'])
+                 for row in updated]
+            )
+            self._flush_segments()
+            self.conn.commit()
+        except sqlite3.Error as e:
+            log_print(f"保存补算的哈希值错误: {e}",log_level=LOG_LEVEL_ERROR)
+            self.conn.rollback()
+            self.codec.reload()
+            return 0
+        return len(updated)
+    
+    def iter_duplicate_groups(self, order_by='wasted_bytes', min_size=None, limit=None, offset=0, path_prefix=None):
+        """
+        从数据库流式产出重复文件组：分组、排序和分页都在SQLite中完成，
+        游标上相邻的同一哈希值的行组成一组，内存占用只与单个组的大小有关，与重复文件的总数无关
+        
+        不限目录时直接按索引读取触发器维护的dup_groups汇总表，不对file_features执行GROUP BY；
+        指定path_prefix时只有目录内的成员参与统计，对目录内的记录重新分组
+        
+        参数:
+            order_by: 组的排序方式，wasted_bytes（可释放的空间）、count（成员数）或size（文件大小），均为降序
+            min_size: 只包含不小于此大小（字节）的文件，None表示不限
+            limit: 最多产出的组数，None表示不限
+            offset: 按排序跳过的组数，与limit配合分页
+            path_prefix: 只统计此目录下的文件，None表示整个数据库
+        产出:
+            dict: hash、verified、copies、wasted_bytes、files
+        """
+        if order_by not in DUPLICATE_ORDERS:
+            raise ValueError(f"不支持的排序方式: {order_by}，可选: {', '.join(DUPLICATE_ORDERS)}")
+        order_column = DUPLICATE_ORDERS[order_by]
+
+        def filters(alias):
+            """成员筛选条件；分组统计和外层连接使用同样的条件，组内成员与组统计一致"""
+            conditions, params = [f"{alias}file_hash IS NOT NULL"], []
+            if min_size:
+                conditions.append(f"{alias}file_size >= ?")
+                params.append(min_size)
+            if path_prefix:
+                condition, range_params = self._path_range(f"{alias}file_path", os.path.abspath(path_prefix))
+                conditions.append(condition)
+                params.extend(range_params)
+            return " AND ".join(conditions), params
+
+        page_params = (-1 if limit is None else limit, offset or 0)
+        if path_prefix:
+            # 硬链接按(device, inode)只计一次，没有inode信息的记录按路径计
+            group_where, group_params = filters("")
+            member_where, member_params = filters("f.")
+            page_sql = f'''
+                SELECT file_hash, alg_id, COUNT(*) AS member_count, MAX(file_size) AS file_size,
+                       MAX(file_size) * (COUNT(DISTINCT {COPY_KEY}) - 1) AS wasted_bytes
                 FROM file_features
-                GROUP BY file_hash
+                WHERE {group_where}
+                GROUP BY file_hash, alg_id
                 HAVING COUNT(*) > 1
-            ''')
-            duplicates = self.cursor.fetchall()
-            
-            result = []
-            for file_hash, file_paths_str in duplicates:
-                file_paths = file_paths_str.split('|')
-                # 获取每个文件的详细信息
-                files_info = []
-                for file_path in file_paths:
-                    self.cursor.execute(
-                        "SELECT file_size, created_time, modified_time, owner FROM file_features WHERE file_path = ?",
-                        (file_path,)
-                    )
-                    file_info = self.cursor.fetchone()
-                    if file_info:
-                        files_info.append({
-                            'path': file_path,
-                            'size': file_info[0],
-                            'created': file_info[1],
-                            'modified': file_info[2],
-                            'owner': file_info[3]
-                        })
-                result.append({
-                    'hash': file_hash,
-                    'files': files_info
-                })
-            
-            return result
+                ORDER BY {order_column} DESC, file_hash, alg_id
+                LIMIT ? OFFSET ?
+            '''
+            params = (*group_params, *page_params, *member_params)
+        else:
+            # 同一哈希值的文件大小相同，按组的文件大小筛选即可
+            member_where = "f.file_hash IS NOT NULL"
+            page_sql = f'''
+                SELECT file_hash, alg_id, member_count, file_size, {WASTED_BYTES} AS wasted_bytes
+                FROM dup_groups
+                WHERE member_count > 1{" AND file_size >= ?" if min_size else ""}
+                ORDER BY {order_column} DESC, file_hash, alg_id
+                LIMIT ? OFFSET ?
+            '''
+            params = (*([min_size] if min_size else []), *page_params)
+        # 哈希值的文本形式（算法标签:十六进制）只在输出时生成，校验结果按文本形式保存
+        rows = self.conn.execute(f'''
+            WITH page AS ({page_sql})
+            SELECT a.tag || ':' || lower(hex(g.file_hash)), g.wasted_bytes, v.members_digest, v.verified,
+                   f.file_path, f.file_size, f.ctime_ns, f.mtime_ns, o.name, f.device, f.inode, g.file_hash, g.alg_id
+            FROM page g
+            JOIN hash_algorithms a ON a.id = g.alg_id
+            JOIN file_features f ON f.file_hash = g.file_hash AND f.alg_id = g.alg_id
+            LEFT JOIN owners o ON o.id = f.owner_id
+            LEFT JOIN verified_groups v ON v.file_hash = a.tag || ':' || lower(hex(g.file_hash))
+            WHERE {member_where}
+            ORDER BY g.{order_column} DESC, g.file_hash, g.alg_id, f.file_path
+        ''', params)
+        # 使用独立的游标（conn.execute），产出过程中调用方仍可使用self.cursor
+        for file_hash, members in itertools.groupby(rows, key=lambda row: row[0]):
+            members = list(members)
+            files_info = [{
+                'path': row[4],
+                'size': row[5],
+                'created': format_ns(row[6]),
+                'modified': format_ns(row[7]),
+                'mtime_ns': row[7],
+                'owner': row[8],
+                'device': row[9],
+                'inode': row[10]
+            } for row in members]
+            _, wasted_bytes, stored_digest, stored_verified = members[0][:4]
+            # 校验结果只在组成员及其修改时间未变化时有效，None表示未校验；
+            # 校验针对整个组，指定path_prefix时按组的全部成员（包括目录外的）比较
+            verified = None
+            if stored_digest is not None:
+                if path_prefix:
+                    group_members = self.conn.execute(
+                        "SELECT file_path, mtime_ns FROM file_features WHERE file_hash = ? AND alg_id = ?",
+                        members[0][11:13]).fetchall()
+                else:
+                    group_members = [(file_info['path'], file_info['mtime_ns']) for file_info in files_info]
+                if stored_digest == members_digest(group_members):
+                    verified = bool(stored_verified)
+            # 硬链接不占用额外空间：copies为真正的副本数，hardlink_of标记与组内其他路径共享inode的文件
+            copies = mark_hardlinks(files_info)
+            yield {
+                'hash': file_hash,
+                'verified': verified,
+                'copies': copies,
+                'wasted_bytes': wasted_bytes,
+                'files': files_info
+            }
+    
+    def find_duplicate_files(self, **query):
+        """
+        查找数据库中的重复文件（哈希值带有算法标签，不同引擎计算的记录不会被分到同一组）
+        
+        返回全部结果的列表；参数与iter_duplicate_groups相同，组数很多时应直接使用iter_duplicate_groups
+        """
+        try:
+            return list(self.iter_duplicate_groups(**query))
         except sqlite3.Error as e:
             log_print(f"查找重复文件错误: {e}",log_level=LOG_LEVEL_ERROR)
             return []
     
+    def verify_duplicates(self, memory_budget=DEFAULT_MEMORY_BUDGET, force=False):
+        """
+        逐字节校验重复文件组，结果保存到verified_groups表
+        
+        参数:
+            memory_budget: 所有校验线程读缓冲的内存预算（字节）
+            force: 是否重新校验已有有效校验结果的文件组
+        返回:
+            int: 内容不完全相同（哈希碰撞或文件已变化）的文件组数
+        """
+        groups = [
+            (group['hash'], [(file_info['path'], file_info['mtime_ns']) for file_info in group['files']])
+            for group in self.iter_duplicate_groups() if force or group['verified'] is None
+        ]
+        if not groups:
+            return 0
+        
+        log_print(f"正在逐字节校验 {len(groups)} 组重复文件...",log_level=LOG_LEVEL_INFO)
+        verifier = DuplicateVerifier(max_threads=self.max_threads, memory_budget=memory_budget)
+        results = verifier.verify([(file_hash, [path for path, _ in members]) for file_hash, members in groups])
+        current_time = time.time_ns()
+        try:
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO verified_groups (file_hash, members_digest, verified, verified_time) VALUES (?, ?, ?, ?)",
+                [(file_hash, members_digest(members), int(results[file_hash][0]), current_time)
+                 for file_hash, members in groups if file_hash in results]
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            log_print(f"保存校验结果错误: {e}",log_level=LOG_LEVEL_ERROR)
+            self.conn.rollback()
+        mismatched = sum(1 for verified, _ in results.values() if not verified)
+        log_print(f"校验完成，{len(results) - mismatched} 组内容完全相同，{mismatched} 组内容不同。",log_level=LOG_LEVEL_INFO)
+        return mismatched
+    
     def compare_with_database(self, directory_path, recalculate_hash=True):
         """比较目录中的文件与数据库中的记录"""
         if not os.path.isdir(directory_path):
@@ -523,12 +1059,7 @@ class FileDuplicateFinder:
         db_files = {row[0] for row in self.cursor.fetchall()}
         
         # 扫描目录中的文件
-        current_files = set()
-        for root, _, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.isfile(file_path) and not os.path.islink(file_path):
-                    current_files.add(file_path)
+        current_files = set(iter_dir_files(directory_path, skip_link=True))
         
         # 找出删除的文件（数据库中有但目录中没有）
         deleted_files = db_files - current_files
@@ -536,6 +1067,12 @@ class FileDuplicateFinder:
         # 找出新增的文件（目录中有但数据库中没有）
         new_files = current_files - db_files
         
+        # 找出被移动或重命名的文件：与已删除记录的(设备号, inode, 大小, 修改时间)一致的新文件
+        moved_files = self._match_moved_files(deleted_files, new_files)
+        for old_path, new_path in moved_files:
+            deleted_files.discard(old_path)
+            new_files.discard(new_path)
+        
         # 找出可能更新的文件（比较大小和修改时间）
         updated_files = []
         common_files = db_files & current_files
@@ -547,10 +1084,12 @@ class FileDuplicateFinder:
                 
                 # 获取数据库中的文件信息
                 self.cursor.execute(
-                    "SELECT file_size, modified_time, file_hash FROM file_features WHERE file_path = ?",
+                    "SELECT file_size, mtime_ns, alg_id, file_hash, mtime_coarse FROM file_features WHERE file_path = ?",
                     (file_path,)
                 )
                 db_info = self.cursor.fetchone()
+                if db_info:
+                    db_info = (db_info[0], db_info[1], self.codec.decode_hash(db_info[2], db_info[3]), db_info[4])
                 
                 if db_info and current_attr:
                     # 检查是否有更新
@@ -558,10 +1097,11 @@ class FileDuplicateFinder:
                         # 如果不需要重新计算哈希值，只比较文件大小和修改时间
                         hash_changed = False
                     else:
-                        hash_changed = (db_info[2] != current_attr['file_hash'])
+                        # 数据库中未计算哈希（大小唯一）的文件无法比较哈希值
+                        hash_changed = db_info[2] is not None and (db_info[2] != current_attr['file_hash'])
                         
                     if (db_info[0] != current_attr['file_size'] or 
-                        db_info[1] != current_attr['modified_time'] or 
+                        not mtime_matches(db_info[1], current_attr['mtime_ns'], db_info[3]) or 
                         hash_changed):
                         updated_files.append(file_path)
             except Exception as e:
@@ -570,9 +1110,30 @@ class FileDuplicateFinder:
         return {
             'deleted': list(deleted_files),
             'new': list(new_files),
+            'moved': moved_files,
             'updated': updated_files
         }
     
+    def _match_moved_files(self, deleted_files, new_files):
+        """将已删除的数据库记录与新文件配对，返回[(旧路径, 新路径), ...]"""
+        if not deleted_files or not new_files:
+            return []
+        existing_file_info = {file_path: info for file_path, info in self.get_existing_file_info().items()
+                              if file_path in deleted_files}
+        moved_files = []
+        for file_path in new_files:
+            try:
+                meta = meta_from_stat(os.stat(file_path))
+            except OSError as e:
+                log_print(f"无法获取文件属性 {file_path}: {e}",log_level=LOG_LEVEL_ERROR)
+                continue
+            old_path = self.find_moved_from(file_path, meta, existing_file_info)
+            if old_path:
+                moved_files.append((old_path, file_path))
+                # 每条旧记录只能配对一次
+                del existing_file_info[old_path]
+        return moved_files
+    
     def update_database(self, directory_path):
         """更新数据库以匹配当前目录状态"""
         # 首先删除数据库中已不存在的文件
@@ -581,15 +1142,26 @@ class FileDuplicateFinder:
         # 删除已不存在的文件记录
         for deleted_file in comparison['deleted']:
             try:
+                self.cursor.execute("DELETE FROM file_segments WHERE file_path = ?", (deleted_file,))
                 self.cursor.execute("DELETE FROM file_features WHERE file_path = ?", (deleted_file,))
             except sqlite3.Error as e:
                 log_print(f"删除文件记录错误 {deleted_file}: {e}",log_level=LOG_LEVEL_ERROR)
         
+        # 被移动或重命名的文件只改写路径，不重新计算哈希值
+        for old_path, new_path in comparison['moved']:
+            try:
+                self._rewrite_moved_path(old_path, new_path)
+            except sqlite3.Error as e:
+                log_print(f"改写文件路径错误 {old_path} -> {new_path}: {e}",log_level=LOG_LEVEL_ERROR)
+        # 删除和改写路径开启了隐式事务，先提交，之后的批量保存才能开始自己的事务
+        self.conn.commit()
+        
         # 处理新增和更新的文件
         files_to_update = comparison['new'] + comparison['updated']
-        batch_size = 1000  # 每批处理的文件数
+        batch_size = self.batch_size  # 每批处理的文件数
         attributes_batch = []
         processed_count = 0
+        saved_count = 0
         
         log_print("正在更新数据库...",log_level=LOG_LEVEL_INFO)
         
@@ -602,7 +1174,8 @@ class FileDuplicateFinder:
                     
                     # 当批次满时，批量插入
                     if processed_count % batch_size == 0:
-                        self.batch_save_file_attributes(attributes_batch, show_ditail=False)
+                        if self.batch_save_file_attributes(attributes_batch, show_ditail=False):
+                            saved_count += len(attributes_batch)
                         attributes_batch = []
                         # 显示进度
                         log_print(f"已更新 {processed_count}/{len(files_to_update)} 个文件的属性",log_level=LOG_LEVEL_INFO)                        
@@ -611,51 +1184,57 @@ class FileDuplicateFinder:
         
         # 处理剩余的文件
         if attributes_batch:
-            self.batch_save_file_attributes(attributes_batch, show_ditail=False)
+            if self.batch_save_file_attributes(attributes_batch, show_ditail=False):
+                saved_count += len(attributes_batch)
             attributes_batch = []
             # 显示进度
             log_print(f"已更新 {processed_count}/{len(files_to_update)} 个文件的属性",log_level=LOG_LEVEL_INFO)                        
         
         self.conn.commit()
-        log_print(f"数据库更新完成，删除了 {len(comparison['deleted'])} 个文件记录，更新了 {processed_count} 个文件记录。",log_level=LOG_LEVEL_INFO)
+        log_print(f"数据库更新完成，删除了 {len(comparison['deleted'])} 个文件记录，改写了 {len(comparison['moved'])} 个移动文件的路径，"
+                  f"更新了 {saved_count} 个文件记录。",log_level=LOG_LEVEL_INFO)
+        if saved_count < processed_count:
+            log_print(f"有 {processed_count - saved_count} 个文件的属性未能保存",log_level=LOG_LEVEL_ERROR)
     
     def close(self):
         """关闭数据库连接"""
+        self.tree_hasher.close()
         if self.conn:
             self.rw_reg_handlers.unregister_file_handler()
             self.conn.close()
             self.conn = None
             self.cursor = None
             
-    def export_duplicates_to_json(self, json_file_path):
+    def export_duplicates_to_json(self, json_file_path, **query):
         """
         将所有重复的文件导出到指定的JSON文件
         
+        重复文件组从iter_duplicate_groups逐组写出，不在内存中构建完整的输出数据
+        
         参数:
             json_file_path: JSON输出文件的路径
+            query: 传给iter_duplicate_groups的排序、筛选和分页参数
         
         返回:
             bool: 导出是否成功
         """
         try:
-            # 获取重复文件信息
-            duplicates = self.find_duplicate_files()
-            
-            # 构建JSON输出格式
-            output_data = {
-                "export_time": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "duplicate_groups": duplicates,
-                "total_groups": len(duplicates)
-            }
-            
             # 确保输出目录存在
             os.makedirs(os.path.dirname(os.path.abspath(json_file_path)), exist_ok=True)
             
-            # 写入JSON文件
+            # 写入JSON文件，格式与一次性json.dump相同：export_time、duplicate_groups、total_groups
+            total_groups = 0
             with open(json_file_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=2)
+                export_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                f.write('{\n  "export_time": ' + json.dumps(export_time) + ',\n  "duplicate_groups": [')
+                for group in self.iter_duplicate_groups(**query):
+                    f.write(',\n    ' if total_groups else '\n    ')
+                    f.write(json.dumps(group, ensure_ascii=False, indent=2).replace('\n', '\n    '))
+                    total_groups += 1
+                f.write('\n  ],\n' if total_groups else '],\n')
+                f.write(f'  "total_groups": {total_groups}\n}}')
             
-            log_print(f"成功将 {len(duplicates)} 组重复文件导出到 {json_file_path}",log_level=LOG_LEVEL_INFO)
+            log_print(f"成功将 {total_groups} 组重复文件导出到 {json_file_path}",log_level=LOG_LEVEL_INFO)
             return True
         except Exception as e:
             log_print(f"导出重复文件到JSON时出错: {e}",log_level=LOG_LEVEL_ERROR)
@@ -668,22 +1247,25 @@ class FileDuplicateFinder:
             return handled[0], handled[1]
         return None, None
 
-    def thread_calc_files_hash(self,recalc_queue,result_queue,total_files=0):
+    def thread_calc_files_hash(self,recalc_queue,result_queue,total_files=0,hash_func=None):
         """
         多线程计算文件哈希值
         参数:
             recalc_queue: 包含需要计算哈希值的文件路径的队列
             result_queue: 用于存储计算结果的队列
             total_files: 总文件数，用于进度条显示
+            hash_func: 计算单个文件摘要的函数，默认使用calculate_file_hash计算完整哈希
         """
         prograss=ProgressBar(total_files)
+        if hash_func is None:
+            hash_func = lambda file_path: self.calculate_file_hash(file_path, hash_algorithm=self.hash_algorithm)
         
         def calc_file_hash(recalc_queue,result_queue):
             while True:
                 file_path=recalc_queue.get()
                 if file_path is None:
                     break
-                fhash=self.calculate_file_hash(file_path)
+                fhash=hash_func(file_path)
                 result_queue.put((file_path,fhash))
                 recalc_queue.task_done()
                 prograss.update()
@@ -701,6 +1283,25 @@ class FileDuplicateFinder:
             t.join()
         prograss.finish()
 
+    def parallel_calc_files(self, file_paths, hash_func=None):
+        """
+        多线程计算一组文件的摘要
+        参数:
+            file_paths: 文件路径列表
+            hash_func: 计算单个文件摘要的函数，默认计算完整哈希
+        返回:
+            list: (文件路径, 摘要) 列表，出错的文件摘要为None
+        """
+        recalc_queue = queue.Queue()
+        result_queue = queue.Queue()
+        for file_path in file_paths:
+            recalc_queue.put(file_path)
+        self.thread_calc_files_hash(recalc_queue, result_queue, total_files=len(file_paths), hash_func=hash_func)
+        results = []
+        while not result_queue.empty():
+            results.append(result_queue.get())
+        return results
+
     def only_search_changed_files(self, directory_path):
         """
         搜索目录中与数据库中文件特征不一致的文件
@@ -711,18 +1312,17 @@ class FileDuplicateFinder:
             list: 发生变化的文件列表
         """
         # 获取数据库中所有文件路径和完整属性
-        self.cursor.execute("SELECT file_path, modified_time, file_size, file_hash FROM file_features")
-        db_files = {row[0]: {'modified_time': row[1], 'file_size': row[2], 'file_hash': row[3]} for row in self.cursor.fetchall()}
+        self.cursor.execute("SELECT file_path, mtime_ns, file_size, alg_id, file_hash, mtime_coarse FROM file_features")
+        db_files = {row[0]: {'mtime_ns': row[1], 'file_size': row[2], 'file_hash': self.codec.decode_hash(row[3], row[4]),
+                             'mtime_coarse': row[5]}
+                    for row in self.cursor.fetchall()}
         
-        # 扫描目录中的文件
-        current_files = set()
-        for root, _, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.isfile(file_path) and not os.path.islink(file_path):
-                    # 规范化文件路径，确保与数据库中的路径格式一致
-                    normalized_path = os.path.normpath(file_path)
-                    current_files.add(normalized_path)
+        # 扫描目录中的文件（遍历器返回规范化的真实路径，与数据库中的路径格式一致）
+        # 启用目录剪枝时，列表未变化的目录中的文件视为未变化，不再逐个stat
+        tracker = self.create_dir_tracker(directory_path, db_files, collect_pruned=True)
+        current_files = set(iter_dir_files(directory_path, skip_link=True, dir_state=tracker))
+        pruned_files = set(tracker.pruned_paths) if tracker else set()
+        current_files |= pruned_files
                 
         # 转换为集合以确保正确的集合操作
         db_files_set = set(db_files.keys())
@@ -732,7 +1332,7 @@ class FileDuplicateFinder:
         delete_files = db_files_set - current_files
         
         # 计算存在于数据库和当前目录中的文件
-        db_exist_files = current_files & db_files_set
+        db_exist_files = (current_files & db_files_set) - pruned_files
         changed_files = []
         
         # 对比数据库中的文件，找出当前目录中与数据库中文件特征不一致的文件
@@ -740,8 +1340,11 @@ class FileDuplicateFinder:
             db_file_attr = db_files[file_path]
             current_file_attr = self.get_file_attributes(file_path, recalculate_hash=False)
             
+            # 没有修改时间的记录视为有变化；由第1版迁移的记录按微秒比较（与_process_file一致）
             if current_file_attr and (
-                current_file_attr['modified_time'] > db_file_attr['modified_time'] or \
+                db_file_attr['mtime_ns'] is None or \
+                (current_file_attr['mtime_ns'] > db_file_attr['mtime_ns'] and
+                 not mtime_matches(db_file_attr['mtime_ns'], current_file_attr['mtime_ns'], db_file_attr['mtime_coarse'])) or \
                 current_file_attr['file_size'] != db_file_attr['file_size']
             ):
                 changed_files.append(file_path)
@@ -777,7 +1380,8 @@ class FileDuplicateFinder:
             # 规范化文件路径，确保与数据库中的路径格式一致
             normalized_path = os.path.normpath(file_path)
             
-            # 执行删除操作
+            # 执行删除操作（先删除段摘要，rowcount对应file_features的删除）
+            self.cursor.execute("DELETE FROM file_segments WHERE file_path = ?", (normalized_path,))
             self.cursor.execute("DELETE FROM file_features WHERE file_path = ?", (normalized_path,))
             self.conn.commit()
             
@@ -801,12 +1405,94 @@ def add_args(parser,dir=None):
     parser.add_argument('--update', action='store_true', help='更新数据库')
     parser.add_argument('--read-file', help='读取指定文件的内容')
     parser.add_argument('--threads', type=int, default=4, help='哈希计算的最大线程数（默认：4）')
-    parser.add_argument('--hash-algorithm', default='md5', choices=['md5', 'sha1', 'sha256'], 
-                        help='哈希计算算法（默认：md5）')
+    parser.add_argument('--hash-algorithm', default=DEFAULT_HASH_ENGINE, choices=engine_names(), 
+                        help='哈希计算算法（默认：md5）；xxh3_64、xxh3_128、blake3需安装对应的库，未安装时自动回退')
+    parser.add_argument('--benchmark-hash', action='store_true', help='测试各哈希引擎的吞吐量后退出')
+    parser.add_argument('--extra-hash', action='append', default=[], choices=engine_names(),
+                        help='附加计算的哈希算法（可多次指定），与主哈希在同一次读取中计算并保存在独立的列中')
+    parser.add_argument('--mmap-threshold', type=int, default=DEFAULT_MMAP_THRESHOLD // (1024 * 1024),
+                        help='不小于该大小（MB）的文件通过mmap计算哈希，0表示不使用mmap（默认：64）')
+    parser.add_argument('--cache-polite', action='store_true',
+                        help='页缓存友好模式：计算哈希后丢弃本次读入的页缓存，不挤占同机服务的热数据（需posix_fadvise）')
+    parser.add_argument('--direct-io', action='store_true', help='页缓存友好模式下使用O_DIRECT读取，不支持时自动回退')
+    parser.add_argument('--device-io', action='store_true',
+                        help='按设备分配哈希线程池：机械硬盘默认1个线程，其他设备使用--threads个线程，设备内按inode顺序读取')
+    parser.add_argument('--device-threads', action='append', default=[], metavar='路径=线程数',
+                        help='指定某个设备的哈希线程数（可多次指定），路径为该设备上的任意文件或目录；隐含--device-io')
+    parser.add_argument('--max-bytes-per-sec', help='哈希读取的速率上限，支持K/M/G后缀（如50M），默认不限速')
+    parser.add_argument('--max-files-per-sec', help='遍历的文件速率上限（文件/秒），默认不限速')
+    parser.add_argument('--throttle-profile', action='append', default=[], metavar='HH:MM-HH:MM=字节速率[/文件速率]',
+                        help='时间段限速（可多次指定），如 09:00-18:00=20M/100，该时间段内代替默认限速')
+    parser.add_argument('--throttle-file', help='限速控制文件（JSON），修改后或收到SIGHUP时重新加载，可在运行时调整限速')
+    parser.add_argument('--auto-threads', action='store_true',
+                        help='按吞吐量自动调整哈希线程数（代替--threads；与--device-io同时使用时不生效）')
+    parser.add_argument('--min-threads', type=int, default=1, help='自动调整的线程数下限（默认：1）')
+    parser.add_argument('--max-auto-threads', type=int, default=32, help='自动调整的线程数上限（默认：32）')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                        help='扫描执行器：thread为线程流水线（默认），process为多进程（--threads个进程），适合小文件为主的目录')
+    parser.add_argument('--tree-hash-threshold', type=int, default=0,
+                        help='不小于该大小（MB）的文件切分为多段并行计算树哈希，0表示不使用（默认：0）')
+    parser.add_argument('--segment-size', type=int, default=DEFAULT_SEGMENT_SIZE // (1024 * 1024),
+                        help='树哈希的段大小，单位MB（默认：64）')
+    parser.add_argument('--partial-rehash', action='store_true',
+                        help='树哈希文件变化时，只重新读取段采样摘要发生变化的段（适合追加写入的日志、局部修改的大文件）')
+    parser.add_argument('--verify-moves', action='store_true',
+                        help='按设备号、inode、大小和修改时间识别出的移动文件，再比较首尾采样摘要确认后才复用哈希值')
+    parser.add_argument('--prune-dirs', action='store_true',
+                        help='增量扫描时，修改时间、条目数和子项名称都未变化的目录中的文件不再逐个stat（原地修改的文件需要--full-stat才能发现）')
+    parser.add_argument('--full-stat', action='store_true',
+                        help='强制对所有文件执行完整stat扫描，并重新记录目录状态（与--prune-dirs配合定期使用）')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='每个事务批量写入数据库的记录数（默认: 1000）')
     parser.add_argument('--force-recalculate', action='store_true', help='强制重新计算所有文件的哈希值')
+    parser.add_argument('--size-prefilter', action='store_true', help='只为存在相同大小文件的文件计算哈希值')
+    parser.add_argument('--staged-hash', action='store_true',
+                        help='分阶段哈希：同样大小的文件依次比较首尾采样、内部采样，仍相同时才计算完整哈希')
     parser.add_argument('--export-duplicates', default=FILE_DUMP_FILENAME, help='将重复文件导出到指定的JSON文件')
     parser.add_argument('--no-find-duplicates', action='store_true', help='扫描后不自动查找重复文件（默认会自动查找）')
+    parser.add_argument('--verify', action='store_true', help='查找重复文件前逐字节校验每组重复文件')
+    parser.add_argument('--verify-memory', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help='逐字节校验的内存预算，单位MB（默认：256）')
+    parser.add_argument('--order-by', choices=list(DUPLICATE_ORDERS), default='wasted_bytes',
+                        help='重复文件组的排序方式：可释放空间、成员数或文件大小，均为降序（默认：wasted_bytes）')
+    parser.add_argument('--min-size', type=int, default=0, help='只列出不小于此大小（字节）的重复文件')
+    parser.add_argument('--limit', type=int, help='最多列出和导出的重复文件组数')
+    parser.add_argument('--offset', type=int, default=0, help='按排序跳过的重复文件组数，与--limit配合分页')
+    parser.add_argument('--path-prefix', help='只列出此目录下的重复文件')
             
+def format_verified(verified):
+    """格式化逐字节校验状态，用于命令行输出"""
+    if verified is None:
+        return ""
+    return " (已逐字节校验)" if verified else " (警告：逐字节校验发现内容不同)"
+
+def format_copies(group):
+    """格式化组内的硬链接情况：有硬链接时显示真正占用空间的副本数"""
+    links = len(group['files']) - group['copies']
+    if not links:
+        return ""
+    return f" ({group['copies']} 个副本，{links} 个硬链接)"
+
+def format_wasted(group):
+    """格式化删除多余副本后可释放的空间"""
+    return f" (可释放 {group['wasted_bytes']} 字节)" if group.get('wasted_bytes') else ""
+
+def duplicate_query(args):
+    """命令行参数中重复文件组的排序、筛选和分页参数，传给iter_duplicate_groups"""
+    return {
+        'order_by': args.order_by,
+        'min_size': args.min_size,
+        'limit': args.limit,
+        'offset': args.offset,
+        'path_prefix': args.path_prefix,
+    }
+
+def format_hardlink(file_info):
+    """格式化文件的硬链接标记"""
+    if not file_info.get('hardlink_of'):
+        return ""
+    return f" [硬链接，与 {file_info['hardlink_of']} 为同一文件]"
+
 def main(args: argparse.Namespace):
     """主函数"""
       
@@ -827,15 +1513,54 @@ def main(args: argparse.Namespace):
     if not os.path.isabs(json_file_path):
         json_file_path = os.path.abspath(json_file_path)
     
+    # 限速设置
+    throttle = None
+    if args.max_bytes_per_sec or args.max_files_per_sec or args.throttle_profile or args.throttle_file:
+        try:
+            throttle = ScanThrottle(
+                bytes_per_sec=parse_rate(args.max_bytes_per_sec),
+                files_per_sec=parse_rate(args.max_files_per_sec),
+                profiles=[parse_profile(spec) for spec in args.throttle_profile],
+                control_file=os.path.abspath(args.throttle_file) if args.throttle_file else None
+            )
+        except ValueError as e:
+            log_print(f"错误: {e}",log_level=LOG_LEVEL_ERROR)
+            return
+        throttle.install_signal_handler()
+    
     # 初始化文件重复查找器
     finder = FileDuplicateFinder(
         db_path=db_path, 
         max_threads=args.threads, 
         hash_algorithm=args.hash_algorithm,
-        force_recalculate=args.force_recalculate
+        force_recalculate=args.force_recalculate,
+        size_prefilter=args.size_prefilter,
+        staged_hash=args.staged_hash,
+        extra_hash_algorithms=args.extra_hash,
+        mmap_threshold=args.mmap_threshold * 1024 * 1024 if args.mmap_threshold > 0 else None,
+        cache_polite=args.cache_polite or args.direct_io,
+        direct_io=args.direct_io,
+        device_io=args.device_io or bool(args.device_threads),
+        device_threads=args.device_threads,
+        throttle=throttle,
+        auto_threads=args.auto_threads,
+        min_threads=args.min_threads,
+        max_auto_threads=args.max_auto_threads,
+        executor=args.executor,
+        tree_hash_threshold=args.tree_hash_threshold * 1024 * 1024 if args.tree_hash_threshold > 0 else None,
+        segment_size=max(1, args.segment_size) * 1024 * 1024,
+        partial_rehash=args.partial_rehash,
+        verify_moves=args.verify_moves,
+        prune_dirs=args.prune_dirs,
+        full_stat=args.full_stat,
+        batch_size=max(1, args.batch_size)
     )
     
     try:
+        if args.benchmark_hash:
+            print_benchmark()
+            return
+        
         # 读取文件内容操作
         if args.read_file:
             file_path = os.path.abspath(args.read_file)
@@ -854,8 +1579,10 @@ def main(args: argparse.Namespace):
                 return
             
             log_print("正在查找重复文件...",log_level=LOG_LEVEL_INFO)
+            if args.verify:
+                finder.verify_duplicates(memory_budget=args.verify_memory * 1024 * 1024)
             
-            finder.export_duplicates_to_json(json_file_path)
+            finder.export_duplicates_to_json(json_file_path, **duplicate_query(args))
             return
         
         if args.chenged:
@@ -876,23 +1603,27 @@ def main(args: argparse.Namespace):
         if args.find_duplicates:
             # 仅查找重复文件
             log_print("正在查找重复文件...",log_level=LOG_LEVEL_INFO)
-            duplicates = finder.find_duplicate_files()
+            if args.verify:
+                finder.verify_duplicates(memory_budget=args.verify_memory * 1024 * 1024)
+            query = duplicate_query(args)
+            # 逐组输出，不在内存中保存全部重复文件组
+            group_count = 0
+            for i, group in enumerate(finder.iter_duplicate_groups(**query), (args.offset or 0) + 1):
+                group_count += 1
+                log_print(f"组 {i}: 哈希值 {group['hash']}{format_verified(group['verified'])}{format_copies(group)}{format_wasted(group)}",log_level=LOG_LEVEL_INFO)
+                for file_info in group['files']:
+                    log_print(f"  - {file_info['path']}{format_hardlink(file_info)}",log_level=LOG_LEVEL_INFO)
+                    log_print(f"    大小: {file_info['size']} 字节",log_level=LOG_LEVEL_INFO)
+                    log_print(f"    创建时间: {file_info['created']}",log_level=LOG_LEVEL_INFO)
+                    log_print(f"    修改时间: {file_info['modified']}",log_level=LOG_LEVEL_INFO)
+                    log_print(f"    所有者: {file_info['owner']}",log_level=LOG_LEVEL_INFO)
+                log_print("",log_level=LOG_LEVEL_INFO)
             
-            if not duplicates:
+            if not group_count:
                 log_print("未找到重复文件。",log_level=LOG_LEVEL_INFO)
             else:
-                log_print(f"找到 {len(duplicates)} 组重复文件:\n",log_level=LOG_LEVEL_INFO)
-                for i, group in enumerate(duplicates, 1):
-                    log_print(f"组 {i}: 哈希值 {group['hash']}",log_level=LOG_LEVEL_INFO)
-                    for file_info in group['files']:
-                        log_print(f"  - {file_info['path']}",log_level=LOG_LEVEL_INFO)
-                        log_print(f"    大小: {file_info['size']} 字节",log_level=LOG_LEVEL_INFO)
-                        log_print(f"    创建时间: {file_info['created']}",log_level=LOG_LEVEL_INFO)
-                        log_print(f"    修改时间: {file_info['modified']}",log_level=LOG_LEVEL_INFO)
-                        log_print(f"    所有者: {file_info['owner']}",log_level=LOG_LEVEL_INFO)
-                    log_print("",log_level=LOG_LEVEL_INFO)
- 
-                finder.export_duplicates_to_json(json_file_path)
+                log_print(f"共找到 {group_count} 组重复文件。",log_level=LOG_LEVEL_INFO)
+                finder.export_duplicates_to_json(json_file_path, **query)
         elif args.compare:
             # 比较目录与数据库
             if not db_exists:
@@ -922,6 +1653,13 @@ def main(args: argparse.Namespace):
             else:
                 log_print("没有新增的文件。",log_level=LOG_LEVEL_INFO)
                 
+            if changes['moved']:
+                log_print(f"\n移动或重命名的文件 ({len(changes['moved'])}):",log_level=LOG_LEVEL_INFO)
+                for old_path, new_path in changes['moved'][:5]:  # 只显示前5个
+                    log_print(f"  - {old_path} -> {new_path}",log_level=LOG_LEVEL_INFO)
+                if len(changes['moved']) > 5:
+                    log_print(f"  ... 还有 {len(changes['moved']) - 5} 个文件",log_level=LOG_LEVEL_INFO)
+                
             if changes['updated']:
                 log_print(f"\n更新的文件 ({len(changes['updated'])}):",log_level=LOG_LEVEL_INFO)
                 for file_path in changes['updated'][:5]:  # 只显示前5个
@@ -932,12 +1670,12 @@ def main(args: argparse.Namespace):
                 log_print("没有更新的文件。",log_level=LOG_LEVEL_INFO)
                 
             # 询问是否更新数据库
-            if changes['deleted'] or changes['new'] or changes['updated']:
+            if changes['deleted'] or changes['new'] or changes['moved'] or changes['updated']:
                 update = input("\n是否要根据目录文件更新数据库？(y/n): ").lower()
                 if update == 'y':
                     finder.update_database(directory_path)
                     log_print("数据库已更新。",log_level=LOG_LEVEL_INFO)
-                    finder.export_duplicates_to_json(json_file_path)
+                    finder.export_duplicates_to_json(json_file_path, **duplicate_query(args))
         elif args.update:
             # 更新数据库
             if not db_exists:
@@ -946,8 +1684,10 @@ def main(args: argparse.Namespace):
                 
             log_print(f"正在更新数据库以匹配目录 '{directory_path}'...",log_level=LOG_LEVEL_INFO)
             finder.update_database(directory_path)
+            if args.verify:
+                finder.verify_duplicates(memory_budget=args.verify_memory * 1024 * 1024)
                        
-            finder.export_duplicates_to_json(json_file_path)
+            finder.export_duplicates_to_json(json_file_path, **duplicate_query(args))
         else:
             # 默认行为：扫描目录
             log_print(f"正在扫描目录 '{directory_path}' 及其子目录...",log_level=LOG_LEVEL_INFO)
@@ -955,23 +1695,27 @@ def main(args: argparse.Namespace):
             
             # 根据命令行选项决定是否查找重复文件，默认查找
             if not args.no_find_duplicates:
-                duplicates = finder.find_duplicate_files()
+                if args.verify:
+                    finder.verify_duplicates(memory_budget=args.verify_memory * 1024 * 1024)
+                query = duplicate_query(args)
+                # 逐组输出，不在内存中保存全部重复文件组
+                group_count = 0
+                for i, group in enumerate(finder.iter_duplicate_groups(**query), (args.offset or 0) + 1):
+                    group_count += 1
+                    log_print(f"组 {i}: 哈希值 {group['hash']}{format_verified(group['verified'])}{format_copies(group)}{format_wasted(group)}",log_level=LOG_LEVEL_INFO)
+                    for file_info in group['files'][:3]:  # 每个组只显示前3个文件
+                        log_print(f"  - {file_info['path']}{format_hardlink(file_info)}",log_level=LOG_LEVEL_INFO)
+                        log_print(f"    大小: {file_info['size']} 字节",log_level=LOG_LEVEL_INFO)
+                        log_print(f"    修改时间: {file_info['modified']}",log_level=LOG_LEVEL_INFO)
+                    if len(group['files']) > 3:
+                        log_print(f"  ... 还有 {len(group['files']) - 3} 个文件",log_level=LOG_LEVEL_INFO)
+                    log_print("",log_level=LOG_LEVEL_INFO)
                 
-                if not duplicates:
+                if not group_count:
                     log_print("未找到重复文件。",log_level=LOG_LEVEL_INFO)
                 else:
-                    log_print(f"找到 {len(duplicates)} 组重复文件:\n",log_level=LOG_LEVEL_INFO)
-                    for i, group in enumerate(duplicates, 1):
-                        log_print(f"组 {i}: 哈希值 {group['hash']}",log_level=LOG_LEVEL_INFO)
-                        for file_info in group['files'][:3]:  # 每个组只显示前3个文件
-                            log_print(f"  - {file_info['path']}",log_level=LOG_LEVEL_INFO)
-                            log_print(f"    大小: {file_info['size']} 字节",log_level=LOG_LEVEL_INFO)
-                            log_print(f"    修改时间: {file_info['modified']}",log_level=LOG_LEVEL_INFO)
-                        if len(group['files']) > 3:
-                            log_print(f"  ... 还有 {len(group['files']) - 3} 个文件",log_level=LOG_LEVEL_INFO)
-                        log_print("",log_level=LOG_LEVEL_INFO)
-                        
-                    finder.export_duplicates_to_json(json_file_path)
+                    log_print(f"共找到 {group_count} 组重复文件。",log_level=LOG_LEVEL_INFO)
+                    finder.export_duplicates_to_json(json_file_path, **query)
                     log_print(f"重复文件已导出到 JSON 文件: {json_file_path}",log_level=LOG_LEVEL_INFO)
     finally:
         finder.close()
@@ -0,0 +1,95 @@
+#文件元数据采集层：每个文件只stat一次，所有者名称按uid缓存
+import os
+import getpass
+import datetime
+from filedup.global_vars import log_print, LOG_LEVEL_ERROR
+
+# uid -> 所有者名称的缓存，一次扫描中每个不同的uid只查询一次passwd
+_owner_cache = {}
+
+
+def owner_name(uid):
+    """根据uid获取文件所有者名称（带缓存）"""
+    name = _owner_cache.get(uid)
+    if name is not None:
+        return name
+    try:
+        # 在Windows上使用getpass获取当前用户
+        if os.name == 'nt':
+            name = getpass.getuser()
+        else:
+            import pwd
+            name = pwd.getpwuid(uid).pw_name
+    except Exception as e:
+        log_print(f"无法获取uid {uid} 对应的所有者: {e}", log_level=LOG_LEVEL_ERROR)
+        name = "unknown"
+    # 字典赋值是原子操作，多个线程同时查询同一uid时最多重复查询一次
+    _owner_cache[uid] = name
+    return name
+
+
+def stat_file(file_path, entry=None):
+    """获取文件的stat结果，优先复用os.scandir的DirEntry缓存的结果
+
+    参数:
+        file_path: 文件路径
+        entry: 遍历器产出的DirEntry，可为None
+    返回:
+        os.stat_result
+    """
+    if entry is not None:
+        # 遍历器只产出非符号链接的普通文件，不跟随链接与os.stat结果一致
+        return entry.stat(follow_symlinks=False)
+    return os.stat(file_path)
+
+
+def format_ns(timestamp_ns):
+    """将整数纳秒时间戳格式化为ISO格式字符串（只在输出时使用，数据库中保存整数）"""
+    if timestamp_ns is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp_ns / 1e9).isoformat()
+
+
+def inode_fields(stat_result):
+    """stat结果中的(设备号, inode, 链接数)；st_ino为0表示没有inode信息（Windows上DirEntry.stat()的结果总是如此），
+    三项都返回None，不能把0当作所有文件共享的inode"""
+    if not stat_result.st_ino:
+        return None, None, None
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_nlink
+
+
+def meta_from_stat(stat_result, from_entry=False):
+    """从一次stat结果中提取数据库需要的全部元数据（时间保存为整数纳秒，不做格式化）
+
+    from_entry为True表示stat结果来自DirEntry：其中没有inode信息时记录inode_pending，需要时由fill_inode补齐
+    """
+    device, inode, nlink = inode_fields(stat_result)
+    return {
+        'file_size': stat_result.st_size,
+        'ctime_ns': stat_result.st_ctime_ns,
+        # 纳秒精度的修改时间，也与设备号、inode、大小一起识别被移动或重命名的文件
+        'mtime_ns': stat_result.st_mtime_ns,
+        'atime_ns': stat_result.st_atime_ns,
+        'owner': owner_name(stat_result.st_uid),
+        # 设备号和inode用于识别硬链接，链接数大于1时才需要查找同一inode的其他路径；没有inode信息时为None
+        'device': device,
+        'inode': inode,
+        'nlink': nlink,
+        'inode_pending': from_entry and inode is None,
+    }
+
+
+def fill_inode(meta, file_path):
+    """
+    DirEntry的stat结果没有inode信息时（Windows），用一次os.stat补齐设备号、inode和链接数（只补齐一次）
+
+    只在识别移动文件、硬链接和写入记录时调用，未变化的文件不增加stat；
+    os.stat同样没有inode信息（如部分网络文件系统）时三项保持None
+    """
+    if meta.get('inode_pending'):
+        meta['inode_pending'] = False
+        try:
+            meta['device'], meta['inode'], meta['nlink'] = inode_fields(os.stat(file_path, follow_symlinks=False))
+        except OSError:
+            pass
+    return meta
@@ -0,0 +1,65 @@
+#硬链接识别：多个路径指向同一inode时只计算一次哈希，报告中区分真正的副本和硬链接
+import threading
+
+
+def inode_key(device, inode):
+    """(设备号, inode)标识同一个文件实体；缺少inode信息（旧记录）时返回None"""
+    if device is None or not inode:
+        return None
+    return device, inode
+
+
+class InodeHashCache:
+    """一次扫描中按(设备号, inode)缓存哈希结果（线程安全）
+
+    第一个遇到某个inode的线程负责计算，同时遇到同一inode其他硬链接的线程等待其结果，
+    不再重复读取文件。只有链接数大于1的文件需要经过该缓存。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get_or_compute(self, key, compute):
+        """
+        返回key对应的结果，尚未计算时调用compute()计算
+
+        参数:
+            key: inode_key的结果
+            compute: 无参数函数，返回要缓存的结果（可为None，表示计算失败）
+        """
+        with self.lock:
+            slot = self.entries.get(key)
+            owner = slot is None
+            if owner:
+                slot = self.entries[key] = [threading.Event(), None]
+        if owner:
+            try:
+                slot[1] = compute()
+            finally:
+                slot[0].set()
+        else:
+            slot[0].wait()
+        return slot[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def mark_hardlinks(files_info):
+    """
+    标记重复文件组中的硬链接
+
+    参数:
+        files_info: iter_duplicate_groups中的文件信息列表，包含device、inode
+    返回:
+        int: 组内不同inode的数量（真正占用磁盘空间的副本数）
+    设置每个文件的'hardlink_of'：与其共享inode的第一个组成员路径，不是硬链接时为None
+    """
+    first_paths = {}
+    for file_info in files_info:
+        key = inode_key(file_info.get('device'), file_info.get('inode'))
+        file_info['hardlink_of'] = first_paths.get(key) if key else None
+        if key and key not in first_paths:
+            first_paths[key] = file_info['path']
+    return sum(1 for file_info in files_info if file_info['hardlink_of'] is None)
@@ -0,0 +1,145 @@
+#哈希引擎注册表：统一管理标准库和可选第三方库提供的哈希算法
+import time
+import hashlib
+from filedup.global_vars import log_print, LOG_LEVEL_WARN, LOG_LEVEL_INFO
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+DEFAULT_HASH_ENGINE = 'md5'
+# 附加哈希在file_features中的列名前缀，如sha256保存在hash_sha256列
+HASH_COLUMN_PREFIX = 'hash_'
+
+
+class HashEngine:
+    """哈希引擎描述：名称即保存到数据库中的算法标签（"名称:十六进制摘要"）"""
+    def __init__(self, name, factory, description, available=True, fallback=None):
+        """
+        参数:
+            name: 引擎名称，也是哈希值的算法前缀
+            factory: 创建哈希对象的函数，哈希对象需提供update()和hexdigest()
+            description: 引擎说明
+            available: 引擎依赖的库是否已安装
+            fallback: 引擎不可用时改用的引擎名称
+        """
+        self.name = name
+        self.factory = factory
+        self.description = description
+        self.available = available
+        self.fallback = fallback
+
+
+_engines = {}
+
+
+def register_engine(engine):
+    """注册哈希引擎，同名引擎会被覆盖"""
+    _engines[engine.name] = engine
+
+
+def engine_names():
+    """所有已注册的引擎名称（包括依赖库未安装的引擎）"""
+    return list(_engines)
+
+
+def available_engine_names():
+    """当前可用的引擎名称"""
+    return [name for name, engine in _engines.items() if engine.available]
+
+
+def resolve_engine_name(name):
+    """
+    解析实际使用的引擎名称：引擎不可用时沿fallback链回退，未知引擎回退到默认引擎
+
+    返回:
+        str: 可用的引擎名称
+    """
+    requested = name
+    while name in _engines and not _engines[name].available:
+        name = _engines[name].fallback
+    if name not in _engines:
+        name = DEFAULT_HASH_ENGINE
+    if name != requested:
+        log_print(f"哈希引擎 {requested} 不可用，使用 {name}", log_level=LOG_LEVEL_WARN)
+    return name
+
+
+def new_hasher(name):
+    """创建指定引擎的哈希对象（引擎不可用时自动回退）"""
+    if name not in _engines or not _engines[name].available:
+        name = resolve_engine_name(name)
+    return _engines[name].factory()
+
+
+def hash_tag(file_hash):
+    """获取哈希值的算法标签，如 "md5:abc..." 返回 "md5"，无标签时返回None"""
+    if not file_hash or ':' not in file_hash:
+        return None
+    return file_hash.split(':', 1)[0]
+
+
+def hash_column(name):
+    """附加哈希算法对应的数据库列名"""
+    return HASH_COLUMN_PREFIX + name.replace('-', '_')
+
+
+def benchmark_engines(total_size=64 * 1024 * 1024, block_size=1024 * 1024, names=None):
+    """
+    哈希引擎吞吐量微基准：对内存中的数据计算摘要，不包含磁盘I/O
+
+    参数:
+        total_size: 每个引擎处理的数据总量
+        block_size: 每次update的块大小
+        names: 要测试的引擎名称，默认测试所有可用引擎
+    返回:
+        list: (引擎名称, MB/s) 列表，按吞吐量从高到低排序
+    """
+    block = bytes(range(256)) * (block_size // 256)
+    rounds = max(1, total_size // len(block))
+    results = []
+    for name in names or available_engine_names():
+        hasher = new_hasher(name)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            hasher.update(block)
+        hasher.hexdigest()
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        results.append((name, rounds * len(block) / elapsed / (1024 * 1024)))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results
+
+
+def print_benchmark(total_size=64 * 1024 * 1024):
+    """运行哈希引擎微基准并打印结果"""
+    log_print(f"哈希引擎吞吐量测试（每个引擎 {total_size // (1024 * 1024)} MB，不含磁盘I/O）:", log_level=LOG_LEVEL_INFO)
+    for name, speed in benchmark_engines(total_size):
+        log_print(f"  {name:<12} {speed:10.1f} MB/s  {_engines[name].description}", log_level=LOG_LEVEL_INFO)
+    missing = [name for name in engine_names() if not _engines[name].available]
+    if missing:
+        log_print(f"未安装依赖库的引擎: {', '.join(missing)}", log_level=LOG_LEVEL_INFO)
+
+
+# 标准库引擎
+register_engine(HashEngine('md5', hashlib.md5, 'MD5（默认，兼容旧数据库）'))
+register_engine(HashEngine('sha1', hashlib.sha1, 'SHA-1'))
+register_engine(HashEngine('sha256', hashlib.sha256, 'SHA-256，适用于归档清单'))
+register_engine(HashEngine('blake2b', hashlib.blake2b, 'BLAKE2b（512位摘要）'))
+register_engine(HashEngine('blake2b-128', lambda: hashlib.blake2b(digest_size=16), 'BLAKE2b（128位摘要），摘要更短，节省数据库空间'))
+# 可选第三方引擎，未安装时回退到标准库引擎
+register_engine(HashEngine('xxh3_64', xxhash.xxh3_64 if xxhash else None, 'xxHash XXH3 64位（非密码学哈希，需安装xxhash）',
+                           available=xxhash is not None, fallback='blake2b-128'))
+register_engine(HashEngine('xxh3_128', xxhash.xxh3_128 if xxhash else None, 'xxHash XXH3 128位（非密码学哈希，需安装xxhash）',
+                           available=xxhash is not None, fallback='blake2b-128'))
+register_engine(HashEngine('blake3', blake3.blake3 if blake3 else None, 'BLAKE3（需安装blake3）',
+                           available=blake3 is not None, fallback='blake2b'))
+
+
+if __name__ == '__main__':
+    print_benchmark()
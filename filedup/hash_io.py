@@ -0,0 +1,329 @@
+#哈希计算的读取核心：每个线程复用预分配的缓冲区，用readinto填充，再以memoryview切片交给哈希对象，避免每块分配新的bytes；
+#大文件可通过mmap映射直接交给哈希对象；"页缓存友好"模式下读取后丢弃本次读入的页缓存，或使用O_DIRECT绕过页缓存
+import os
+import mmap
+import errno
+import threading
+from filedup.page_cache import PAGE_SIZE, HAS_DIRECT_IO, advise, resident_pages, resident_bytes
+
+# 读取块大小的范围
+MIN_BLOCK_SIZE = 64 * 1024
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+# 超过该大小的文件使用最大块
+LARGE_FILE_SIZE = 256 * 1024 * 1024
+# 不小于该大小的文件默认通过mmap映射读取，None表示不使用mmap
+DEFAULT_MMAP_THRESHOLD = 64 * 1024 * 1024
+
+_local = threading.local()
+
+
+def adaptive_block_size(file_size, device_block_size=None):
+    """
+    根据文件大小和设备的首选I/O大小（st_blksize）确定读取块大小
+
+    小文件一次读完；大文件使用更大的块以减少系统调用次数；结果按设备块大小对齐。
+    参数:
+        file_size: 文件大小
+        device_block_size: 设备的首选I/O大小，未知时为None
+    返回:
+        int: 块大小
+    """
+    if file_size <= DEFAULT_BLOCK_SIZE:
+        block_size = max(file_size, MIN_BLOCK_SIZE)
+    elif file_size >= LARGE_FILE_SIZE:
+        block_size = MAX_BLOCK_SIZE
+    else:
+        block_size = DEFAULT_BLOCK_SIZE
+    if device_block_size and device_block_size > 0:
+        block_size = -(-block_size // device_block_size) * device_block_size
+    return min(max(block_size, MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+def worker_buffer(size):
+    """获取当前线程的读缓冲区（memoryview），容量不足时扩大；同一线程的后续调用复用同一块内存"""
+    buf = getattr(_local, 'buffer', None)
+    if buf is None or len(buf) < size:
+        buf = bytearray(size)
+        _local.buffer = buf
+        _local.view = memoryview(buf)
+    return _local.view
+
+
+def direct_buffer(size):
+    """获取当前线程用于O_DIRECT读取的缓冲区（匿名映射，按页对齐），容量不足时扩大"""
+    buf = getattr(_local, 'direct_buffer', None)
+    if buf is None or len(buf) < size:
+        buf = mmap.mmap(-1, size)
+        _local.direct_buffer = buf
+        _local.direct_view = memoryview(buf)
+    return _local.direct_view
+
+
+def hash_file_object(file, hashers, block_size, file_size=0, progress=None):
+    """
+    从已打开的二进制文件读取全部内容并更新所有哈希对象
+
+    参数:
+        file: 以'rb'打开的文件对象
+        hashers: 哈希对象列表，每个数据块依次交给所有哈希对象
+        block_size: 读取块大小
+        file_size: 文件大小，仅用于进度回调
+        progress: 进度回调 progress(已处理字节数, 文件大小)，可为None
+    返回:
+        int: 读取的字节数
+    """
+    view = worker_buffer(block_size)[:block_size]
+    processed_size = 0
+    while True:
+        n = file.readinto(view)
+        if not n:
+            break
+        chunk = view[:n]
+        for hasher in hashers:
+            hasher.update(chunk)
+        processed_size += n
+        if progress:
+            progress(processed_size, file_size)
+    return processed_size
+
+
+def hash_file_mmap(file, hashers, block_size, file_size, progress=None):
+    """
+    把文件映射到内存，直接从映射区切片交给哈希对象，不复制到Python缓冲区
+
+    支持时通过madvise(MADV_SEQUENTIAL)提示内核按顺序预读。
+    返回:
+        int: 处理的字节数；无法映射时返回None（此时哈希对象未被修改），由调用方回退到readinto读取
+    """
+    try:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # 部分文件系统（如某些网络文件系统、特殊文件）不支持映射
+        return None
+    with mapping:
+        if hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapping)
+        try:
+            size = len(mapping)
+            for offset in range(0, size, block_size):
+                chunk = view[offset:offset + block_size]
+                for hasher in hashers:
+                    hasher.update(chunk)
+                chunk.release()
+                if progress:
+                    progress(min(offset + block_size, size), file_size)
+        finally:
+            # 映射关闭前必须释放所有导出的memoryview
+            view.release()
+        return size
+
+
+def _drop_cold_pages(fd, resident_before, offset, start, length):
+    """丢弃[start, start+length)中读取前未驻留的连续页（start相对offset），返回请求丢弃的字节数"""
+    dropped = 0
+    end = start + length
+    page = start // PAGE_SIZE
+    while page * PAGE_SIZE < end:
+        run = page
+        while run * PAGE_SIZE < end and not resident_before[run] & 1:
+            run += 1
+        if run > page:
+            begin = max(page * PAGE_SIZE, start)
+            size = min(run * PAGE_SIZE, end) - begin
+            if advise(fd, offset + begin, size, 'POSIX_FADV_DONTNEED'):
+                dropped += size
+        page = run + 1
+    return dropped
+
+
+def hash_file_polite(file, hashers, block_size, file_size, progress=None, stats=None, offset=0, length=None,
+                     resident_before=None):
+    """
+    页缓存友好的读取：读取前提示顺序访问，每读完一块就用POSIX_FADV_DONTNEED丢弃该块的页缓存
+
+    读取前已驻留页缓存的块（可能是同一台机器上其他服务的热数据）不会被丢弃。
+    参数:
+        offset, length: 只读取文件中的一段（分段哈希），length为None时读到文件末尾
+        resident_before: 读取整个文件之前的resident_pages结果（分段哈希在读取任何段之前取得，
+                         避免把其他段预读入的页当作热数据），offset须按页对齐；None表示读取前检测本段
+    返回:
+        int: 读取的字节数
+    """
+    fd = file.fileno()
+    span = file_size - offset if length is None else length
+    if resident_before is None:
+        resident_before = resident_pages(fd, span, offset)
+    else:
+        resident_before = resident_before[offset // PAGE_SIZE:]
+    advise(fd, offset, length or 0, 'POSIX_FADV_SEQUENTIAL')
+    if offset:
+        file.seek(offset)
+    view = worker_buffer(block_size)[:block_size]
+    processed_size = 0
+    dropped = kept_hot = 0
+    while length is None or processed_size < length:
+        n = file.readinto(view if length is None else view[:min(block_size, length - processed_size)])
+        if not n:
+            break
+        chunk = view[:n]
+        for hasher in hashers:
+            hasher.update(chunk)
+        hot = resident_bytes(resident_before, span, processed_size, n)
+        if hot:
+            # 块内只有部分页读取前已驻留（如分段采样读入的页）时，只保留这些页，丢弃其余的页
+            kept_hot += hot
+            dropped += _drop_cold_pages(fd, resident_before, offset, processed_size, n)
+        elif advise(fd, offset + processed_size, n, 'POSIX_FADV_DONTNEED'):
+            dropped += n
+        processed_size += n
+        if progress:
+            progress(processed_size, span)
+    if stats:
+        stats.add(bytes_read=processed_size, bytes_dropped=dropped, bytes_kept_hot=kept_hot)
+        resident_after = resident_pages(fd, processed_size, offset)
+        if resident_after is not None:
+            stats.add(bytes_resident=resident_bytes(resident_after, processed_size))
+    return processed_size
+
+
+def hash_file_direct(file_path, hashers, block_size, file_size, progress=None, stats=None, offset=0, length=None):
+    """
+    使用O_DIRECT绕过页缓存读取文件，缓冲区和块大小按页对齐
+
+    参数:
+        offset, length: 只读取文件中的一段（分段哈希），offset须按页对齐，length为None时读到文件末尾
+    返回:
+        int: 读取的字节数；平台或文件系统不支持O_DIRECT（或offset未对齐）时返回None（此时哈希对象未被修改），由调用方回退
+    """
+    if not HAS_DIRECT_IO or offset % PAGE_SIZE:
+        return None
+    try:
+        fd = os.open(file_path, os.O_RDONLY | os.O_DIRECT)
+    except OSError as e:
+        if e.errno == errno.EINVAL:
+            # 文件系统不支持O_DIRECT（如tmpfs）
+            return None
+        raise
+    try:
+        if offset:
+            os.lseek(fd, offset, os.SEEK_SET)
+        span = file_size - offset if length is None else length
+        block_size = -(-block_size // PAGE_SIZE) * PAGE_SIZE
+        view = direct_buffer(block_size)[:block_size]
+        processed_size = 0
+        while length is None or processed_size < length:
+            # 分段读取时最后一块按页向上取整，多读入的字节不参与计算
+            size = block_size if length is None else min(block_size, -(-(length - processed_size) // PAGE_SIZE) * PAGE_SIZE)
+            try:
+                n = os.readv(fd, [view[:size]])
+            except OSError as e:
+                if processed_size == 0 and e.errno == errno.EINVAL:
+                    # 打开成功但读取时才报告不支持对齐读取
+                    return None
+                raise
+            if not n:
+                break
+            if length is not None:
+                n = min(n, length - processed_size)
+            chunk = view[:n]
+            for hasher in hashers:
+                hasher.update(chunk)
+            chunk.release()
+            processed_size += n
+            if progress:
+                progress(processed_size, span)
+        if stats:
+            stats.add(bytes_read=processed_size, direct_bytes=processed_size)
+        return processed_size
+    finally:
+        os.close(fd)
+
+
+def hash_file(file_path, hashers, block_size=None, file_size=None, progress=None, mmap_threshold=None,
+              cache_polite=False, direct_io=False, stats=None):
+    """
+    打开文件并计算哈希，块大小未指定时按文件大小和设备自动确定
+
+    参数:
+        file_path: 文件路径
+        hashers: 哈希对象列表
+        block_size: 读取块大小，None表示自动
+        file_size: 已知的文件大小，为None时从打开的文件句柄获取
+        progress: 进度回调，见hash_file_object
+        mmap_threshold: 不小于该大小的文件通过mmap读取，None表示不使用mmap；页缓存友好模式下不使用mmap
+        cache_polite: 页缓存友好模式，读取后丢弃本次读入的页缓存，见hash_file_polite
+        direct_io: 页缓存友好模式下优先使用O_DIRECT读取，不支持时回退到hash_file_polite
+        stats: filedup.page_cache.IOStats，记录读取统计，可为None
+    返回:
+        int: 读取的字节数；打开或读取失败时抛出OSError
+    """
+    with open(file_path, 'rb', buffering=0) as file:
+        st = os.fstat(file.fileno())
+        if file_size is None:
+            file_size = st.st_size
+        if block_size is None:
+            block_size = adaptive_block_size(file_size, getattr(st, 'st_blksize', None))
+        if cache_polite:
+            if direct_io and st.st_size > 0:
+                processed_size = hash_file_direct(file_path, hashers, block_size, file_size, progress, stats)
+                if processed_size is not None:
+                    return processed_size
+            return hash_file_polite(file, hashers, block_size, file_size, progress, stats)
+        # 以实际打开的文件大小判断，避免stat之后文件被截断为空时映射失败
+        processed_size = None
+        if mmap_threshold is not None and st.st_size > 0 and st.st_size >= mmap_threshold:
+            processed_size = hash_file_mmap(file, hashers, block_size, file_size, progress)
+        if processed_size is None:
+            processed_size = hash_file_object(file, hashers, block_size, file_size, progress)
+        if stats:
+            stats.add(bytes_read=processed_size)
+        return processed_size
+
+
+def hash_file_range(file_path, hashers, offset, length, block_size=None, progress=None,
+                    cache_polite=False, direct_io=False, stats=None, resident_before=None):
+    """
+    计算文件中一段数据的哈希（用于分段哈希，多个线程可同时读取同一文件的不同段）
+
+    参数:
+        file_path: 文件路径
+        hashers: 哈希对象列表
+        offset: 起始偏移量
+        length: 长度
+        block_size: 读取块大小，None表示按段长度自动确定
+        progress: 进度回调 progress(已处理字节数, 段长度)，可为None
+        cache_polite, direct_io, stats: 同hash_file
+        resident_before: 页缓存友好模式下整个文件读取前的驻留情况，见hash_file_polite
+    返回:
+        int: 读取的字节数（文件在读取期间被截断时可能小于length）
+    """
+    with open(file_path, 'rb', buffering=0) as file:
+        st = os.fstat(file.fileno())
+        if block_size is None:
+            block_size = adaptive_block_size(length, getattr(st, 'st_blksize', None))
+        if cache_polite:
+            if direct_io and length > 0:
+                processed_size = hash_file_direct(file_path, hashers, block_size, st.st_size, progress, stats,
+                                                  offset, length)
+                if processed_size is not None:
+                    return processed_size
+            return hash_file_polite(file, hashers, block_size, st.st_size, progress, stats, offset, length,
+                                    resident_before)
+        file.seek(offset)
+        view = worker_buffer(block_size)
+        processed_size = 0
+        while processed_size < length:
+            n = file.readinto(view[:min(block_size, length - processed_size)])
+            if not n:
+                break
+            chunk = view[:n]
+            for hasher in hashers:
+                hasher.update(chunk)
+            processed_size += n
+            if progress:
+                progress(processed_size, length)
+        if stats:
+            stats.add(bytes_read=processed_size)
+        return processed_size
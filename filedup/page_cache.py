@@ -0,0 +1,108 @@
+#页缓存友好读取的辅助功能：posix_fadvise提示、mincore驻留检测和读取统计
+import os
+import sys
+import mmap
+import ctypes
+import threading
+
+PAGE_SIZE = mmap.PAGESIZE
+
+# posix_fadvise和mincore只在部分平台可用（Windows上都不可用）
+HAS_FADVISE = hasattr(os, 'posix_fadvise')
+HAS_DIRECT_IO = hasattr(os, 'O_DIRECT')
+
+_mincore = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _mincore = _libc.mincore
+        _mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+        _mincore.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _mincore = None
+
+
+def advise(fd, offset, length, advice_name):
+    """调用posix_fadvise，advice_name如'POSIX_FADV_SEQUENTIAL'；平台不支持或调用失败时静默忽略"""
+    if not HAS_FADVISE:
+        return False
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice_name))
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def resident_pages(fd, file_size, offset=0):
+    """
+    获取文件各页是否驻留在页缓存中；offset不为0时只检测从offset开始的file_size字节（offset须按映射粒度对齐）
+
+    返回:
+        bytes: 每页一个字节，最低位为1表示驻留；平台不支持或检测失败时返回None
+    """
+    if _mincore is None or file_size <= 0:
+        return None
+    try:
+        # ACCESS_COPY是私有映射，可以取得地址，且只读不会产生写时复制
+        mapping = mmap.mmap(fd, file_size, access=mmap.ACCESS_COPY, offset=offset)
+    except (OSError, ValueError):
+        return None
+    try:
+        address = ctypes.c_char.from_buffer(mapping)
+        try:
+            pages = (file_size + PAGE_SIZE - 1) // PAGE_SIZE
+            vec = (ctypes.c_ubyte * pages)()
+            if _mincore(ctypes.addressof(address), file_size, vec) != 0:
+                return None
+            return bytes(vec)
+        finally:
+            # 映射关闭前必须释放从中导出的ctypes对象
+            del address
+    finally:
+        mapping.close()
+
+
+def resident_bytes(pages, file_size, offset=0, length=None):
+    """根据resident_pages的结果统计指定范围内驻留页缓存的字节数（按整页计，不超过文件大小）"""
+    if pages is None:
+        return 0
+    if length is None:
+        length = file_size - offset
+    first = offset // PAGE_SIZE
+    last = (offset + length + PAGE_SIZE - 1) // PAGE_SIZE
+    count = sum(1 for flag in pages[first:last] if flag & 1)
+    return min(count * PAGE_SIZE, length)
+
+
+class IOStats:
+    """哈希读取统计（线程安全）：读取的字节数、读取后请求丢弃的字节数以及读取后仍驻留页缓存的字节数"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bytes_read = 0
+        self.bytes_dropped = 0          # 读取后通过POSIX_FADV_DONTNEED请求丢弃的字节数
+        self.bytes_kept_hot = 0         # 读取前已驻留（可能是其他服务的热数据），因此没有丢弃的字节数
+        self.bytes_resident = 0         # 读取完成后经mincore检测仍驻留的字节数
+        self.resident_measured = False  # 是否进行过驻留检测
+        self.direct_bytes = 0           # 通过O_DIRECT读取、绕过页缓存的字节数
+
+    def add(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+            if 'bytes_resident' in counters:
+                self.resident_measured = True
+
+    def summary(self):
+        """生成统计摘要文本"""
+        mb = 1024 * 1024
+        text = f"哈希读取 {self.bytes_read / mb:.1f} MB"
+        if self.direct_bytes:
+            text += f"，其中O_DIRECT读取 {self.direct_bytes / mb:.1f} MB"
+        if self.bytes_dropped or self.bytes_kept_hot:
+            text += f"，读取后丢弃页缓存 {self.bytes_dropped / mb:.1f} MB，保留原有热数据 {self.bytes_kept_hot / mb:.1f} MB"
+        if self.resident_measured:
+            text += f"，读取后仍驻留页缓存 {self.bytes_resident / mb:.1f} MB"
+        return text
@@ -0,0 +1,234 @@
+#多进程哈希后端：按批次把文件路径交给进程池处理，工作进程返回按写入列顺序排列的元组，结果流式交给主进程中唯一的数据库写入者
+import time
+import sqlite3
+import pathlib
+import threading
+import multiprocessing
+from filedup.dir_walker import iter_dir_entries
+from filedup.page_cache import IOStats
+from filedup.tree_hash import TreeHasher
+from filedup.hardlinks import InodeHashCache
+from filedup.db_schema import FeatureCodec
+from filedup.db_writer import split_rows
+from filedup.global_vars import log_print, LOG_LEVEL_ERROR, LOG_LEVEL_DEBUG
+
+# 每个任务批次包含的文件数：批次越大，进程间通信的开销越小
+DEFAULT_BATCH_FILES = 256
+# 每个工作进程最多同时排队的批次数（反压：遍历不会远远领先于哈希计算）
+INFLIGHT_PER_WORKER = 4
+
+# 工作进程中的单文件处理对象，由_init_worker创建
+_worker = None
+
+
+def _init_worker(settings):
+    """工作进程初始化：创建不打开数据库、不注册文件处理器的精简处理对象"""
+    global _worker
+    # 延迟导入，避免与file_duplicate_finder循环导入
+    from filedup.file_duplicate_finder import FileDuplicateFinder
+
+    class HashWorker:
+        """复用FileDuplicateFinder的单文件处理方法，只携带这些方法需要的设置"""
+        _process_file = FileDuplicateFinder._process_file
+        calculate_file_hash = FileDuplicateFinder.calculate_file_hash
+        calculate_file_hashes = FileDuplicateFinder.calculate_file_hashes
+        calculate_tree_hash = FileDuplicateFinder.calculate_tree_hash
+        expected_hash_tag = FileDuplicateFinder.expected_hash_tag
+        _hash_inode_once = FileDuplicateFinder._hash_inode_once
+        find_moved_from = FileDuplicateFinder.find_moved_from
+        _move_sample_matches = FileDuplicateFinder._move_sample_matches
+        file_info_query = FileDuplicateFinder.file_info_query
+        file_info_from_row = FileDuplicateFinder.file_info_from_row
+
+        def __init__(self, settings):
+            self.__dict__.update(settings)
+            # 大小预过滤需要所有文件共享的状态，多进程模式下不支持；限速在主进程中执行（遍历的文件速率和按批次的字节速率）
+            self.size_filter = None
+            self.throttle = None
+            self.io_stats = IOStats()
+            # 树哈希的段摘要随批次结果返回主进程保存
+            self.tree_hasher = TreeHasher(self.segment_threads)
+            self.pending_segments = {}
+            self.segments_lock = threading.Lock()
+            # 硬链接只在同一工作进程内去重
+            self.inode_cache = InodeHashCache()
+            # 查找移动文件旧记录的只读数据库连接，第一次需要时打开
+            self.db = None
+            self.codec = None
+
+        def move_candidate(self, key, existing_file_info):
+            """按(设备号, inode)在数据库中查找新路径被移动之前的记录（只读连接），主进程不需要为新路径stat；
+            找到的旧记录加入本批的existing_file_info，确认由find_moved_from完成"""
+            if key is None or not self.detect_moves:
+                return None
+            if self.db is None:
+                self.db = sqlite3.connect(pathlib.Path(self.db_path).absolute().as_uri() + '?mode=ro', uri=True)
+                self.codec = FeatureCodec(self.db.cursor())
+            row = self.db.execute(self.file_info_query() + " WHERE device = ? AND inode = ? AND mtime_ns IS NOT NULL",
+                                  key).fetchone()
+            if row is None:
+                return None
+            old_path, old_info, _ = self.file_info_from_row(row)
+            existing_file_info.setdefault(old_path, old_info)
+            return old_path, existing_file_info[old_path]
+
+    _worker = HashWorker(settings)
+
+
+def _process_batch(batch):
+    """
+    在工作进程中处理一批文件
+
+    参数:
+        batch: [(文件路径, 数据库中的已有记录或None), ...]
+    返回:
+        (tuple, int, int, dict): filedup.db_writer.split_rows的结果（可直接交给FeatureWriter.write_rows），
+                                 本批处理的文件数，本批读取的字节数，本批计算的树哈希段摘要
+    """
+    _worker.io_stats.reset()
+    existing_file_info = {file_path: info for file_path, info in batch if info is not None}
+    results = []
+    for file_path, _ in batch:
+        try:
+            results.append(_worker._process_file(file_path, existing_file_info))
+        except Exception as e:
+            log_print(f"处理文件时出错 {file_path}: {e}", log_level=LOG_LEVEL_ERROR)
+    with _worker.segments_lock:
+        segments, _worker.pending_segments = _worker.pending_segments, {}
+    return split_rows(results, _worker.extra_hash_columns), len(batch), _worker.io_stats.bytes_read, segments
+
+
+class ProcessScanPipeline:
+    """多进程扫描引擎
+
+    遍历（进程池的任务分发线程）-> 按批次分发到工作进程 -> 主线程按到达顺序接收结果并批量写入数据库
+
+    适合小文件为主的目录：每个文件的Python开销（stat、字典构建、写入参数的排列等）在多个进程中并行执行，
+    不再受GIL限制，主进程只编码所有者和哈希值并执行executemany。通过信号量限制同时排队的批次数，
+    形成与线程流水线相同的反压。
+    """
+    def __init__(self, finder, batch_size=1000, flush_interval=2.0, batch_files=DEFAULT_BATCH_FILES):
+        """
+        参数:
+            finder: FileDuplicateFinder实例，提供处理设置和批量保存方法
+            batch_size: 每批提交到数据库的记录数
+            flush_interval: 批次未满时的最长提交间隔（秒）
+            batch_files: 每个任务批次包含的文件数
+        """
+        self.finder = finder
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch_files = batch_files
+        self.stop_event = threading.Event()
+        self.total_files = 0
+        self.saved_count = 0
+
+    def _settings(self):
+        """工作进程需要的处理设置"""
+        finder = self.finder
+        return {
+            'hash_algorithm': finder.hash_algorithm,
+            'extra_hash_algorithms': finder.extra_hash_algorithms,
+            'force_recalculate': finder.force_recalculate,
+            'staged_hash': finder.staged_hash,
+            'mmap_threshold': finder.mmap_threshold,
+            'cache_polite': finder.cache_polite,
+            'direct_io': finder.direct_io,
+            'tree_hash_threshold': finder.tree_hash_threshold,
+            'segment_size': finder.segment_size,
+            'segment_threads': finder.tree_hasher.max_workers,
+            'partial_rehash': finder.partial_rehash,
+            'known_inodes': finder.known_inodes,
+            'verify_moves': finder.verify_moves,
+            'extra_hash_columns': finder.extra_hash_columns,
+            # 数据库中有inode信息的记录时，工作进程为新路径查找移动前的记录（内存数据库不能被其他进程打开）
+            'detect_moves': bool(finder.inode_paths) and finder.db_path != ':memory:',
+            'db_path': finder.db_path,
+            'progress_bar': None,
+        }
+
+    def _batches(self, directory_path, existing_file_info, slots):
+        """遍历目录并产出任务批次；在进程池的任务分发线程中执行，没有空闲槽位时阻塞"""
+        batch = []
+        try:
+            for file_path, entry in iter_dir_entries(directory_path, skip_link=True, dir_state=self.finder.dir_tracker):
+                if self.stop_event.is_set():
+                    return
+                if self.finder.throttle:
+                    self.finder.throttle.limit_files()
+                # 新路径的移动前记录由工作进程按其stat结果在数据库中查找
+                batch.append((file_path, existing_file_info.get(file_path)))
+                self.total_files += 1
+                if self.finder.progress_bar:
+                    self.finder.progress_bar.add_total()
+                if len(batch) >= self.batch_files:
+                    if not self._acquire(slots):
+                        return
+                    yield batch
+                    batch = []
+        except Exception as e:
+            log_print(f"遍历目录时出错 {directory_path}: {e}", log_level=LOG_LEVEL_ERROR)
+        if batch and self._acquire(slots):
+            yield batch
+
+    def _acquire(self, slots):
+        """等待空闲槽位，流水线中止时返回False"""
+        while not self.stop_event.is_set():
+            if slots.acquire(timeout=0.5):
+                return True
+        return False
+
+    def _flush(self, rows, touches, moves):
+        """提交一个批次"""
+        if not (rows or touches):
+            return
+        if self.finder.batch_save_rows(rows, touches, moves):
+            self.saved_count += len(rows) + len(touches)
+        log_print(f"已提交 {self.saved_count} 个文件的属性", log_level=LOG_LEVEL_DEBUG)
+
+    def run(self, directory_path, existing_file_info, num_workers):
+        """
+        运行多进程扫描
+
+        参数:
+            directory_path: 要扫描的目录
+            existing_file_info: 数据库中已有的文件信息，按文件随批次发送给工作进程
+            num_workers: 工作进程数
+        返回:
+            int: 写入数据库的记录数
+        """
+        num_workers = max(1, num_workers)
+        slots = threading.Semaphore(num_workers * INFLIGHT_PER_WORKER)
+        rows, touches, moves = [], [], []
+        last_flush = time.monotonic()
+        pool = multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(self._settings(),))
+        try:
+            for (batch_rows, batch_touches, batch_moves), processed, bytes_read, segments in pool.imap_unordered(
+                    _process_batch, self._batches(directory_path, existing_file_info, slots)):
+                # 字节限速按批次在主进程中执行：等待期间不释放槽位，工作进程随之停止领取新批次
+                if self.finder.throttle:
+                    self.finder.throttle.limit_bytes(bytes_read)
+                slots.release()
+                self.finder.io_stats.add(bytes_read=bytes_read)
+                with self.finder.segments_lock:
+                    self.finder.pending_segments.update(segments)
+                # 工作进程已按写入列顺序排列，不再为每个文件构建字典
+                rows += batch_rows
+                touches += batch_touches
+                moves += batch_moves
+                if self.finder.progress_bar:
+                    self.finder.progress_bar.update(processed)
+                pending = len(rows) + len(touches)
+                if pending >= self.batch_size or (pending and time.monotonic() - last_flush >= self.flush_interval):
+                    self._flush(rows, touches, moves)
+                    rows, touches, moves = [], [], []
+                    last_flush = time.monotonic()
+            self._flush(rows, touches, moves)
+            pool.close()
+        except BaseException:
+            self.stop_event.set()
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return self.saved_count
@@ -20,4 +20,8 @@ class ProgressBar:
     def reset(self,total):
         self.current = 0
         self.total = total
-        
\ No newline at end of file
+        
+    def add_total(self, step=1):
+        """增加总数，用于总数在处理过程中逐步确定的流式场景"""
+        with self.lock:
+            self.total += step
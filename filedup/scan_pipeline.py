@@ -0,0 +1,228 @@
+#流水线扫描引擎：遍历、哈希计算、数据库写入三个阶段并发执行
+import os
+import time
+import queue
+import threading
+from filedup.dir_walker import iter_dir_entries
+from filedup.file_meta import stat_file
+from filedup.device_sched import DeviceQueue, UNKNOWN_DEVICE
+from filedup.autotune import GatedQueue
+from filedup.global_vars import log_print, LOG_LEVEL_ERROR, LOG_LEVEL_DEBUG, LOG_LEVEL_INFO
+
+# 队列结束标记
+_DONE = None
+
+
+class ScanPipeline:
+    """流水线扫描引擎
+
+    遍历线程 -> 有界文件队列 -> 多个哈希工作线程 -> 有界结果队列 -> 写入阶段（调用线程）
+
+    两个队列都有容量上限，写入慢时哈希线程阻塞，哈希慢时遍历线程阻塞，
+    形成端到端的反压；写入阶段在结果到达时按批次提交，
+    因此首次提交时间和峰值内存都不再依赖目录树的大小。
+    SQLite连接只能在创建它的线程中使用，所以写入阶段运行在调用run()的线程中。
+
+    指定device_scheduler时，文件队列按设备（st_dev）拆分：遍历线程第一次遇到某个设备时
+    为其创建按inode排序的DeviceQueue和独立的工作线程池。
+    指定controller时（不按设备调度），启动controller.max_workers个工作线程，由控制器决定同时取任务的线程数。
+    """
+    def __init__(self, finder, queue_size=4096, batch_size=1000, flush_interval=2.0, device_scheduler=None,
+                 controller=None):
+        """
+        参数:
+            finder: FileDuplicateFinder实例，提供单文件处理和批量保存方法
+            queue_size: 文件队列和结果队列的容量上限
+            batch_size: 每批提交到数据库的记录数
+            flush_interval: 批次未满时的最长提交间隔（秒）
+            device_scheduler: filedup.device_sched.DeviceScheduler，为None时所有文件共用一个队列和线程池
+            controller: filedup.autotune.WorkerController，自动调整线程数，为None时使用固定的线程数
+        """
+        self.finder = finder
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.file_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.walk_done = threading.Event()
+        self.total_files = 0
+        self.saved_count = 0
+        self.device_scheduler = device_scheduler
+        self.controller = controller
+        self.device_queues = {}
+        self.threads = []
+        self.worker_count = 0
+
+    def _put(self, q, item):
+        """带停止检查的阻塞入队，流水线中止时放弃入队"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _device_queue(self, st_dev, existing_file_info):
+        """获取设备的待处理队列，第一次遇到该设备时创建队列并启动其工作线程池"""
+        device_queue = self.device_queues.get(st_dev)
+        if device_queue is None:
+            pool_size, kind = self.device_scheduler.pool_size(st_dev)
+            device_queue = DeviceQueue(self.device_scheduler.window)
+            self.device_queues[st_dev] = device_queue
+            log_print(f"设备 {st_dev}（{kind}）：{pool_size} 个哈希线程", log_level=LOG_LEVEL_INFO)
+            for _ in range(pool_size):
+                t = threading.Thread(target=self._hash_stage, args=(existing_file_info, device_queue), daemon=True)
+                self.threads.append(t)
+                self.worker_count += 1
+                t.start()
+        return device_queue
+
+    def _walk_devices_stage(self, directory_path, existing_file_info):
+        """遍历阶段（按设备调度）：按st_dev把文件分发到各设备的队列"""
+        # DirEntry的stat结果没有设备号和inode时（Windows上st_dev、st_ino总是0），设备号取自文件所在目录的os.stat；
+        # 遍历器逐个目录产出文件，只缓存当前目录的结果。这些文件在设备队列内按到达顺序处理
+        parent_dir, parent_device = None, UNKNOWN_DEVICE
+        try:
+            for item in iter_dir_entries(directory_path, skip_link=True, dir_state=self.finder.dir_tracker):
+                if self.finder.throttle:
+                    self.finder.throttle.limit_files()
+                try:
+                    # DirEntry会缓存stat结果，哈希阶段处理该文件时不会再次调用stat
+                    st = stat_file(item[0], item[1])
+                    st_dev, inode = st.st_dev, st.st_ino
+                    if not inode:
+                        if os.path.dirname(item[0]) != parent_dir:
+                            parent_dir = os.path.dirname(item[0])
+                            parent_device = os.stat(parent_dir).st_dev
+                        st_dev = parent_device
+                except OSError:
+                    st_dev, inode = UNKNOWN_DEVICE, 0
+                if not self._device_queue(st_dev, existing_file_info).put(item, inode, self.stop_event):
+                    break
+                self.total_files += 1
+                if self.finder.progress_bar:
+                    self.finder.progress_bar.add_total()
+        except Exception as e:
+            log_print(f"遍历目录时出错 {directory_path}: {e}", log_level=LOG_LEVEL_ERROR)
+        finally:
+            for device_queue in self.device_queues.values():
+                device_queue.close()
+            self.walk_done.set()
+
+    def _walk_stage(self, directory_path, num_workers):
+        """遍历阶段：流式产出(文件路径, DirEntry)，队列满时阻塞"""
+        try:
+            for item in iter_dir_entries(directory_path, skip_link=True, dir_state=self.finder.dir_tracker):
+                if self.finder.throttle:
+                    self.finder.throttle.limit_files()
+                if not self._put(self.file_queue, item):
+                    break
+                self.total_files += 1
+                if self.finder.progress_bar:
+                    self.finder.progress_bar.add_total()
+        except Exception as e:
+            log_print(f"遍历目录时出错 {directory_path}: {e}", log_level=LOG_LEVEL_ERROR)
+        finally:
+            # 放开被控制器暂停的线程，保证每个线程都能取到结束标记
+            if self.controller:
+                self.controller.release_all()
+            # 每个工作线程一个结束标记
+            for _ in range(num_workers):
+                self._put(self.file_queue, _DONE)
+            self.walk_done.set()
+
+    def _hash_stage(self, existing_file_info, file_queue=None):
+        """哈希阶段：处理文件队列直到遇到结束标记，然后通知写入阶段"""
+        try:
+            self.finder._worker_thread(file_queue or self.file_queue, self.result_queue, existing_file_info)
+        finally:
+            self._put(self.result_queue, _DONE)
+
+    def _flush(self, batch):
+        """提交一个批次"""
+        if not batch:
+            return
+        if self.finder.batch_save_file_attributes(batch):
+            self.saved_count += len(batch)
+        log_print(f"已提交 {self.saved_count} 个文件的属性", log_level=LOG_LEVEL_DEBUG)
+
+    def _write_stage(self):
+        """写入阶段：结果到达即攒批，批次满或超时即提交；遍历结束且所有工作线程都发出结束标记后退出"""
+        batch = []
+        last_flush = time.monotonic()
+        finished_workers = 0
+        # 按设备调度时工作线程由遍历线程陆续创建，遍历结束后worker_count才是最终值
+        while not (self.walk_done.is_set() and finished_workers >= self.worker_count):
+            try:
+                attributes = self.result_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                attributes = None
+            else:
+                if attributes is _DONE:
+                    finished_workers += 1
+                else:
+                    batch.append(attributes)
+            if len(batch) >= self.batch_size or (batch and time.monotonic() - last_flush >= self.flush_interval):
+                self._flush(batch)
+                batch = []
+                last_flush = time.monotonic()
+        self._flush(batch)
+
+    def _abort(self, threads):
+        """中止流水线：设置停止标记并排空队列，解除阻塞的线程"""
+        self.stop_event.set()
+        if self.controller:
+            self.controller.stop()
+        while any(t.is_alive() for t in threads):
+            for device_queue in list(self.device_queues.values()):
+                device_queue.drain()
+            for q in (self.file_queue, self.result_queue):
+                try:
+                    while True:
+                        q.get_nowait()
+                except queue.Empty:
+                    pass
+            for t in threads:
+                t.join(timeout=0.1)
+
+    def run(self, directory_path, existing_file_info, num_workers):
+        """
+        运行流水线扫描
+
+        参数:
+            directory_path: 要扫描的目录
+            existing_file_info: 数据库中已有的文件信息，用于跳过未变化的文件
+            num_workers: 哈希工作线程数（按设备调度时由DeviceScheduler确定，不使用该参数）
+        返回:
+            int: 写入数据库的记录数
+        """
+        if self.device_scheduler:
+            # 工作线程由遍历线程按设备创建
+            walker = threading.Thread(target=self._walk_devices_stage, args=(directory_path, existing_file_info), daemon=True)
+            self.threads.append(walker)
+            walker.start()
+        else:
+            num_workers = self.controller.max_workers if self.controller else max(1, num_workers)
+            self.worker_count = num_workers
+            self.threads.append(threading.Thread(target=self._walk_stage, args=(directory_path, num_workers), daemon=True))
+            for index in range(num_workers):
+                file_queue = GatedQueue(self.file_queue, self.controller, index) if self.controller else None
+                self.threads.append(threading.Thread(target=self._hash_stage, args=(existing_file_info, file_queue), daemon=True))
+            if self.controller:
+                self.threads.append(threading.Thread(target=self.controller.run, args=(self.finder.io_stats, self.file_queue),
+                                                     daemon=True))
+            for t in self.threads:
+                t.start()
+
+        try:
+            self._write_stage()
+        except BaseException:
+            self._abort(self.threads)
+            raise
+        if self.controller:
+            self.controller.stop()
+        for t in list(self.threads):
+            t.join()
+        return self.saved_count
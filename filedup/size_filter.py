@@ -0,0 +1,46 @@
+#文件大小碰撞预过滤：大小唯一的文件不可能有重复，不需要计算哈希值
+import threading
+
+
+class SizeCollisionFilter:
+    """按文件大小判断是否需要计算哈希值
+
+    已知文件 = 数据库file_features中的记录 + 本次扫描中已经遇到的文件。
+    只有当其他已知文件与当前文件大小相同时才需要计算哈希值；
+    否则文件以"未计算哈希"（file_hash为NULL）的状态入库，
+    之后一旦出现同样大小的文件，再由FileDuplicateFinder.hash_size_collisions补算。
+    """
+    def __init__(self, db_size_counts):
+        """
+        参数:
+            db_size_counts: 数据库中 文件大小 -> 记录数 的字典
+        """
+        self.db_size_counts = db_size_counts
+        self.scan_size_counts = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, cursor):
+        """从数据库统计已有记录的大小分布"""
+        cursor.execute("SELECT file_size, COUNT(*) FROM file_features GROUP BY file_size")
+        return cls(dict(cursor.fetchall()))
+
+    def collides(self, file_size, existing_info=None):
+        """
+        登记当前文件的大小，并判断是否有其他已知文件与其大小相同
+
+        参数:
+            file_size: 当前文件大小
+            existing_info: 当前文件在数据库中的已有记录（get_existing_file_info中的条目），可为None
+        返回:
+            bool: 存在同样大小的其他文件时返回True
+        """
+        # 数据库中该文件自己的记录已计入db_size_counts，不能算作"其他文件"
+        counted_in_db = existing_info is not None and existing_info['size'] == file_size
+        with self.lock:
+            others = self.db_size_counts.get(file_size, 0) + self.scan_size_counts.get(file_size, 0)
+            if counted_in_db:
+                others -= 1
+            else:
+                self.scan_size_counts[file_size] = self.scan_size_counts.get(file_size, 0) + 1
+        return others > 0
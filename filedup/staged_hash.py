@@ -0,0 +1,135 @@
+#分阶段哈希确认：首尾采样 -> 内部采样 -> 完整哈希，逐步缩小候选重复文件的范围
+from filedup.global_vars import log_print, LOG_LEVEL_ERROR, LOG_LEVEL_INFO
+from filedup.hash_engines import new_hasher, DEFAULT_HASH_ENGINE
+
+# 每个采样块的大小
+SAMPLE_BLOCK_SIZE = 16 * 1024
+# 第二阶段在文件内部均匀采样的块数
+STAGE2_SAMPLES = 8
+
+# 各阶段摘要在file_features中对应的列，最后一个阶段是完整哈希
+STAGE_COLUMNS = ('stage1_hash', 'stage2_hash', 'file_hash')
+
+
+def stage_offsets(file_size, stage):
+    """
+    计算采样阶段需要读取的块偏移量
+
+    参数:
+        file_size: 文件大小
+        stage: 1表示首尾采样，2表示内部采样
+    返回:
+        list: 偏移量列表；文件太小、采样等同于读取整个文件时返回空列表，表示跳过该阶段
+    """
+    if stage == 1:
+        if file_size <= 2 * SAMPLE_BLOCK_SIZE:
+            return []
+        return [0, file_size - SAMPLE_BLOCK_SIZE]
+    if file_size <= (STAGE2_SAMPLES + 2) * SAMPLE_BLOCK_SIZE:
+        return []
+    step = file_size // (STAGE2_SAMPLES + 1)
+    return [i * step for i in range(1, STAGE2_SAMPLES + 1)]
+
+
+def sample_digest(file_path, offsets, hash_algorithm=DEFAULT_HASH_ENGINE):
+    """读取指定偏移量处的采样块并计算摘要，出错时返回None"""
+    try:
+        hasher = new_hasher(hash_algorithm)
+        with open(file_path, 'rb') as file:
+            for offset in offsets:
+                file.seek(offset)
+                hasher.update(file.read(SAMPLE_BLOCK_SIZE))
+        return f"{hash_algorithm}:{hasher.hexdigest()}"
+    except OSError as e:
+        log_print(f"无法计算文件采样哈希 {file_path}: {e}", log_level=LOG_LEVEL_ERROR)
+        return None
+
+
+class StagedHashConfirmer:
+    """分阶段确认同样大小的文件是否重复
+
+    对每个同样大小的文件组，依次比较首尾采样摘要、内部采样摘要和完整哈希，
+    每个阶段之后只有摘要仍然相同的文件进入下一阶段。
+    已保存在数据库中的各阶段摘要（同一哈希算法）直接复用，不再读取文件。
+    """
+    def __init__(self, finder, stages=STAGE_COLUMNS):
+        """
+        参数:
+            finder: FileDuplicateFinder实例，提供哈希算法和多线程计算
+            stages: 要执行的阶段列，默认执行全部三个阶段；只传('file_hash',)时直接比较完整哈希
+        """
+        self.finder = finder
+        self.stages = stages
+        self.hash_algorithm = finder.hash_algorithm
+
+    def _stored(self, digest, column, file_size):
+        """只复用同一哈希算法计算的摘要（完整哈希还需与当前的树哈希设置一致）"""
+        tag = self.finder.expected_hash_tag(file_size) if column == 'file_hash' else self.hash_algorithm
+        if digest and digest.startswith(tag + ':'):
+            return digest
+        return None
+
+    def _digest_func(self, column, file_size):
+        """返回计算某一阶段摘要的函数；该阶段对此文件无意义时返回None"""
+        if column == 'file_hash':
+            return lambda file_path: self.finder.calculate_file_hash(
+                file_path, hash_algorithm=self.hash_algorithm, file_size=file_size)
+        offsets = stage_offsets(file_size, STAGE_COLUMNS.index(column) + 1)
+        if not offsets:
+            return None
+        return lambda file_path: sample_digest(file_path, offsets, self.hash_algorithm)
+
+    def _run_stage(self, groups, column):
+        """为候选组中缺少该阶段摘要的文件计算摘要，然后按摘要拆分文件组"""
+        tasks = {}
+        for group in groups:
+            for member in group:
+                stored = self._stored(member[column], column, member['file_size'])
+                func = self._digest_func(column, member['file_size'])
+                if stored:
+                    member['key'] = stored
+                elif func is None:
+                    # 文件太小，跳过该阶段（后续阶段的读取量与整个文件相当）
+                    member['key'] = ''
+                else:
+                    tasks[member['file_path']] = (member, func)
+        if tasks:
+            log_print(f"计算 {column}：{len(tasks)} 个文件", log_level=LOG_LEVEL_INFO)
+            results = self.finder.parallel_calc_files(
+                list(tasks), lambda file_path: tasks[file_path][1](file_path))
+            for file_path, digest in results:
+                member = tasks[file_path][0]
+                member[column] = digest
+                member['key'] = digest
+                member['dirty'] = True
+
+        new_groups = []
+        for group in groups:
+            sub_groups = {}
+            for member in group:
+                # 无法读取的文件（已删除或无权限）退出比较
+                if member['key'] is not None:
+                    sub_groups.setdefault(member['key'], []).append(member)
+            new_groups.extend(g for g in sub_groups.values() if len(g) > 1)
+        return new_groups
+
+    def confirm(self, rows):
+        """
+        对候选记录执行分阶段确认
+
+        参数:
+            rows: 记录字典列表，包含file_path、file_size以及各阶段摘要列
+        返回:
+            list: 摘要有变化、需要写回数据库的记录
+        """
+        groups = {}
+        for row in rows:
+            row['key'] = None
+            row['dirty'] = False
+            groups.setdefault(row['file_size'], []).append(row)
+        candidates = [g for g in groups.values() if len(g) > 1]
+        for column in self.stages:
+            if not candidates:
+                break
+            candidates = self._run_stage(candidates, column)
+        return [row for row in rows if row['dirty']]
@@ -0,0 +1,237 @@
+#扫描限速：令牌桶限制哈希读取的字节/秒和遍历的文件/秒，支持运行时通过控制文件或信号调整、按时间段切换限速
+import os
+import re
+import json
+import time
+import signal
+import datetime
+import threading
+from filedup.global_vars import log_print, LOG_LEVEL_INFO, LOG_LEVEL_WARN
+
+# 限速配置的重新检查间隔（秒）：控制文件是否修改、当前时间段是否切换
+CHECK_INTERVAL = 1.0
+# 单次等待的最长时间，使运行时放宽的限速能尽快生效
+MAX_SLEEP = 0.5
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """
+    解析速率，支持K/M/G后缀（如"50M"表示每秒50 MiB）
+
+    返回:
+        float: 每秒的数量；空值、0或负数返回None表示不限速
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text) if text > 0 else None
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMG]?)I?B?\s*', str(text).upper())
+    if not match:
+        raise ValueError(f"无效的速率: {text}")
+    rate = float(match.group(1)) * _SIZE_UNITS[match.group(2)]
+    return rate if rate > 0 else None
+
+
+def parse_profile(spec):
+    """
+    解析时间段限速，格式 "HH:MM-HH:MM=字节速率[/文件速率]"，如 "09:00-18:00=20M/100"；
+    结束时间早于开始时间表示跨越午夜
+
+    返回:
+        dict: start、end（datetime.time）、bytes_per_sec、files_per_sec
+    """
+    if isinstance(spec, dict):
+        profile = dict(spec)
+    else:
+        match = re.fullmatch(r'\s*(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*=\s*([^/]*)(?:/(.*))?', spec)
+        if not match:
+            raise ValueError(f"无效的时间段限速: {spec}（格式：HH:MM-HH:MM=字节速率[/文件速率]）")
+        profile = {'start': match.group(1), 'end': match.group(2),
+                   'bytes_per_sec': match.group(3) or None, 'files_per_sec': match.group(4)}
+    return {
+        'start': datetime.datetime.strptime(profile['start'], '%H:%M').time(),
+        'end': datetime.datetime.strptime(profile['end'], '%H:%M').time(),
+        'bytes_per_sec': parse_rate(profile.get('bytes_per_sec')),
+        'files_per_sec': parse_rate(profile.get('files_per_sec')),
+    }
+
+
+def _profile_active(profile, now):
+    start, end = profile['start'], profile['end']
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+class TokenBucket:
+    """令牌桶（线程安全）：令牌按rate每秒补充，最多积攒1秒的量
+
+    consume()先扣除令牌，不足时记为欠账并等待欠账还清；
+    多个线程共享同一个桶时，总速率不超过rate。
+    """
+    def __init__(self, rate=None):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = rate or 0
+        self.last = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def set_rate(self, rate):
+        """调整速率，None表示不限速"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if rate is None:
+                self.tokens = 0
+            else:
+                self.tokens = min(self.tokens, rate)
+
+    def consume(self, amount, should_stop=None):
+        """
+        消耗amount个令牌，不足时阻塞等待
+
+        参数:
+            amount: 令牌数（字节数或文件数）
+            should_stop: 无参数函数，等待期间返回True时立即停止等待（用于运行时调整限速）
+        返回:
+            float: 因限速等待的秒数
+        """
+        with self.lock:
+            if not self.rate or amount <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            self.tokens -= amount
+        waited = 0.0
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return waited
+                self._refill(time.monotonic())
+                deficit = -self.tokens
+                rate = self.rate
+            if deficit <= 0:
+                return waited
+            delay = min(deficit / rate, MAX_SLEEP)
+            time.sleep(delay)
+            waited += delay
+            if should_stop and should_stop():
+                return waited
+
+
+class ScanThrottle:
+    """扫描限速器：所有哈希工作线程共享字节桶，遍历线程使用文件桶
+
+    限速来源（优先级从高到低）：
+        1. 控制文件（JSON），修改后自动重新加载，或收到SIGHUP时立即重新加载：
+           {"bytes_per_sec": "50M", "files_per_sec": 200,
+            "profiles": [{"start": "09:00", "end": "18:00", "bytes_per_sec": "20M", "files_per_sec": 100}]}
+        2. 构造参数中的默认限速和时间段限速
+    当前时间落在某个时间段内时使用该时间段的限速，否则使用默认限速。
+    """
+    def __init__(self, bytes_per_sec=None, files_per_sec=None, profiles=None, control_file=None):
+        """
+        参数:
+            bytes_per_sec: 默认的每秒字节数上限，None表示不限速
+            files_per_sec: 默认的每秒文件数上限，None表示不限速
+            profiles: 时间段限速列表，元素为parse_profile的结果
+            control_file: 控制文件路径，可为None
+        """
+        self.default_limits = (bytes_per_sec, files_per_sec)
+        self.profiles = profiles or []
+        self.control_file = control_file
+        self.control_mtime = None
+        self.reload_requested = False
+        self.byte_bucket = TokenBucket()
+        self.file_bucket = TokenBucket()
+        self.lock = threading.Lock()
+        self.throttled_time = 0.0
+        self.limits = None
+        self.next_check = 0.0
+        self.refresh(force=True)
+
+    def _load_control_file(self):
+        """控制文件修改后重新加载，返回是否有变化"""
+        try:
+            mtime = os.stat(self.control_file).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.control_mtime and not self.reload_requested:
+            return False
+        self.control_mtime = mtime
+        try:
+            with open(self.control_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            self.default_limits = (parse_rate(config.get('bytes_per_sec')), parse_rate(config.get('files_per_sec')))
+            self.profiles = [parse_profile(p) for p in config.get('profiles', [])]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log_print(f"无法加载限速控制文件 {self.control_file}: {e}，继续使用当前限速", log_level=LOG_LEVEL_WARN)
+            return False
+        log_print(f"已重新加载限速控制文件 {self.control_file}", log_level=LOG_LEVEL_INFO)
+        return True
+
+    def current_limits(self):
+        """当前时间生效的(字节/秒, 文件/秒)"""
+        now = datetime.datetime.now().time()
+        for profile in self.profiles:
+            if _profile_active(profile, now):
+                return profile['bytes_per_sec'], profile['files_per_sec']
+        return self.default_limits
+
+    def refresh(self, force=False):
+        """检查控制文件和时间段（每CHECK_INTERVAL秒最多一次），限速有变化时更新令牌桶"""
+        now = time.monotonic()
+        if not force and now < self.next_check and not self.reload_requested:
+            return
+        with self.lock:
+            self.next_check = now + CHECK_INTERVAL
+            if self.control_file:
+                self._load_control_file()
+            self.reload_requested = False
+            limits = self.current_limits()
+            if limits != self.limits:
+                self.limits = limits
+                self.byte_bucket.set_rate(limits[0])
+                self.file_bucket.set_rate(limits[1])
+                log_print(f"扫描限速: {self.describe()}", log_level=LOG_LEVEL_INFO)
+
+    def describe(self):
+        bytes_per_sec, files_per_sec = self.limits
+        text_bytes = f"{bytes_per_sec / (1024 * 1024):.1f} MB/s" if bytes_per_sec else "不限"
+        text_files = f"{files_per_sec:.0f} 文件/s" if files_per_sec else "不限"
+        return f"读取 {text_bytes}，{text_files}"
+
+    def _limits_changed(self):
+        """等待期间检查限速是否被放宽"""
+        old = self.limits
+        self.refresh()
+        return self.limits != old
+
+    def _consume(self, bucket, amount):
+        self.refresh()
+        waited = bucket.consume(amount, self._limits_changed)
+        if waited:
+            with self.lock:
+                self.throttled_time += waited
+
+    def limit_bytes(self, amount):
+        """哈希读取每读入一块数据后调用"""
+        self._consume(self.byte_bucket, amount)
+
+    def limit_files(self, amount=1):
+        """遍历每产出一个文件时调用"""
+        self._consume(self.file_bucket, amount)
+
+    def request_reload(self, *args):
+        """立即重新加载控制文件（可作为信号处理函数）"""
+        self.reload_requested = True
+
+    def install_signal_handler(self):
+        """注册SIGHUP：收到信号时重新加载控制文件；只能在主线程调用，平台不支持时忽略"""
+        if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, self.request_reload)
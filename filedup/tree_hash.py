@@ -0,0 +1,155 @@
+#分段树哈希：把超大文件切分为固定大小的段，多个线程并行计算各段摘要，再合并为Merkle风格的根摘要；
+#追加写入的文件已有段清单时只重新读取原来的最后一段和新增的段
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from filedup.hash_io import hash_file_range
+from filedup.page_cache import resident_pages
+from filedup.hash_engines import new_hasher
+from filedup.staged_hash import sample_digest, SAMPLE_BLOCK_SIZE
+
+# 默认段大小
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def tree_tag(hash_algorithm, segment_size):
+    """树哈希的算法标签，如"md5-tree64m"；段大小不同的树哈希不能互相比较，所以段大小是标签的一部分"""
+    return f"{hash_algorithm}-tree{segment_size // (1024 * 1024)}m"
+
+
+def segment_ranges(file_size, segment_size):
+    """文件的分段列表 [(偏移量, 长度), ...]"""
+    return [(offset, min(segment_size, file_size - offset)) for offset in range(0, file_size, segment_size)]
+
+
+def segment_sample_offsets(offset, length):
+    """段内采样块的偏移量（段首、段中、段尾各一块）；段太小时返回空列表，表示不采样"""
+    if length <= 3 * SAMPLE_BLOCK_SIZE:
+        return []
+    return [offset, offset + (length - SAMPLE_BLOCK_SIZE) // 2, offset + length - SAMPLE_BLOCK_SIZE]
+
+
+def append_reusable(manifest, file_size):
+    """
+    段清单中可以不读取而复用的段：只有文件变大（追加写入）时，原来的最后一段之前的各段才可能不变；
+    大小不变或变小的文件视为原地修改，返回空字典，所有段重新读取
+
+    参数:
+        manifest: 上次计算的段清单 {偏移量: (长度, 完整摘要, 采样摘要)}
+        file_size: 当前文件大小
+    """
+    if not manifest:
+        return {}
+    old_size = max(offset + entry[0] for offset, entry in manifest.items())
+    if file_size <= old_size:
+        return {}
+    last = max(manifest)
+    return {offset: entry for offset, entry in manifest.items() if offset != last}
+
+
+def combine_segments(hash_algorithm, segment_digests):
+    """
+    由各段摘要计算根摘要：根 = H(段0摘要 || 段1摘要 || ...)，摘要按原始字节拼接
+
+    参数:
+        hash_algorithm: 哈希引擎名称
+        segment_digests: 各段摘要的十六进制字符串列表
+    返回:
+        str: 根摘要的十六进制字符串
+    """
+    hasher = new_hasher(hash_algorithm)
+    for digest in segment_digests:
+        hasher.update(bytes.fromhex(digest))
+    return hasher.hexdigest()
+
+
+class TreeHasher:
+    """分段哈希计算器：所有文件共享一个段线程池
+
+    扫描流水线的工作线程提交一个大文件的全部分段后等待结果，段线程池中的线程并行读取和计算；
+    扫描末尾只剩一个大文件时，其他线程也能分担它的计算。
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max(1, max_workers)
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _executor(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='segment_hash')
+            return self.pool
+
+    def hash_segment(self, file_path, hash_algorithm, offset, length, on_bytes=None, read_options=None, extra_hashers=()):
+        """计算一段数据的摘要（十六进制），读取不完整（文件被截断）时抛出OSError；read_options、extra_hashers见hash_file"""
+        hasher = new_hasher(hash_algorithm)
+        last = [0]
+
+        def progress(processed_size, total_size):
+            on_bytes(processed_size - last[0])
+            last[0] = processed_size
+
+        read_size = hash_file_range(file_path, [hasher, *extra_hashers], offset, length,
+                                    progress=progress if on_bytes else None, **(read_options or {}))
+        if read_size != length:
+            raise OSError(f"文件在计算分段哈希期间被修改: {file_path}")
+        return hasher.hexdigest()
+
+    def _segment_task(self, file_path, hash_algorithm, offset, length, on_bytes, previous, read_options, samples,
+                      extra_hashers=()):
+        """
+        计算一段的采样摘要和完整摘要；段清单中同一位置、同样长度的段采样摘要未变时直接复用其完整摘要
+
+        参数:
+            previous: 段清单中的(长度, 完整摘要, 采样摘要)，没有时为None
+            samples: 是否计算采样摘要（只有部分重算需要）
+        返回:
+            (str, str, bool): 完整摘要，采样摘要（段太小或不采样时为None），是否复用
+        """
+        offsets = segment_sample_offsets(offset, length) if samples else []
+        sample = sample_digest(file_path, offsets, hash_algorithm) if offsets else None
+        if previous and sample and previous[0] == length and previous[2] == sample:
+            return previous[1], sample, True
+        return (self.hash_segment(file_path, hash_algorithm, offset, length, on_bytes, read_options, extra_hashers),
+                sample, False)
+
+    def hash_file(self, file_path, hash_algorithm, file_size, segment_size=DEFAULT_SEGMENT_SIZE, on_bytes=None,
+                  manifest=None, read_options=None, samples=True, extra_hashers=None):
+        """
+        计算文件的树哈希
+
+        参数:
+            on_bytes: 每读入一块数据时以字节数调用，用于限速和统计，可为None
+            manifest: 上次计算的段清单 {偏移量: (长度, 完整摘要, 采样摘要)}，为None时读取所有段；
+                      只有文件变大时复用原来最后一段之前、采样摘要未变的段（见append_reusable）
+            read_options: 传给hash_file_range的读取方式（cache_polite、direct_io、stats），None表示普通读取
+            samples: 是否计算并返回各段的采样摘要；不使用部分重算时为False，每段少三次随机读取
+            extra_hashers: 整个文件的附加哈希对象（如sha256），与段摘要在同一次读取中更新；
+                           提供时各段按顺序依次读取（不并行），不复用段清单
+        返回:
+            (str, list, int): 根摘要的十六进制字符串，段列表[(偏移量, 长度, 完整摘要, 采样摘要), ...]，复用的段数
+        """
+        manifest = append_reusable(manifest, file_size)
+        ranges = segment_ranges(file_size, segment_size)
+        if read_options and read_options.get('cache_polite'):
+            # 在读取任何段之前检测一次整个文件的页缓存驻留情况，前一段的预读不会被当作热数据保留
+            with open(file_path, 'rb', buffering=0) as file:
+                read_options = dict(read_options, resident_before=resident_pages(file.fileno(), file_size))
+        if extra_hashers:
+            results = [self._segment_task(file_path, hash_algorithm, offset, length, on_bytes, None, read_options,
+                                          samples, extra_hashers)
+                       for offset, length in ranges]
+        else:
+            executor = self._executor()
+            futures = [executor.submit(self._segment_task, file_path, hash_algorithm, offset, length, on_bytes,
+                                       manifest.get(offset), read_options, samples)
+                       for offset, length in ranges]
+            results = [future.result() for future in futures]
+        segments = [(offset, length, digest, sample) for (offset, length), (digest, sample, _) in zip(ranges, results)]
+        reused = sum(1 for _, _, was_reused in results if was_reused)
+        return combine_segments(hash_algorithm, [digest for _, _, digest, _ in segments]), segments, reused
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+                self.pool = None
@@ -0,0 +1,154 @@
+#重复文件逐字节校验：同时打开组内所有文件，按块同步比较，内容一旦不同立即拆分文件组
+import queue
+import hashlib
+import threading
+from filedup.global_vars import log_print, LOG_LEVEL_ERROR, LOG_LEVEL_WARN
+
+# 默认的校验内存预算（所有校验线程合计）
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+# 单个校验线程同时打开的最大文件数
+MAX_OPEN_FILES = 128
+
+
+def members_digest(members):
+    """
+    计算文件组成员的摘要，用于判断校验结果是否仍对应当前的文件组
+
+    参数:
+        members: (文件路径, 修改时间纳秒数)列表；成员的内容被修改后重新扫描，即使哈希值和路径不变，摘要也随修改时间变化
+    """
+    return hashlib.sha1('\n'.join(f"{path}\t{mtime_ns}" for path, mtime_ns in sorted(members)).encode('utf-8')).hexdigest()
+
+
+def _split_by_block(blocks):
+    """按读到的数据块拆分文件，返回内容相同的子组列表"""
+    ref = blocks[0][1]
+    same = [member for member, block in blocks if block == ref]
+    if len(same) == len(blocks):
+        return [same]
+    rest = {}
+    for member, block in blocks:
+        if block != ref:
+            rest.setdefault(block, []).append(member)
+    return [same] + list(rest.values())
+
+
+def compare_files_lockstep(file_paths, block_size):
+    """
+    同步逐块比较一组文件
+
+    参数:
+        file_paths: 文件路径列表，需要同时打开（调用方保证数量不超过打开文件数限制）
+        block_size: 每次读取的块大小
+    返回:
+        list: 内容完全相同的文件路径子组列表（包括只有一个文件的子组）；无法读取的文件单独成组
+    """
+    handles = {}
+    unreadable = []
+    try:
+        for file_path in file_paths:
+            try:
+                handles[file_path] = open(file_path, 'rb')
+            except OSError as e:
+                log_print(f"校验时无法打开文件 {file_path}: {e}", log_level=LOG_LEVEL_ERROR)
+                unreadable.append([file_path])
+
+        pending = [list(handles)] if handles else []
+        finished = []
+        while pending:
+            group = pending.pop()
+            if len(group) == 1:
+                finished.append(group)
+                continue
+            blocks = [(file_path, handles[file_path].read(block_size)) for file_path in group]
+            block_of = dict(blocks)
+            for sub_group in _split_by_block(blocks):
+                # 子组成员同时读到文件末尾，内容完全相同
+                if not block_of[sub_group[0]]:
+                    finished.append(sub_group)
+                else:
+                    pending.append(sub_group)
+        return finished + unreadable
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+
+def verify_group(file_paths, block_size, max_open_files=MAX_OPEN_FILES):
+    """
+    校验一个重复文件组
+
+    成员数超过打开文件数限制时，以第一个文件为参照分批比较。
+    返回:
+        (bool, list): 组内所有文件是否逐字节相同，以及内容相同的子组列表
+    """
+    if len(file_paths) <= max_open_files:
+        sub_groups = compare_files_lockstep(file_paths, block_size)
+        return len(sub_groups) == 1, sub_groups
+
+    reference = file_paths[0]
+    same_as_reference = [reference]
+    sub_groups = []
+    for i in range(1, len(file_paths), max_open_files - 1):
+        chunk = [reference] + file_paths[i:i + max_open_files - 1]
+        for sub_group in compare_files_lockstep(chunk, block_size):
+            if reference in sub_group:
+                same_as_reference.extend(p for p in sub_group if p != reference)
+            else:
+                sub_groups.append(sub_group)
+    sub_groups.insert(0, same_as_reference)
+    return len(sub_groups) == 1, sub_groups
+
+
+class DuplicateVerifier:
+    """多线程校验重复文件组，所有线程的读缓冲合计不超过内存预算"""
+    def __init__(self, max_threads=4, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.max_threads = max(1, max_threads)
+        self.memory_budget = memory_budget
+
+    def block_size_for(self, member_count):
+        """根据每线程的内存预算和组成员数确定块大小"""
+        per_thread = self.memory_budget // self.max_threads
+        open_count = min(member_count, MAX_OPEN_FILES)
+        block_size = per_thread // max(open_count, 1)
+        return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+
+    def verify(self, groups):
+        """
+        并行校验多个重复文件组
+
+        参数:
+            groups: (哈希值, 文件路径列表) 的列表
+        返回:
+            dict: 哈希值 -> (是否逐字节相同, 内容相同的子组列表)
+        """
+        task_queue = queue.Queue()
+        for group in groups:
+            task_queue.put(group)
+        results = {}
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    file_hash, file_paths = task_queue.get(block=False)
+                except queue.Empty:
+                    break
+                try:
+                    verified, sub_groups = verify_group(file_paths, self.block_size_for(len(file_paths)))
+                    if not verified:
+                        log_print(f"哈希值 {file_hash} 的文件内容不完全相同，拆分为 {len(sub_groups)} 组: {sub_groups}",
+                                  log_level=LOG_LEVEL_WARN)
+                    with lock:
+                        results[file_hash] = (verified, sub_groups)
+                except Exception as e:
+                    log_print(f"校验重复文件组时出错 {file_hash}: {e}", log_level=LOG_LEVEL_ERROR)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.max_threads, len(groups)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
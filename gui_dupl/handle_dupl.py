@@ -28,13 +28,17 @@ except ImportError:
     HAS_WINSHELL = False
     log_print("警告: 未安装winshell库，回收站功能可能不可用",LOG_LEVEL_WARN)
 
+# 从数据库加载时每页的重复文件组数
+DB_PAGE_GROUPS = 500
+
 class DuplicateFileHandler(QMainWindow):
     def __init__(self):
         super().__init__()
         # 存储当前显示的图片，用于窗口大小变化时重新缩放
         self.current_pixmap = None
         self.init_ui()
-        self.duplicate_groups = []
+        # 从数据库分页加载时已加载的组数
+        self.db_group_offset = 0
         self.selected_files = set()  # 存储选中的文件路径
         self.rw_reg_handlers:RWRegHandlers = get_RWRegHandlers() # 注册文件处理器
         self.dest_dir = None
@@ -204,6 +208,13 @@ class DuplicateFileHandler(QMainWindow):
         open_action = file_menu.addAction('打开')
         open_action.triggered.connect(self.load_duplicate_file)
         
+        # 从数据库加载动作：按可释放空间从大到小分页加载重复文件组
+        load_db_action = file_menu.addAction('从数据库加载')
+        load_db_action.triggered.connect(self.load_from_database)
+        
+        load_more_action = file_menu.addAction('加载更多')
+        load_more_action.triggered.connect(self.load_more_groups)
+        
         # 创建退出动作
         exit_action = file_menu.addAction('退出')
         exit_action.triggered.connect(self.close_window)
@@ -235,26 +246,71 @@ class DuplicateFileHandler(QMainWindow):
                 
                 with open(json_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.duplicate_groups = data.get('duplicate_groups', [])
-                    self.populate_file_tree()
-                    self.statusBar().showMessage(f'已加载 {len(self.duplicate_groups)} 组重复文件')
+                    group_count = self.populate_file_tree(data.get('duplicate_groups', []))
+                    self.statusBar().showMessage(f'已加载 {group_count} 组重复文件')
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"加载文件失败: {str(e)}")
     
-    def populate_file_tree(self):
-        """填充文件树"""
+    def load_from_database(self):
+        """通过菜单选择数据库所在目录，直接从数据库加载第一页重复文件组"""
+        dest_dir = QFileDialog.getExistingDirectory(self, "选择数据库所在目录", self.dest_dir or "")
+        if not dest_dir:
+            return
+        try:
+            self.set_dest_dir(dest_dir)
+            self.populate_file_tree([])
+            self.db_group_offset = 0
+            self.load_more_groups()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"从数据库加载失败: {str(e)}")
+    
+    def load_more_groups(self):
+        """从数据库加载下一页重复文件组，追加到文件树末尾"""
+        if not self.file_finder:
+            QMessageBox.information(self, "提示", "请先从数据库加载")
+            return
+        groups = self.file_finder.iter_duplicate_groups(limit=DB_PAGE_GROUPS, offset=self.db_group_offset)
+        group_count = self.add_groups_to_tree(groups, self.db_group_offset)
+        self.db_group_offset += group_count
+        if group_count < DB_PAGE_GROUPS:
+            self.statusBar().showMessage(f'已加载全部 {self.db_group_offset} 组重复文件')
+        else:
+            self.statusBar().showMessage(f'已加载 {self.db_group_offset} 组重复文件，可通过“文件-加载更多”继续加载')
+    
+    def populate_file_tree(self, groups):
+        """填充文件树，返回加载的组数"""
         self.file_tree.clear()
         self.selected_files.clear()
+        return self.add_groups_to_tree(groups)
+    
+    def add_groups_to_tree(self, groups, start_index=0):
+        """
+        把重复文件组逐个追加到文件树，不保存组列表
         
-        for group_idx, group in enumerate(self.duplicate_groups):
+        参数:
+            groups: 重复文件组的可迭代对象，如iter_duplicate_groups的结果
+            start_index: 第一组的序号（从0开始），用于分页加载时的组编号
+        返回:
+            int: 追加的组数
+        """
+        group_count = 0
+        for group_idx, group in enumerate(groups, start_index):
+            group_count += 1
             hash_value = group.get('hash', 'Unknown')
-            group_item = QTreeWidgetItem([f"组 {group_idx+1}: {hash_value}", "", "", "", ""])
+            files = group.get('files', [])
+            group_title = f"组 {group_idx+1}: {hash_value}"
+            # 硬链接不占用额外空间，标出真正的副本数
+            copies = group.get('copies', len(files))
+            if copies < len(files):
+                group_title += f"（{copies} 个副本，{len(files) - copies} 个硬链接）"
+            if group.get('wasted_bytes'):
+                group_title += f"（可释放 {self.format_size(group['wasted_bytes'])}）"
+            group_item = QTreeWidgetItem([group_title, "", "", "", ""])
             group_item.setFlags(group_item.flags() & ~Qt.ItemIsSelectable)
             
             # 设置组项目的背景色
             group_item.setBackground(0, QColor(240, 240, 240))
             
-            files = group.get('files', [])
             for file_info in files:
                 file_path = file_info.get('path', '')
                 file_name = os.path.basename(file_path)
@@ -267,12 +323,16 @@ class DuplicateFileHandler(QMainWindow):
                 
                 file_item = QTreeWidgetItem([file_name, file_size, modified_time, created_time, owner, file_path])
                 file_item.setData(0, Qt.UserRole, file_path)  # 存储完整路径
+                if file_info.get('hardlink_of'):
+                    file_item.setText(0, f"{file_name} [硬链接]")
+                    file_item.setToolTip(0, f"与 {file_info['hardlink_of']} 为同一文件，删除不会释放磁盘空间")
                 file_item.setCheckState(0, Qt.Unchecked)  # 添加复选框
                 
                 group_item.addChild(file_item)
             
             self.file_tree.addTopLevelItem(group_item)
             group_item.setExpanded(True)
+        return group_count
     
     def format_size(self, size_bytes):
         """格式化文件大小"""
@@ -0,0 +1,94 @@
+import random
+import sqlite3
+
+"""
+测试重复文件组汇总表的脚本
+该脚本对file_features执行随机的插入、UPSERT、删除、改名和更新哈希值，
+每一步都验证触发器维护的dup_groups与由REBUILD_SQL重新计算的结果一致；
+并验证inode为0（Windows上没有inode信息）的记录按路径各计一个副本
+"""
+
+import os
+from filedup.db_schema import OWNERS_TABLE, HASH_ALGORITHMS_TABLE, file_features_table
+from filedup.dup_groups import ensure_dup_groups, REBUILD_SQL
+from filedup.file_meta import meta_from_stat
+
+conn = sqlite3.connect(":memory:")
+cursor = conn.cursor()
+cursor.execute(OWNERS_TABLE)
+cursor.execute(HASH_ALGORITHMS_TABLE)
+cursor.execute(file_features_table())
+cursor.execute("CREATE INDEX idx_file_features_inode ON file_features (device, inode)")
+cursor.execute("CREATE INDEX idx_file_features_hash ON file_features (file_hash)")
+
+# 汇总表创建前已有的记录由ensure_dup_groups计算初始内容
+cursor.execute("INSERT INTO file_features (file_path, file_size, alg_id, file_hash, device, inode) "
+               "VALUES ('pre1', 5, 1, x'01', 1, 1), ('pre2', 5, 1, x'01', 1, 2)")
+assert ensure_dup_groups(cursor) is True, "第一次调用应创建汇总表"
+assert ensure_dup_groups(cursor) is False, "汇总表已存在时不应重新创建"
+
+UPSERT = '''
+    INSERT INTO file_features (file_path, file_size, alg_id, file_hash, device, inode) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET file_size = excluded.file_size, alg_id = excluded.alg_id,
+        file_hash = excluded.file_hash, device = excluded.device, inode = excluded.inode
+'''
+# 同一摘要的文件大小相同
+SIZES = {b'h1': 5, b'h2': 7, b'h3': 9}
+
+
+def check():
+    """比较触发器维护的汇总表与重新计算的结果"""
+    got = sorted(cursor.execute("SELECT * FROM dup_groups").fetchall())
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS expected AS SELECT * FROM dup_groups WHERE 0")
+    cursor.execute("DELETE FROM expected")
+    cursor.execute(REBUILD_SQL.replace("INTO dup_groups", "INTO expected"))
+    expected = sorted(cursor.execute("SELECT * FROM expected").fetchall())
+    assert got == expected, f"汇总表与重新计算的结果不一致:\n{got}\n{expected}"
+
+
+check()
+random.seed(1)
+for step in range(4000):
+    path = f"p{random.randint(0, 60)}"
+    digest = random.choice([b'h1', b'h2', b'h3', None])
+    alg_id = random.choice([1, 2]) if digest else None
+    # 同一inode的多个路径是硬链接，None为没有inode信息的记录，0为旧版本在Windows上写入的无效inode
+    inode = random.choice([1, 2, 3, 0, None])
+    size = SIZES.get(digest, 3)
+    op = random.random()
+    if op < 0.5:
+        cursor.execute(UPSERT, (path, size, alg_id, digest, None if inode is None else int(inode > 0), inode))
+    elif op < 0.7:
+        cursor.execute("DELETE FROM file_features WHERE file_path = ?", (path,))
+    elif op < 0.8:
+        cursor.execute("UPDATE OR IGNORE file_features SET file_path = ? WHERE file_path = ?", (path + "m", path))
+    elif op < 0.9:
+        cursor.execute("UPDATE file_features SET alg_id = ?, file_hash = ?, file_size = ? WHERE file_path = ?",
+                       (alg_id, digest, size, path))
+    else:
+        cursor.execute("UPDATE file_features SET last_checked = ? WHERE file_path = ?", (step, path))
+    check()
+print(f"✓ 4000次随机写入后汇总表与重新计算的结果一致（{len(cursor.execute('SELECT * FROM dup_groups').fetchall())} 个哈希值）。")
+
+# 没有inode信息的文件不是硬链接：两个设备号和inode都为0的同内容文件是两个副本
+cursor.execute("DELETE FROM file_features")
+cursor.executemany(UPSERT, [("w1", 5, 1, b'hw', 0, 0), ("w2", 5, 1, b'hw', 0, 0), ("w3", 5, 1, b'hw', None, None)])
+assert cursor.execute("SELECT member_count, copies FROM dup_groups WHERE file_hash = x'6877'").fetchone() == (3, 3), \
+    "inode为0的记录不应被当作同一inode的硬链接"
+check()
+st = os.stat_result((0o100644, 0, 0, 0, 0, 0, 5, 0, 0, 0))
+meta = meta_from_stat(st)
+assert (meta['device'], meta['inode'], meta['nlink']) == (None, None, None), f"st_ino为0时不应保存设备号、inode和链接数: {meta}"
+print("✓ inode为0的文件按路径各计一个副本，保存为NULL。")
+
+# 旧版本数据库中定义不同的触发器被替换，汇总表重新计算
+cursor.execute("DROP TRIGGER trg_dup_groups_insert")
+cursor.execute("CREATE TRIGGER trg_dup_groups_insert AFTER INSERT ON file_features BEGIN SELECT 1; END")
+cursor.execute("INSERT INTO file_features (file_path, file_size, alg_id, file_hash) VALUES ('w4', 5, 1, x'6877')")
+assert ensure_dup_groups(cursor) is False
+cursor.execute("INSERT INTO file_features (file_path, file_size, alg_id, file_hash) VALUES ('w5', 5, 1, x'6877')")
+check()
+print("✓ 定义已变化的触发器被替换，汇总表重新计算。")
+
+print("\n所有重复文件组汇总表测试通过！")
+conn.close()
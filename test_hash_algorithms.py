@@ -1,5 +1,4 @@
 import os
-import hashlib
 import shutil
 
 """
@@ -37,16 +36,14 @@ try:
     print("\n测试file_duplicate_finder.py中的哈希计算:")
     
     # 导入FileDuplicateFinder类
-    import importlib.util
-    spec = importlib.util.spec_from_file_location("file_duplicate_finder", "file_duplicate_finder.py")
-    file_duplicate_finder = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(file_duplicate_finder)
+    from filedup.file_duplicate_finder import FileDuplicateFinder
+    from filedup.hash_engines import available_engine_names, new_hasher
     
     # 创建一个临时的FileDuplicateFinder实例
-    finder = file_duplicate_finder.FileDuplicateFinder(db_path=":memory:")
+    finder = FileDuplicateFinder(db_path=":memory:")
     
-    # 测试不同算法
-    for algorithm in ['md5', 'sha1', 'sha256']:
+    # 测试所有可用的哈希引擎
+    for algorithm in available_engine_names():
         print(f"\n使用{algorithm}算法:")
         
         # 计算文件哈希
@@ -58,7 +55,7 @@ try:
         
         # 验证使用标准库直接计算的结果是否一致
         def verify_hash(file_path, algo):
-            hasher = hashlib.new(algo)
+            hasher = new_hasher(algo)
             with open(file_path, 'rb') as f:
                 buf = f.read(65536)
                 while buf:
@@ -0,0 +1,130 @@
+import datetime
+import os
+import shutil
+import sqlite3
+
+"""
+测试数据库结构迁移的脚本
+该脚本创建第1版结构的数据库（ISO时间字符串、"算法:十六进制"文本哈希、所有者字符串），
+打开后验证记录被原地迁移为第2版结构，重复文件组和附加哈希列保持不变，
+迁移后的首次扫描不因修改时间只有微秒精度而重新读取文件
+"""
+
+from filedup.db_schema import SCHEMA_VERSION, iso_to_ns
+from filedup.file_duplicate_finder import FileDuplicateFinder
+
+db_file = os.path.abspath("test_migrate.db")
+test_dir = os.path.abspath("test_migrate_dir")
+if os.path.exists(db_file):
+    os.remove(db_file)
+if os.path.exists(test_dir):
+    shutil.rmtree(test_dir)
+
+MD5_A = "md5:" + "0123456789abcdef" * 2
+SHA1_B = "sha1:" + "89abcdef" * 5
+modified = datetime.datetime(2024, 1, 2, 3, 4, 5, 678901).isoformat()
+
+try:
+    # 第1版结构：user_version为0，没有owners和hash_algorithms表
+    # 第1版扫描过的真实文件：修改时间由浮点秒数格式化为ISO字符串，没有mtime_ns
+    os.makedirs(test_dir)
+    scanned = os.path.join(test_dir, "scanned.bin")
+    with open(scanned, "wb") as f:
+        f.write(os.urandom(100000))
+    scanned_st = os.stat(scanned)
+    scanned_iso = datetime.datetime.fromtimestamp(scanned_st.st_mtime).isoformat()
+
+    conn = sqlite3.connect(db_file)
+    conn.execute('''
+        CREATE TABLE file_features (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT UNIQUE NOT NULL,
+            file_size INTEGER,
+            created_time TEXT,
+            modified_time TEXT,
+            accessed_time TEXT,
+            owner TEXT,
+            file_hash TEXT,
+            last_checked TEXT,
+            stage1_hash TEXT,
+            stage2_hash TEXT,
+            device INTEGER,
+            inode INTEGER,
+            nlink INTEGER,
+            mtime_ns INTEGER,
+            hash_sha256 TEXT
+        )
+    ''')
+    rows = [
+        # (路径, 大小, 修改时间, 所有者, 哈希值, mtime_ns, 附加哈希)
+        ("/data/a1", 10, modified, "alice", MD5_A, 1704164645678901234, "sha256:aa"),
+        ("/data/a2", 10, modified, "alice", MD5_A, None, None),
+        ("/data/b1", 20, modified, "bob", SHA1_B, 1704164645000000000, None),
+        ("/data/b2", 20, modified, "bob", SHA1_B, 1704164645000000000, None),
+        ("/data/old", 30, modified, "bob", "0123abcd", None, None),  # 没有算法标签的旧哈希值
+        ("/data/unhashed", 40, None, None, None, None, None),
+        (scanned, scanned_st.st_size, scanned_iso, "bob", "md5:" + "00" * 16, None, None),
+    ]
+    conn.executemany(
+        "INSERT INTO file_features (file_path, file_size, created_time, modified_time, accessed_time, owner, file_hash, "
+        "last_checked, device, inode, nlink, mtime_ns, hash_sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?, 1, ?, ?)",
+        [(path, size, mtime, mtime, mtime, owner, file_hash, mtime, index + 1, mtime_ns, extra)
+         for index, (path, size, mtime, owner, file_hash, mtime_ns, extra) in enumerate(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+    # 打开时自动迁移
+    finder = FileDuplicateFinder(db_path=db_file)
+    cursor = finder.cursor
+    assert cursor.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION, "迁移后应设置结构版本"
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(file_features)")]
+    for removed in ("created_time", "modified_time", "accessed_time", "owner"):
+        assert removed not in columns, f"旧列 {removed} 应已删除"
+    assert "hash_sha256" in columns, "附加哈希列应保留"
+    assert cursor.execute("SELECT COUNT(*) FROM file_features").fetchone()[0] == len(rows), "记录数应不变"
+    print("✓ 第1版数据库已原地迁移为第2版结构。")
+
+    existing = finder.get_existing_file_info()
+    assert existing["/data/a1"]["hash"] == MD5_A and existing["/data/b1"]["hash"] == SHA1_B, "哈希值应能还原"
+    assert existing["/data/old"]["hash"] is None, "没有算法标签的旧哈希值应视为未计算"
+    assert existing["/data/a1"]["owner"] == "alice", "所有者应能还原"
+    assert existing["/data/a1"]["mtime_ns"] == 1704164645678901234, "已有的纳秒修改时间应优先保留"
+    assert existing["/data/a2"]["mtime_ns"] == iso_to_ns(modified), "缺少纳秒修改时间的记录应由ISO时间转换"
+    assert existing["/data/a2"]["mtime_coarse"] and not existing["/data/a1"]["mtime_coarse"], \
+        "只有由ISO时间转换的修改时间应标记为微秒精度"
+    assert existing["/data/a1"]["extra_hashes"] == {}, "未启用的附加哈希不应加载"
+    assert cursor.execute("SELECT hash_sha256 FROM file_features WHERE file_path = '/data/a1'").fetchone()[0] == "sha256:aa"
+    assert cursor.execute("SELECT COUNT(*) FROM owners").fetchone()[0] == 2, "重复的所有者名称应只保存一次"
+    print("✓ 时间、哈希值、所有者和附加哈希迁移正确。")
+
+    groups = finder.find_duplicate_files()
+    assert sorted((group['hash'], len(group['files'])) for group in groups) == [(MD5_A, 2), (SHA1_B, 2)], \
+        f"重复文件组不正确: {groups}"
+    assert groups[0]['files'][0]['modified'] is not None and groups[0]['files'][0]['owner'] in ("alice", "bob")
+    finder.close()
+    print("✓ 迁移后的重复文件组正确。")
+
+    # 迁移后的首次扫描：修改时间在微秒精度内一致，不重新读取文件，写入精确的纳秒修改时间
+    finder = FileDuplicateFinder(db_path=db_file)
+    finder.scan_directory(test_dir)
+    assert finder.io_stats.bytes_read == 0, f"迁移后的首次扫描不应重新读取未变化的文件: {finder.io_stats.bytes_read}"
+    row = finder.cursor.execute("SELECT mtime_ns, mtime_coarse FROM file_features WHERE file_path = ?", (scanned,)).fetchone()
+    assert row == (scanned_st.st_mtime_ns, None), f"应写入精确的纳秒修改时间并清除微秒精度标记: {row}"
+    assert finder.get_existing_file_info()[scanned]["hash"] == "md5:" + "00" * 16, "哈希值应复用"
+    finder.close()
+    print("✓ 迁移后的首次扫描没有重新读取文件，写入了纳秒修改时间。")
+
+    # 再次打开不应重复迁移
+    finder = FileDuplicateFinder(db_path=db_file)
+    assert len(finder.get_existing_file_info()) == len(rows)
+    finder.close()
+
+    print("\n所有数据库迁移测试通过！")
+
+finally:
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    print("\n已清理测试数据库。")
@@ -0,0 +1,132 @@
+import os
+import shutil
+
+"""
+测试移动文件检测和数据库更新的脚本
+该脚本扫描测试目录后重命名、删除文件，验证数据库只改写路径、不重新计算哈希值；
+并模拟Windows上DirEntry.stat()没有inode信息的情况，以及多进程执行器中由工作进程查找移动前的记录
+"""
+
+import filedup.file_duplicate_finder as finder_module
+from filedup.file_duplicate_finder import FileDuplicateFinder
+
+# 创建临时测试目录
+test_dir = os.path.abspath("test_move_dir")
+db_file = os.path.abspath("test_move.db")
+if os.path.exists(test_dir):
+    shutil.rmtree(test_dir)
+if os.path.exists(db_file):
+    os.remove(db_file)
+os.makedirs(test_dir)
+
+
+def stored_rows(finder):
+    """数据库中的路径 -> 哈希值"""
+    finder.cursor.execute("SELECT file_path, alg_id, file_hash FROM file_features")
+    return {row[0]: finder.codec.decode_hash(row[1], row[2]) for row in finder.cursor.fetchall()}
+
+
+try:
+    for name, content in (("a.txt", "移动测试文件A\n"), ("b.txt", "移动测试文件B\n"), ("c.txt", "将被删除的文件\n")):
+        with open(os.path.join(test_dir, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    finder = FileDuplicateFinder(db_path=db_file)
+    finder.scan_directory(test_dir)
+    before = stored_rows(finder)
+    finder.close()
+    print(f"扫描后的记录: {len(before)} 个")
+
+    # 测试1: 重命名和删除后使用update_database（--compare后确认更新）
+    old_path = os.path.join(test_dir, "a.txt")
+    new_path = os.path.join(test_dir, "a_moved.txt")
+    os.rename(old_path, new_path)
+    os.remove(os.path.join(test_dir, "c.txt"))
+
+    finder = FileDuplicateFinder(db_path=db_file)
+    comparison = finder.compare_with_database(test_dir, recalculate_hash=False)
+    assert comparison['moved'] == [(old_path, new_path)], f"未识别出移动的文件: {comparison}"
+    finder.update_database(test_dir)
+    finder.close()
+
+    finder = FileDuplicateFinder(db_path=db_file)
+    after = stored_rows(finder)
+    finder.close()
+    assert old_path not in after, "旧路径的记录没有被改写"
+    assert os.path.join(test_dir, "c.txt") not in after, "已删除文件的记录没有被删除"
+    assert after.get(new_path) == before[old_path], "移动后的记录哈希值不一致"
+    print("✓ update_database改写了移动文件的路径并删除了已不存在的记录。")
+
+    # 测试2: 扫描时识别移动的文件，保留附加哈希
+    finder = FileDuplicateFinder(db_path=db_file, extra_hash_algorithms=["sha256"])
+    finder.scan_directory(test_dir)
+    finder.close()
+    moved_again = os.path.join(test_dir, "a_moved_again.txt")
+    os.rename(new_path, moved_again)
+
+    finder = FileDuplicateFinder(db_path=db_file)
+    finder.scan_directory(test_dir)
+    finder.cursor.execute("SELECT file_path, hash_sha256 FROM file_features")
+    extra = dict(finder.cursor.fetchall())
+    finder.close()
+    assert new_path not in extra, "扫描时没有改写移动文件的路径"
+    assert extra.get(moved_again), "移动文件的附加哈希被清除"
+    assert extra.get(os.path.join(test_dir, "b.txt")), "未移动文件的附加哈希被清除"
+    print("✓ 扫描时移动的文件只改写路径，保留了附加哈希。")
+
+    # 测试3: DirEntry.stat()的st_ino、st_dev、st_nlink都为0（Windows）时，移动和硬链接仍能识别
+    original_stat_file = finder_module.stat_file
+
+    def windows_stat_file(file_path, entry=None):
+        st = original_stat_file(file_path, entry)
+        if entry is None:
+            return st
+        fields = list(st)
+        fields[1:4] = [0, 0, 0]  # st_ino, st_dev, st_nlink
+        return os.stat_result(fields, {name: getattr(st, name) for name in ('st_atime_ns', 'st_mtime_ns', 'st_ctime_ns')})
+
+    finder_module.stat_file = windows_stat_file
+    try:
+        with open(os.path.join(test_dir, "d.txt"), "w", encoding="utf-8") as f:
+            f.write("有硬链接的文件\n")
+        os.link(os.path.join(test_dir, "d.txt"), os.path.join(test_dir, "d_link.txt"))
+        finder = FileDuplicateFinder(db_path=db_file)
+        finder.scan_directory(test_dir)
+        finder.close()
+        windows_moved = os.path.join(test_dir, "b_moved.txt")
+        os.rename(os.path.join(test_dir, "b.txt"), windows_moved)
+        finder = FileDuplicateFinder(db_path=db_file, extra_hash_algorithms=[])
+        finder.scan_directory(test_dir)
+        finder.cursor.execute("SELECT file_path, inode, nlink, hash_sha256 FROM file_features")
+        rows = {row[0]: row[1:] for row in finder.cursor.fetchall()}
+        groups = finder.find_duplicate_files()
+        finder.close()
+    finally:
+        finder_module.stat_file = original_stat_file
+    assert rows[windows_moved][2], "没有inode信息时移动的文件被重新写入，附加哈希被清除"
+    assert all(inode for inode, _, _ in rows.values()), f"应由os.stat补齐inode: {rows}"
+    assert rows[os.path.join(test_dir, "d_link.txt")][1] == 2, "硬链接的链接数应由os.stat补齐"
+    assert [group['copies'] for group in groups] == [1], f"硬链接应只计一个副本: {groups}"
+    print("✓ DirEntry没有inode信息时由os.stat补齐，仍能识别移动的文件和硬链接。")
+
+    # 测试4: 多进程执行器，工作进程按inode在数据库中查找移动前的记录
+    process_moved = os.path.join(test_dir, "b_process.txt")
+    os.rename(windows_moved, process_moved)
+    finder = FileDuplicateFinder(db_path=db_file, executor="process", max_threads=2)
+    finder.scan_directory(test_dir)
+    finder.cursor.execute("SELECT file_path, hash_sha256 FROM file_features")
+    extra = dict(finder.cursor.fetchall())
+    finder.close()
+    assert windows_moved not in extra, "多进程执行器没有改写移动文件的路径"
+    assert extra.get(process_moved), "多进程执行器中移动文件的附加哈希被清除"
+    print("✓ 多进程执行器中移动的文件只改写路径。")
+
+    print("\n所有移动文件测试通过！")
+
+finally:
+    # 清理测试文件和数据库
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    print("\n已清理测试文件和数据库。")
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import shutil
+import time
+
+"""
+测试树哈希部分重算的脚本
+该脚本验证追加写入的大文件只重新读取原来的最后一段和新增的段，
+大小不变的原地修改（即使没有落在采样块上）重新读取所有段，哈希值与完整计算一致；
+同时计算附加哈希时主哈希仍为树哈希，之后不带附加哈希扫描不重新读取文件；
+不带附加哈希重新计算时，内容不变则保留已有的附加哈希，内容变化则清除
+"""
+
+from filedup.file_duplicate_finder import FileDuplicateFinder
+from filedup.staged_hash import SAMPLE_BLOCK_SIZE
+
+MB = 1024 * 1024
+
+# 创建临时测试目录
+test_dir = os.path.abspath("test_partial_dir")
+db_file = os.path.abspath("test_partial.db")
+if os.path.exists(test_dir):
+    shutil.rmtree(test_dir)
+if os.path.exists(db_file):
+    os.remove(db_file)
+os.makedirs(test_dir)
+file_path = os.path.join(test_dir, "growing.log")
+
+
+def tree_root(data):
+    """1MB段的md5树哈希"""
+    digests = b''.join(hashlib.md5(data[offset:offset + MB]).digest() for offset in range(0, len(data), MB))
+    return "md5-tree1m:" + hashlib.md5(digests).hexdigest()
+
+
+def scan(extra_hash_algorithms=None):
+    """扫描测试目录，返回(数据库中的哈希值, 读取的字节数)"""
+    finder = FileDuplicateFinder(db_path=db_file, tree_hash_threshold=2 * MB, segment_size=MB, partial_rehash=True,
+                                 extra_hash_algorithms=extra_hash_algorithms)
+    finder.scan_directory(test_dir)
+    stored = finder.get_existing_file_info()[file_path]['hash']
+    bytes_read = finder.io_stats.bytes_read
+    finder.close()
+    return stored, bytes_read
+
+
+try:
+    data = bytearray(os.urandom(8 * MB + 500))
+    with open(file_path, "wb") as f:
+        f.write(data)
+    stored, _ = scan()
+    assert stored == tree_root(data), "首次扫描的树哈希不正确"
+
+    # 测试1: 追加写入只读取原来的最后一段（500字节）和新增的段
+    time.sleep(0.01)
+    appended = os.urandom(3 * MB)
+    data += appended
+    with open(file_path, "ab") as f:
+        f.write(appended)
+    stored, bytes_read = scan()
+    assert stored == tree_root(data), "追加写入后的树哈希不正确"
+    assert bytes_read <= 3 * MB + MB, f"追加写入后不应重新读取未变化的段: {bytes_read}"
+    print(f"✓ 追加写入后只读取了 {bytes_read / MB:.2f} MB。")
+
+    # 测试2: 大小不变的原地修改，修改位置不在任何采样块上
+    time.sleep(0.01)
+    position = 4 * MB + SAMPLE_BLOCK_SIZE + 7
+    data[position] ^= 0xFF
+    with open(file_path, "r+b") as f:
+        f.seek(position)
+        f.write(data[position:position + 1])
+    stored, bytes_read = scan()
+    assert stored == tree_root(data), "原地修改后复用了过期的段摘要"
+    assert bytes_read >= len(data), f"原地修改后应重新读取所有段: {bytes_read}"
+    print("✓ 大小不变的原地修改重新读取了所有段，哈希值正确。")
+
+    # 测试3: 新数据库中同时计算附加哈希，主哈希仍使用树哈希标签，附加哈希在同一次读取中计算
+    os.remove(db_file)
+    stored, bytes_read = scan(["sha256"])
+    assert stored == tree_root(data), f"同时计算附加哈希时主哈希应为树哈希: {stored}"
+    assert bytes_read == len(data), f"附加哈希应与各段在同一次读取中计算: {bytes_read}"
+    finder = FileDuplicateFinder(db_path=db_file)
+    sha256 = finder.cursor.execute("SELECT hash_sha256 FROM file_features").fetchone()[0]
+    finder.close()
+    assert sha256 == "sha256:" + hashlib.sha256(data).hexdigest(), "附加哈希不正确"
+    stored, bytes_read = scan()
+    assert bytes_read == 0, f"不带附加哈希再次扫描不应重新读取文件: {bytes_read}"
+    print("✓ 附加哈希与树哈希在同一次读取中计算，切换设置不重新读取文件。")
+
+    # 测试4: 不带附加哈希重新计算，主哈希值不变时保留附加哈希，变化时清除
+    def stored_sha256():
+        finder = FileDuplicateFinder(db_path=db_file)
+        value = finder.cursor.execute("SELECT hash_sha256 FROM file_features").fetchone()[0]
+        finder.close()
+        return value
+
+    st = os.stat(file_path)
+    os.utime(file_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    stored, bytes_read = scan()
+    assert bytes_read > 0 and stored == tree_root(data), "修改时间变化后应重新计算哈希值"
+    assert stored_sha256() == sha256, "内容不变时不应清除已有的附加哈希"
+    time.sleep(0.01)
+    data[0] ^= 0xFF
+    with open(file_path, "r+b") as f:
+        f.write(data[:1])
+    stored, _ = scan()
+    assert stored == tree_root(data) and stored_sha256() is None, "内容变化后应清除过期的附加哈希"
+    print("✓ 内容不变时保留附加哈希，内容变化时清除。")
+
+    print("\n所有部分重算测试通过！")
+
+finally:
+    # 清理测试文件和数据库
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    print("\n已清理测试文件和数据库。")
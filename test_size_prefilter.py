@@ -0,0 +1,71 @@
+import os
+import shutil
+
+"""
+测试大小预过滤的脚本
+该脚本验证大小唯一的文件以"未计算哈希"状态入库，出现同样大小的文件后再补算哈希值
+"""
+
+from filedup.file_duplicate_finder import FileDuplicateFinder
+from filedup.hash_engines import new_hasher
+
+# 创建临时测试目录
+test_dir = os.path.abspath("test_prefilter_dir")
+db_file = os.path.abspath("test_prefilter.db")
+if os.path.exists(test_dir):
+    shutil.rmtree(test_dir)
+if os.path.exists(db_file):
+    os.remove(db_file)
+os.makedirs(test_dir)
+
+
+def stored_hashes(finder):
+    """数据库中的文件名 -> 哈希值（未计算时为None）"""
+    finder.cursor.execute("SELECT file_path, alg_id, file_hash FROM file_features")
+    return {os.path.basename(row[0]): finder.codec.decode_hash(row[1], row[2]) for row in finder.cursor.fetchall()}
+
+
+try:
+    with open(os.path.join(test_dir, "unique.txt"), "w", encoding="utf-8") as f:
+        f.write("大小唯一的文件")
+    with open(os.path.join(test_dir, "same1.txt"), "w", encoding="utf-8") as f:
+        f.write("0123456789")
+    with open(os.path.join(test_dir, "same2.txt"), "w", encoding="utf-8") as f:
+        f.write("abcdefghij")
+
+    # 测试1: 大小唯一的文件不计算哈希，同样大小的文件计算哈希
+    finder = FileDuplicateFinder(db_path=db_file, size_prefilter=True)
+    finder.scan_directory(test_dir)
+    hashes = stored_hashes(finder)
+    finder.close()
+    assert hashes["unique.txt"] is None, "大小唯一的文件不应计算哈希"
+    assert hashes["same1.txt"] and hashes["same2.txt"], "同样大小的文件应计算哈希"
+    print("✓ 大小唯一的文件以未计算哈希状态入库。")
+
+    # 测试2: 出现同样大小的新文件后，补算之前跳过的文件的哈希值
+    with open(os.path.join(test_dir, "unique.txt"), "rb") as f:
+        content = f.read()
+    with open(os.path.join(test_dir, "unique_copy.txt"), "wb") as f:
+        f.write(content)
+    finder = FileDuplicateFinder(db_path=db_file, size_prefilter=True)
+    finder.scan_directory(test_dir)
+    hashes = stored_hashes(finder)
+    groups = finder.find_duplicate_files()
+    finder.close()
+    hasher = new_hasher(finder.hash_algorithm)
+    hasher.update(content)
+    expected = f"{finder.hash_algorithm}:{hasher.hexdigest()}"
+    assert hashes["unique.txt"] == expected, f"没有补算之前跳过的哈希值: {hashes['unique.txt']}"
+    assert hashes["unique_copy.txt"] == expected, "新文件的哈希值不正确"
+    assert [len(group['files']) for group in groups] == [2], f"重复文件组不正确: {groups}"
+    print("✓ 出现同样大小的文件后补算了哈希值并找到重复文件。")
+
+    print("\n所有大小预过滤测试通过！")
+
+finally:
+    # 清理测试文件和数据库
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    print("\n已清理测试文件和数据库。")
@@ -0,0 +1,68 @@
+import os
+import shutil
+
+"""
+测试分阶段哈希确认的脚本
+该脚本创建同样大小、在不同位置有差异的文件，验证每个阶段排除的文件不再进入下一阶段
+"""
+
+from filedup.file_duplicate_finder import FileDuplicateFinder
+from filedup.staged_hash import SAMPLE_BLOCK_SIZE, STAGE2_SAMPLES, stage_offsets
+
+# 创建临时测试目录
+test_dir = os.path.abspath("test_staged_dir")
+db_file = os.path.abspath("test_staged.db")
+if os.path.exists(test_dir):
+    shutil.rmtree(test_dir)
+if os.path.exists(db_file):
+    os.remove(db_file)
+os.makedirs(test_dir)
+
+
+def write_variant(name, data, position=None):
+    """写入data的副本，position不为None时修改该位置的一个字节"""
+    data = bytearray(data)
+    if position is not None:
+        data[position] ^= 0xFF
+    with open(os.path.join(test_dir, name), "wb") as f:
+        f.write(data)
+
+
+try:
+    # 文件足够大，首尾采样和内部采样都不会退化为读取整个文件
+    file_size = (STAGE2_SAMPLES + 4) * SAMPLE_BLOCK_SIZE
+    data = os.urandom(file_size)
+    interior = stage_offsets(file_size, 2)[0]
+    write_variant("base.dat", data)
+    write_variant("copy.dat", data)
+    write_variant("head_diff.dat", data, 0)                        # 首尾采样即可排除
+    write_variant("interior_diff.dat", data, interior)             # 内部采样才能排除
+    write_variant("unsampled_diff.dat", data, interior + SAMPLE_BLOCK_SIZE)  # 只有完整哈希能区分
+
+    finder = FileDuplicateFinder(db_path=db_file, staged_hash=True)
+    finder.scan_directory(test_dir)
+    finder.cursor.execute("SELECT file_path, stage1_hash, stage2_hash, file_hash FROM file_features")
+    rows = {os.path.basename(row[0]): row[1:] for row in finder.cursor.fetchall()}
+    groups = finder.find_duplicate_files()
+    finder.close()
+
+    stage1, stage2, full = rows["head_diff.dat"]
+    assert stage1 and stage2 is None and full is None, f"首尾不同的文件应在第一阶段排除: {rows['head_diff.dat']}"
+    stage1, stage2, full = rows["interior_diff.dat"]
+    assert stage1 and stage2 and full is None, f"内部不同的文件应在第二阶段排除: {rows['interior_diff.dat']}"
+    assert all(rows[name][2] for name in ("base.dat", "copy.dat", "unsampled_diff.dat")), "采样相同的文件应计算完整哈希"
+    print("✓ 各阶段排除的文件不再计算后续阶段的摘要。")
+
+    assert len(groups) == 1, f"应只有一组重复文件: {groups}"
+    assert sorted(os.path.basename(file_info['path']) for file_info in groups[0]['files']) == ["base.dat", "copy.dat"]
+    print("✓ 只有内容完全相同的文件被识别为重复文件。")
+
+    print("\n所有分阶段哈希测试通过！")
+
+finally:
+    # 清理测试文件和数据库
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    print("\n已清理测试文件和数据库。")
@@ -0,0 +1,68 @@
+import os
+import shutil
+import time
+
+"""
+测试重复文件组校验结果有效性的脚本
+该脚本验证逐字节校验结果在组成员的修改时间变化后失效，
+并且只统计部分目录（path_prefix）时仍能读到整个组的校验结果
+"""
+
+from filedup.file_duplicate_finder import FileDuplicateFinder
+
+# 创建临时测试目录
+test_dir = os.path.abspath("test_verify_dir")
+db_file = os.path.abspath("test_verify.db")
+if os.path.exists(test_dir):
+    shutil.rmtree(test_dir)
+if os.path.exists(db_file):
+    os.remove(db_file)
+os.makedirs(os.path.join(test_dir, "x"))
+os.makedirs(os.path.join(test_dir, "y"))
+content = os.urandom(50000)
+for name in ("x/a.bin", "x/c.bin", "y/b.bin"):
+    with open(os.path.join(test_dir, name), "wb") as f:
+        f.write(content)
+
+
+def verified_flags(**query):
+    """当前数据库中各组的校验状态"""
+    finder = FileDuplicateFinder(db_path=db_file)
+    flags = [group['verified'] for group in finder.find_duplicate_files(**query)]
+    finder.close()
+    return flags
+
+
+try:
+    finder = FileDuplicateFinder(db_path=db_file)
+    finder.scan_directory(test_dir)
+    assert finder.verify_duplicates() == 0, "内容相同的文件组不应校验失败"
+    finder.close()
+    assert verified_flags() == [True], "校验后整个组应标记为已校验"
+
+    # 测试1: 只统计部分目录时，组内成员少于校验时的成员，仍返回整个组的校验结果
+    assert verified_flags(path_prefix=os.path.join(test_dir, "x")) == [True], "path_prefix下应读到整个组的校验结果"
+    print("✓ 只统计部分目录时仍能读到整个组的校验结果。")
+
+    # 测试2: 成员被重新写入后（哈希值和路径不变），校验结果失效
+    time.sleep(0.01)
+    with open(os.path.join(test_dir, "y/b.bin"), "wb") as f:
+        f.write(content)
+    st = os.stat(os.path.join(test_dir, "y/b.bin"))
+    os.utime(os.path.join(test_dir, "y/b.bin"), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    finder = FileDuplicateFinder(db_path=db_file)
+    finder.scan_directory(test_dir)
+    finder.close()
+    assert verified_flags() == [None], "成员的修改时间变化后校验结果应失效"
+    assert verified_flags(path_prefix=os.path.join(test_dir, "x")) == [None], "目录外成员变化后校验结果也应失效"
+    print("✓ 成员的修改时间变化后校验结果失效。")
+
+    print("\n所有校验结果测试通过！")
+
+finally:
+    # 清理测试文件和数据库
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    print("\n已清理测试文件和数据库。")